@@ -0,0 +1,111 @@
+"""Body encodings for API responses: JSON, MessagePack and content codings.
+
+Pure functions over bytes and iterators; :mod:`app.api.http` applies them
+to Flask responses.
+"""
+import gzip
+import zlib
+
+import orjson
+
+try:
+    import msgpack
+except ImportError:  # MessagePack responses are offered only when installed
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # gzip is always available
+    brotli = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+# orjson drops the key sorting Flask did by default; key order is the dict's
+JSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+# Collection items encoded per chunk of a streamed JSON body
+STREAM_BATCH = 32
+
+# Content codings we can produce, in order of preference on a tie
+CONTENT_CODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# Worth compressing; images and audio are already compressed
+COMPRESSIBLE_TYPES = frozenset({
+    JSON_MIMETYPE, MSGPACK_MIMETYPE, 'application/x-ndjson', 'text/plain', 'text/html',
+    'text/css', 'application/javascript', 'image/svg+xml',
+})
+
+
+def dumps(obj, default=None):
+    """Encode ``obj`` as compact UTF-8 JSON bytes."""
+    return orjson.dumps(obj, default=default, option=JSON_OPTIONS)
+
+
+def packb(obj, default=None):
+    """Encode ``obj`` as MessagePack; raises ``RuntimeError`` without the package."""
+    if msgpack is None:
+        raise RuntimeError('msgpack is not installed')
+    return msgpack.packb(obj, default=default, use_bin_type=True)
+
+
+def prefers_msgpack(accept):
+    """True when the ``Accept`` header ranks MessagePack above JSON.
+
+    ``*/*`` alone gets JSON; MessagePack is for clients that ask for it.
+    """
+    return (msgpack is not None
+            and accept.quality(MSGPACK_MIMETYPE) > accept.quality(JSON_MIMETYPE))
+
+
+def iter_json(payload, key, default=None, batch=STREAM_BATCH):
+    """Encode the dict ``payload`` as JSON chunks, ``batch`` items of ``payload[key]`` at a time.
+
+    The other members come first, then the collection, so the whole body is
+    never held in memory at once. Joining the chunks gives the same JSON as
+    :func:`dumps` up to member order.
+    """
+    rest = {name: value for name, value in payload.items() if name != key}
+    head = dumps(rest, default)[:-1]
+    yield head + (b',' if rest else b'') + dumps(key) + b':['
+    chunk = []
+    separator = b''
+    for item in payload[key]:
+        chunk.append(dumps(item, default))
+        if len(chunk) == batch:
+            yield separator + b','.join(chunk)
+            chunk, separator = [], b','
+    if chunk:
+        yield separator + b','.join(chunk)
+    yield b']}'
+
+
+def is_compressible(mimetype):
+    return mimetype in COMPRESSIBLE_TYPES
+
+
+def compress(data, coding, level):
+    """Compress ``data`` in one go; ``level`` is gzip's 1-9 or brotli's 0-11 quality."""
+    if coding == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if coding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=level)
+    raise ValueError(f"Unsupported content coding: {coding}")
+
+
+def iter_compress(chunks, coding, level):
+    """Compress a stream of byte chunks, flushing after each so readers see progress."""
+    if coding == 'gzip':
+        encoder = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = encoder.compress, encoder.flush
+        flush = lambda: encoder.flush(zlib.Z_SYNC_FLUSH)
+    elif coding == 'br' and brotli is not None:
+        encoder = brotli.Compressor(quality=level)
+        process, flush, finish = encoder.process, encoder.flush, encoder.finish
+    else:
+        raise ValueError(f"Unsupported content coding: {coding}")
+    for chunk in chunks:
+        data = process(chunk) + flush()
+        if data:
+            yield data
+    yield finish()
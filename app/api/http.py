@@ -0,0 +1,170 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+import orjson
+from flask import Response, current_app, has_request_context, jsonify, request, send_file
+from flask.json.provider import DefaultJSONProvider
+
+from app.api.encoding import (
+    CONTENT_CODINGS, JSON_MIMETYPE, MSGPACK_MIMETYPE, STREAM_BATCH, compress, dumps,
+    is_compressible, iter_compress, iter_json, msgpack, packb, prefers_msgpack
+)
+from app.services.metrics import metrics
+
+# Content-addressed media never changes, so caches may keep it for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Extensions accepted on /media/<digest>.<ext>
+MEDIA_TYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+    'mp3': 'audio/mpeg',
+}
+
+
+def send_blob(path, mimetype, digest, immutable=False):
+    """Send a stored blob with its content hash as a strong ETag.
+
+    Handles ``If-None-Match`` (304) and ``Range`` (206) requests. Immutable
+    responses may be cached forever; the rest must be revalidated, which the
+    ETag makes cheap.
+    """
+    response = send_file(path, mimetype=mimetype, etag=digest, conditional=True,
+                         as_attachment=False)
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def conditional_json(payload):
+    """JSON response with a strong ETag over its body; 304 when the client has it."""
+    response = jsonify(payload)
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def listing_etag(version):
+    """Weak ETag for the listing page the current request asks for.
+
+    The query arguments (cursor, limit, fields, query) are hashed in, so
+    every page revalidates on its own; all pages change with ``version``.
+    """
+    args = urlencode(sorted(request.args.items(multi=True)))
+    return f"{version}-{hashlib.sha1(args.encode()).hexdigest()[:16]}"
+
+
+def not_modified(etag):
+    """A 304 response if ``If-None-Match`` covers the weak ``etag``, else ``None``.
+
+    Lets listings answer revalidations before running any query.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        response.cache_control.no_cache = True
+        return response
+    return None
+
+
+def with_weak_etag(response, etag):
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True
+    return response
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """``jsonify`` backed by orjson, answering MessagePack to clients that prefer it."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        wants_msgpack = has_request_context() and prefers_msgpack(request.accept_mimetypes)
+        with metrics.time('serialize'):
+            if wants_msgpack:
+                body, mimetype = packb(obj, self.default), MSGPACK_MIMETYPE
+            else:
+                body, mimetype = dumps(obj, self.default), JSON_MIMETYPE
+        response = self._app.response_class(body, mimetype=mimetype)
+        if msgpack is not None:
+            response.vary.add('Accept')
+        return response
+
+
+def stream_json(payload, key):
+    """``jsonify(payload)``, streaming the collection under ``key`` when it is large.
+
+    The body is encoded chunk by chunk as it is sent rather than built up
+    front. Short collections, and MessagePack clients, get an ordinary
+    response.
+    """
+    if len(payload[key]) <= STREAM_BATCH or prefers_msgpack(request.accept_mimetypes):
+        return jsonify(payload)
+    default = current_app.json.default
+
+    def generate():
+        # Time only the encoding, not the wait for the client to read
+        spent = 0.0
+        chunks = iter_json(payload, key, default)
+        while True:
+            started = time.perf_counter()
+            chunk = next(chunks, None)
+            spent += time.perf_counter() - started
+            if chunk is None:
+                break
+            yield chunk
+        metrics.observe('serialize', spent)
+
+    response = current_app.response_class(generate(), mimetype=JSON_MIMETYPE)
+    if msgpack is not None:
+        response.vary.add('Accept')
+    return response
+
+
+def compress_response(response, min_size, levels):
+    """Apply the best content coding the client accepts to a compressible response.
+
+    Bodies under ``min_size`` bytes, partial and file responses, and media
+    that is already compressed are left alone; streamed bodies are
+    compressed as they go. A strong ETag is made weak, since the bytes
+    differ from the uncompressed representation but the content does not.
+    """
+    if (min_size is None
+            or not is_compressible(response.mimetype)
+            or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    coding = request.accept_encodings.best_match(CONTENT_CODINGS)
+    if coding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = iter_compress(response.iter_encoded(), coding, levels[coding])
+    else:
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+        with metrics.time('compress', size=len(body)):
+            response.set_data(compress(body, coding, levels[coding]))
+    response.headers['Content-Encoding'] = coding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,94 @@
+import base64
+import binascii
+import json
+
+SNIPPET_LENGTH = 160
+
+# Fields returned when the client does not ask for a projection.
+SUMMARY_FIELDS = ('id', 'title', 'caption_snippet', 'timestamp', 'image_path', 'audio_path')
+
+# Everything a client may request with ``fields=``.
+PROJECTABLE_FIELDS = frozenset(SUMMARY_FIELDS) | {
+    'caption', 'image_url', 'image_mimetype', 'audio_mimetype', 'status',
+}
+
+
+def caption_snippet(caption, length=SNIPPET_LENGTH):
+    """Shorten a caption to ``length`` characters on a word boundary."""
+    caption = caption or ''
+    if len(caption) <= length:
+        return caption
+    cut = caption[:length].rsplit(' ', 1)[0]
+    return f"{cut}…"
+
+
+def parse_fields(raw):
+    """Parse a ``fields=a,b,c`` argument; ``None`` means the summary shape."""
+    if not raw:
+        return SUMMARY_FIELDS
+    fields = tuple(f.strip() for f in raw.split(',') if f.strip())
+    unknown = [f for f in fields if f not in PROJECTABLE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def project(photo_id, photo, fields=SUMMARY_FIELDS):
+    """Build the listing representation of a photo record."""
+    item = {}
+    for field in fields:
+        if field == 'id':
+            item['id'] = photo_id
+        elif field == 'caption_snippet':
+            item['caption_snippet'] = caption_snippet(photo.get('caption'))
+        else:
+            item[field] = photo.get(field)
+    return item
+
+
+def parse_limit(raw, default, maximum):
+    """Clamp a ``limit`` query argument to ``[1, maximum]``."""
+    if raw in (None, ''):
+        return default
+    limit = int(raw)
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, maximum)
+
+
+def encode_cursor(photo_id, photo):
+    """Opaque cursor pointing just after ``photo`` in listing order."""
+    return encode_key((photo.get('timestamp', ''), photo_id))
+
+
+def encode_key(key):
+    """Opaque cursor for a ``(sort value, tie-breaker)`` pair, e.g. a search hit's key."""
+    key = json.dumps(list(key), separators=(',', ':'))
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of :func:`encode_cursor` and :func:`encode_key`; ``None`` for the first page."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, tie_breaker = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+    return value, tie_breaker
+
+
+def encode_version(version):
+    """Opaque change feed cursor for an album version."""
+    return encode_key((version, 'v'))
+
+
+def decode_version(cursor):
+    """Inverse of :func:`encode_version`; ``0`` (the start of the album) when empty."""
+    if not cursor:
+        return 0
+    version, tag = decode_cursor(cursor)
+    if tag != 'v' or not isinstance(version, int) or version < 0:
+        raise ValueError('Invalid cursor')
+    return version
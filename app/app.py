@@ -1,8 +1,10 @@
 import streamlit as st
 import requests
-import json
 import base64
+import json
+import time
 import speech_recognition as sr
+from requests.adapters import HTTPAdapter
 from bokeh.models.widgets import Button
 from bokeh.models import CustomJS
 from streamlit_bokeh_events import streamlit_bokeh_events
@@ -10,6 +12,22 @@ from streamlit_bokeh_events import streamlit_bokeh_events
 # Set the Flask API URL
 FLASK_API_URL = "http://127.0.0.1:5000"
 
+# Listing pages are fetched in small slices with only the fields the grid shows
+PAGE_SIZE = 12
+PAGE_FIELDS = "id,title,caption_snippet,timestamp,image_path"
+GRID_COLUMNS = 3
+# Album syncs fetch changes in larger batches, since they are not rendered at once
+SYNC_BATCH = 100
+# The grid shows small thumbnails; the full preview, caption and audio are
+# fetched only once a photo is opened
+THUMBNAIL_WIDTH = 320
+PREVIEW_WIDTH = 960
+# Seconds a fetched page or photo is reused across reruns before it is fetched again
+PAGE_TTL = 30
+PHOTO_TTL = 300
+# Keep-alive connections to the API shared by every session of this app
+HTTP_POOL_SIZE = 16
+
 # Streamlit app title
 st.title("Patronum \nBringing memories to life")
 
@@ -33,16 +51,148 @@ def listen_for_speech():
             st.error(f"Could not request results; {e}")
             return None
 
-def display_photo_details(photo_info):
-    """Helper function to display photo details consistently"""
+@st.cache_resource
+def http_session():
+    """One pooled HTTP session for every rerun, so connections to the API are reused."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def get_json(path, **params):
+    response = http_session().get(f"{FLASK_API_URL}{path}", params=params)
+    response.raise_for_status()
+    return response.json()
+
+@st.cache_data(ttl=PAGE_TTL, show_spinner=False)
+def fetch_first_page():
+    """First page of the album listing, shown while the album syncs; reruns within PAGE_TTL reuse it."""
+    return get_json("/photos", limit=PAGE_SIZE, fields=PAGE_FIELDS)
+
+@st.cache_data(ttl=PAGE_TTL, show_spinner=False)
+def fetch_search_page(query, mode, cursor):
+    return get_json("/search", query=query, mode=mode, limit=PAGE_SIZE,
+                    cursor=cursor, fields=PAGE_FIELDS)
+
+@st.cache_data(ttl=PHOTO_TTL, show_spinner=False)
+def fetch_photo(photo_id):
+    return get_json(f"/photos/{photo_id}")
+
+def photo_grid(photos, key):
+    """Thumbnails of a page of photos; "Open" picks the one display_photo_details shows."""
+    columns = st.columns(GRID_COLUMNS)
+    for index, photo_info in enumerate(photos):
+        with columns[index % GRID_COLUMNS]:
+            if photo_info.get('image_path'):
+                st.image(f"{FLASK_API_URL}{photo_info['image_path']}?w={THUMBNAIL_WIDTH}",
+                         use_column_width=True)
+            st.write(f"**{photo_info['title'] or 'Untitled'}**")
+            st.caption(photo_info.get('caption_snippet') or "")
+            if st.button("Open", key=f"{key}_open_{photo_info['id']}"):
+                st.session_state[f"{key}_photo"] = photo_info['id']
+
+    photo_id = st.session_state.get(f"{key}_photo")
+    if photo_id and any(photo_info['id'] == photo_id for photo_info in photos):
+        display_photo_details(photo_id)
+
+def display_photo_details(photo_id, width=PREVIEW_WIDTH):
+    """Show one photo in full: preview, caption and audio, fetched only now"""
+    photo_info = fetch_photo(photo_id)
     st.write("---")
-    if photo_info.get('image'):
-        st.image(base64.b64decode(photo_info['image']), caption=photo_info['title'])
+    if photo_info.get('image_path'):
+        st.image(f"{FLASK_API_URL}{photo_info['image_path']}?w={width}", caption=photo_info['title'])
     st.write(f"**Title:** {photo_info['title']}")
     st.write(f"**Caption:** {photo_info['caption']}")
     st.write(f"**Uploaded on:** {photo_info['timestamp']}")
-    if photo_info.get('audio'):
-        st.audio(base64.b64decode(photo_info['audio']), format="audio/mp3")
+    if photo_info.get('audio_path'):
+        st.audio(f"{FLASK_API_URL}{photo_info['audio_path']}", format="audio/mp3")
+
+def wait_for_job(job_url, interval=1.0, timeout=300):
+    """Poll a background job until it is done, failed or deferred."""
+    deadline = time.time() + timeout
+    while True:
+        job = get_json(job_url)
+        if job['state'] in ('done', 'failed', 'deferred') or time.time() > deadline:
+            return job
+        time.sleep(interval)
+
+def iter_sse(response):
+    """Parse a Server-Sent Events response into (event, data) pairs."""
+    event, data = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith('event:'):
+            event = line[len('event:'):].strip()
+        elif line.startswith('data:'):
+            data.append(line[len('data:'):].strip())
+        elif not line and event:
+            yield event, json.loads('\n'.join(data))
+            event, data = None, []
+
+def narrate_upload(uploaded_file, title):
+    """Stream caption text and play each sentence's audio as soon as it arrives."""
+    st.subheader("Generated Caption:")
+    caption_box = st.empty()
+    audio_box = st.container()
+    caption = ""
+    started = time.perf_counter()
+    first_audio = None
+
+    try:
+        with http_session().post(f"{FLASK_API_URL}/upload/stream",
+                                 files={'photo': (uploaded_file.name, uploaded_file.getvalue())},
+                                 data={'title': title}, stream=True) as response:
+            for event, data in iter_sse(response):
+                if event == 'caption':
+                    caption += data['text']
+                    caption_box.write(caption)
+                elif event == 'audio':
+                    if first_audio is None:
+                        first_audio = time.perf_counter() - started
+                    with audio_box:
+                        st.audio(base64.b64decode(data['audio']), format="audio/mp3",
+                                 autoplay=data['index'] == 0)
+                elif event == 'done':
+                    total = time.perf_counter() - started
+                    st.caption(
+                        f"First sentence audible after {first_audio or total:.1f}s, "
+                        f"complete after {total:.1f}s"
+                    )
+                elif event == 'deferred':
+                    st.info("The caption or audio service is busy; "
+                            "this photo will be finished in the background.")
+                elif event == 'error':
+                    st.error(data['error'])
+    except Exception as e:
+        st.error(f"Error: {e}")
+
+def page_controls(cursor_key, next_cursor):
+    """Render first/next page buttons that move the cursor stored under cursor_key."""
+    first_col, next_col = st.columns([1, 1])
+    with first_col:
+        if st.session_state.get(cursor_key) and st.button("First page", key=f"{cursor_key}_first"):
+            st.session_state[cursor_key] = None
+            st.rerun()
+    with next_col:
+        if next_cursor and st.button("Next page", key=f"{cursor_key}_next"):
+            st.session_state[cursor_key] = next_cursor
+            st.rerun()
+
+def sync_album():
+    """Merge photos added or updated since the last sync into the local album.
+
+    Returns how many photos changed.
+    """
+    changed = 0
+    while True:
+        changes = get_json("/photos/changes", since=st.session_state.album_cursor,
+                           limit=SYNC_BATCH, fields=PAGE_FIELDS)
+        for photo_info in changes['photos']:
+            st.session_state.album[photo_info['id']] = photo_info
+        changed += len(changes['photos'])
+        st.session_state.album_cursor = changes['cursor']
+        if not changes['has_more']:
+            return changed
 
 # Create tabs for different functionalities
 tab1, tab2, tab3 = st.tabs(["Upload", "Search", "View All"])
@@ -84,10 +234,13 @@ with tab1:
 
     if uploaded_file:
         st.image(uploaded_file, caption="Uploaded Image", use_column_width=True)
-        
+
+        if st.button("Narrate as it is written"):
+            narrate_upload(uploaded_file, st.session_state.text_input)
+
         if st.button("Generate Caption and Audio"):
             files = {
-                'photo': uploaded_file.getvalue()
+                'photo': (uploaded_file.name, uploaded_file.getvalue())
             }
             data = {
                 'title': st.session_state.text_input
@@ -95,26 +248,74 @@ with tab1:
 
             with st.spinner('Processing...'):
                 try:
-                    response = requests.post(f"{FLASK_API_URL}/upload", files=files, data=data)
+                    response = http_session().post(f"{FLASK_API_URL}/upload", files=files, data=data)
                     response_data = response.json()
 
-                    if response.status_code == 200 and response_data.get('status') == 'success':
-                        st.success("Caption and audio generated successfully!")
-                        caption = response_data['details']['caption']
-                        st.subheader("Generated Caption:")
-                        st.write(caption)
-                        
-                        if response_data['details']['audio']:
-                            st.subheader("Audio Description:")
-                            audio_bytes = base64.b64decode(response_data['details']['audio'])
-                            st.audio(audio_bytes, format="audio/mp3")
+                    if response.status_code == 202 and response_data.get('status') == 'accepted':
+                        job = wait_for_job(response_data['job_url'])
+                        details = get_json(f"/photos/{response_data['photo_id']}")
+
+                        if job['state'] == 'done':
+                            st.success("Caption and audio generated successfully!")
+                            st.subheader("Generated Caption:")
+                            st.write(details['caption'])
+
+                            if details['audio_path']:
+                                st.subheader("Audio Description:")
+                                st.audio(f"{FLASK_API_URL}{details['audio_path']}", format="audio/mp3")
+                            else:
+                                st.error("Failed to generate audio.")
+                        elif job['state'] == 'deferred':
+                            st.info("The caption or audio service is busy; "
+                                    "this photo will be finished in the background.")
+                            if details.get('caption'):
+                                st.subheader("Generated Caption:")
+                                st.write(details['caption'])
                         else:
-                            st.error("Failed to generate audio.")
+                            st.error(f"Failed to process photo: {job.get('error')}")
+                    elif response.status_code == 503:
+                        st.warning("The server is busy, please try again in a moment.")
+                    elif response.status_code in (413, 415):
+                        st.error(response_data.get('error', "This photo cannot be uploaded."))
                     else:
                         st.error("Failed to process photo.")
                 except Exception as e:
                     st.error(f"Error: {e}")
 
+    st.markdown("### Upload a whole folder")
+    batch_files = st.file_uploader(
+        "Upload many photos", type=["jpg", "jpeg", "png"], accept_multiple_files=True
+    )
+
+    if batch_files and st.button("Generate Captions and Audio for All"):
+        files = [('photos', (f.name, f.getvalue())) for f in batch_files]
+        data = {'title': st.session_state.text_input}
+        progress = st.progress(0.0)
+        finished = 0
+
+        try:
+            # One NDJSON line per photo arrives as soon as that photo is done
+            with http_session().post(f"{FLASK_API_URL}/upload/batch", files=files, data=data,
+                                     stream=True) as response:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    result = json.loads(line)
+                    if 'summary' in result:
+                        summary = result['summary']
+                        st.success(
+                            f"{summary['ready']} photos ready, {summary['deferred']} deferred, "
+                            f"{summary['failed']} failed, "
+                            f"{summary['rejected']} rejected in {summary['seconds']}s"
+                        )
+                        continue
+                    finished += 1
+                    progress.progress(min(finished / len(batch_files), 1.0))
+                    if result['status'] != 'ready':
+                        st.warning(f"{result.get('photo_id') or result.get('filename')}: {result['error']}")
+        except Exception as e:
+            st.error(f"Error: {e}")
+
 with tab2:
     st.header("Search Photos")
     
@@ -144,43 +345,86 @@ with tab2:
         if st.button("Search", type="primary"):
             st.session_state.search_query = search_input
 
+    # Spoken descriptions rarely repeat the caption's exact words
+    search_mode = "semantic" if st.toggle("Search by meaning", value=True) else "keyword"
+
     # Perform search if there's a query
     if st.session_state.search_query:
+        page_key = (st.session_state.search_query, search_mode)
+        if st.session_state.get('search_page_query') != page_key:
+            st.session_state.search_page_query = page_key
+            st.session_state.search_cursor = None
+
         with st.spinner('Searching...'):
             try:
-                response = requests.get(
-                    f"{FLASK_API_URL}/search",
-                    params={'query': st.session_state.search_query}
+                search_results = fetch_search_page(
+                    st.session_state.search_query, search_mode, st.session_state.search_cursor
                 )
-                search_results = response.json()
-
-                if response.status_code == 200:
-                    if search_results.get('photos'):
-                        st.write(f"Found {len(search_results['photos'])} matching photos:")
-                        for photo_id, photo_info in search_results['photos'].items():
-                            display_photo_details(photo_info)
-                    else:
-                        st.info("No photos found matching your search.")
+                if search_results.get('photos'):
+                    st.write(f"Found {search_results['total_results']} matching photos:")
+                    photo_grid(search_results['photos'], 'search')
+                    page_controls('search_cursor', search_results.get('next_cursor'))
                 else:
-                    st.error("Failed to perform search.")
+                    st.info("No photos found matching your search.")
+            except requests.HTTPError:
+                st.error("Failed to perform search.")
             except Exception as e:
                 st.error(f"Error during search: {e}")
 
 with tab3:
     st.header("All Photos")
+    if 'album' not in st.session_state:
+        # Local copy of the album, kept current by fetching only what changed
+        st.session_state.album = {}
+        st.session_state.album_cursor = None
+        st.session_state.album_synced = False
+        st.session_state.album_page = 0
+        st.session_state.show_photos = False
+
     if st.button("Refresh Photos"):
-        with st.spinner('Loading photos...'):
-            try:
-                response = requests.get(f"{FLASK_API_URL}/photos")
-                photos_data = response.json()
+        st.session_state.show_photos = True
+        if st.session_state.album_synced:
+            with st.spinner('Loading changes...'):
+                try:
+                    if sync_album():
+                        fetch_photo.clear()
+                except Exception as e:
+                    st.error(f"Error: {e}")
+        else:
+            fetch_first_page.clear()
 
-                if response.status_code == 200:
-                    total_photos = photos_data.get('total_photos', 0)
-                    st.write(f"Total Photos: {total_photos}")
+    if st.session_state.show_photos and not st.session_state.album_synced:
+        # First load: paint the cached first page, then sync the whole album
+        # once; later refreshes only fetch what changed
+        try:
+            with st.spinner('Loading photos...'):
+                page = fetch_first_page()
+            st.write(f"Total Photos: {page['total_photos']}")
+            photo_grid(page['photos'], 'album')
+            with st.spinner('Syncing album...'):
+                sync_album()
+            st.session_state.album_synced = True
+        except Exception as e:
+            st.error(f"Error: {e}")
+        if st.session_state.album_synced and len(st.session_state.album) > PAGE_SIZE:
+            if st.button("Next page", key="album_next"):
+                st.session_state.album_page = 1
+                st.rerun()
 
-                    for photo_id, photo_info in photos_data['photos'].items():
-                        display_photo_details(photo_info)
-                else:
-                    st.error("Failed to load photos.")
-            except Exception as e:
-                st.error(f"Error: {e}")
\ No newline at end of file
+    elif st.session_state.show_photos:
+        # Listing order, which is also the order of /photos pages
+        photos = sorted(st.session_state.album.values(),
+                        key=lambda photo: (photo['timestamp'], photo['id']))
+        st.write(f"Total Photos: {len(photos)}")
+
+        start = st.session_state.album_page * PAGE_SIZE
+        photo_grid(photos[start:start + PAGE_SIZE], 'album')
+        first_col, next_col = st.columns([1, 1])
+        with first_col:
+            if start and st.button("First page", key="album_first"):
+                st.session_state.album_page = 0
+                st.rerun()
+        with next_col:
+            if start + PAGE_SIZE < len(photos) and st.button("Next page", key="album_next"):
+                st.session_state.album_page += 1
+                st.rerun()
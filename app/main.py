@@ -1,266 +1,1128 @@
-from flask import Flask, request, jsonify
-from langchain_openai import ChatOpenAI
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from langchain_core.messages import HumanMessage, SystemMessage
-from google.cloud import texttospeech
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, stream_with_context
 from PIL import Image
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.local import LocalProxy
+from werkzeug.wsgi import get_input_stream
+import base64
+import click
 import io
+import json
 import os
-import base64
+import re
 import logging
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from dotenv import load_dotenv
-import boto3
+from functools import partial
 import time
-import autogen
-from autogen import Agent, AssistantAgent, ConversableAgent, UserProxyAgent
-from autogen.agentchat.contrib.capabilities.vision_capability import VisionCapability
-from autogen.agentchat.contrib.img_utils import get_pil_image, pil_to_data_uri
-from autogen.agentchat.contrib.multimodal_conversable_agent import MultimodalConversableAgent
-from autogen.code_utils import content_str
-
-# Configuration for GPT-4 Vision
-config_list_4v = [
-    {
-        "model": "gpt-4o",
-        "api_key": os.environ.get("OPENAI_API_KEY"),
-    }
-]
-
-# Initialize agents
-image_agent = MultimodalConversableAgent(
-    name="image-summarizer",
-    system_message="""
-    You are a helpful assistant that recounts personal photographs for visually impaired persons. Talk in first person, as someone who is a part of the photo.
-    You take care of it being a human and emotional summary. Give names to people, describe the situation by making up some back story
-    for the picture and use that, it should be like a story rather than a description.""",
-    max_consecutive_auto_reply=10,
-    llm_config={"config_list": config_list_4v, "temperature": 0.95, "max_tokens": 300},
+from app.api.http import (
+    MEDIA_TYPES, FastJSONProvider, compress_response, conditional_json, listing_etag, not_modified,
+    send_blob, stream_json, with_weak_etag
 )
-
-user_proxy = autogen.UserProxyAgent(
-    name="User_proxy",
-    system_message="Please summarize the image for me, and explain it in detail.",
-    human_input_mode="NEVER",
-    max_consecutive_auto_reply=0,
-    code_execution_config={"use_docker": False},
+from app.api.serializers import (
+    decode_cursor, decode_version, encode_cursor, encode_key, encode_version, parse_fields,
+    parse_limit, project
 )
-
-# Load environment variables
-load_dotenv()
-
-# Initialize Flask app
-app = Flask(__name__)
+from app.models.blobs import BlobStore
+from app.models.store import MemoryPhotoStore, create_store
+from app.services.archive import ARCHIVE_TYPES, AlbumArchive
+from app.services.backfill import Backfill, Checkpoint
+from app.services.batch import BatchProcessor, iter_archive
+from app.services.cache import ResultCache
+from app.services.changes import ChangeFeed
+from app.services.derivatives import Derivatives
+from app.services.captions import GuardedCaptionEngine, create_caption_engine, jpeg_data_uri
+from app.services.clients import LazyClient, google_tts_client, s3_client
+from app.services.imaging import dhash, preprocess_image, supported_formats
+from app.services.ingest import IngestBusy, MemoryBudget, UploadPolicy, UploadRejected, decode_bytes
+from app.services.jobs import Deferred, JobQueue, LeaseLost, QueueFull
+from app.services.metrics import metrics, server_timing, start_request_timings
+from app.services.semantic import SemanticIndex
+from app.services.storage import StorageUnavailable, create_storage
+from app.services.streaming import narrate, sse
+from app.services.tts import GoogleSpeechBackend, GuardedSpeechBackend, SpeechSynthesizer
+from app.services.upstream import UpstreamUnavailable, create_upstream
+from app.utils.ids import new_ulid
+from app.utils.validators import validate_google_credentials
+from config.config import BaseConfig
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Google Cloud Text-to-Speech client
-tts_client = texttospeech.TextToSpeechClient()
-
-# S3 configuration
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=os.getenv('AWS_ID'),
-    aws_secret_access_key=os.getenv('AWS_KEY'),
-    region_name='ap-south-1'
-)
-BUCKET_NAME = 'accessible-photo-album'
+# Routes live on a blueprint; create_app() builds the services they use
+bp = Blueprint('album', __name__)
 
 class PhotoDatabase:
-    def __init__(self):
-        self.photos_db = {}
-        
-    def add_photo(self, photo_id, photo_data, image_url, title, caption, audio):
-        """Add a photo to the database with all its associated data."""
-        # Convert image data to base64 for storage and display
-        if isinstance(photo_data, bytes):
-            image_base64 = base64.b64encode(photo_data).decode()
+    def __init__(self, store=None, blobs=None, semantic_index=None):
+        self.store = store if store is not None else MemoryPhotoStore()
+        self.blobs = blobs if blobs is not None else BlobStore(BaseConfig.BLOB_STORAGE_PATH)
+        self.semantic_index = semantic_index
+        # Notified after every photo write, for change feed waiters
+        self.changed = threading.Condition()
+
+    @staticmethod
+    def _with_media_urls(photo_id, photo):
+        """Point the record at the endpoints that serve its blobs.
+
+        Audio is linked by content hash, so its URL can be cached for good;
+        the image path goes through size and format negotiation.
+        """
+        if photo:
+            photo['image_path'] = f"/photos/{photo_id}/image"
+            photo['audio_path'] = f"/media/{photo['audio_blob']}.mp3" if photo.get('audio_blob') else None
+        return photo
+
+    def add_photo(self, photo_id, photo_data, image_url, title, caption, audio,
+                  image_mimetype='image/jpeg', status='ready', image_blob=None, **extra):
+        """Add a photo to the database with all its associated data.
+
+        Image and audio bytes go to the blob store; the record only keeps
+        their content hashes. ``image_blob`` is the digest of an image
+        already streamed into the blob store, in place of ``photo_data``.
+        """
+        self._index_caption(photo_id, title or photo_id, caption)
+        audio_blob = None
+        if image_blob is None or audio:
+            with metrics.time('blob_write', size=len(photo_data or b'') + len(audio or b'')):
+                if image_blob is None:
+                    image_blob = self.blobs.put(photo_data)
+                if audio:
+                    audio_blob = self.blobs.put(audio)
+        with metrics.time('db_write'):
+            photo_id = self.store.add_photo(photo_id, {
+                'title': title or photo_id,
+                'image_url': image_url,
+                'image_blob': image_blob,
+                'image_mimetype': image_mimetype,
+                'caption': caption,
+                'audio_blob': audio_blob,
+                'audio_mimetype': 'audio/mpeg' if audio else None,
+                'status': status,
+                'timestamp': datetime.now().isoformat(),
+                **extra
+            })
+        self._notify_changed()
+        return photo_id
+
+    def update_photo(self, photo_id, audio=None, thumbnail=None, variants=None, **fields):
+        """Update fields of an existing photo.
+
+        ``audio``, ``thumbnail`` and ``variants`` (derivative name -> bytes)
+        go to the blob store; variants are merged with those already stored.
+        """
+        # Blobs are written first; the store merges the record in one transaction
+        media = {}
+        if audio or thumbnail or variants:
+            size = len(audio or b'') + len(thumbnail or b'') + sum(map(len, (variants or {}).values()))
+            with metrics.time('blob_write', size=size):
+                if audio:
+                    media['audio_blob'] = self.blobs.put(audio)
+                    media['audio_mimetype'] = 'audio/mpeg'
+                if thumbnail:
+                    media['thumbnail_blob'] = self.blobs.put(thumbnail)
+                variant_blobs = {name: self.blobs.put(data) for name, data in (variants or {}).items()}
         else:
-            image_base64 = photo_data
-
-        self.photos_db[photo_id] = {
-            'title': title or photo_id,
-            'image_url': image_url,
-            'image_data': image_base64,
-            'caption': caption,
-            'audio': audio,
-            'timestamp': datetime.now().isoformat(),
-            'display_url': f"data:image/jpeg;base64,{image_base64}"  # Add direct display URL
-        }
+            variant_blobs = {}
+
+        with metrics.time('db_write'):
+            photo = self.store.update_photo(photo_id, {**media, **fields}, variant_blobs)
+        if photo is None:
+            raise KeyError(photo_id)
+        self._notify_changed()
+        if 'caption' in fields or 'title' in fields:
+            self._index_caption(photo_id, photo.get('title'), photo.get('caption'))
         return photo_id
-        
+
+    def import_photos(self, items):
+        """Store finished ``(photo_id, record)`` pairs in one batch, e.g. from an archive.
+
+        The blobs they point at must be in the blob store already.
+        """
+        with metrics.time('db_write'):
+            self.store.add_photos(items)
+        for photo_id, record in items:
+            self._index_caption(photo_id, record.get('title'), record.get('caption'))
+        self._notify_changed()
+
+    def _notify_changed(self):
+        with self.changed:
+            self.changed.notify_all()
+
+    def _index_caption(self, photo_id, title, caption):
+        """Keep the semantic index current; only captioned photos are indexed."""
+        if self.semantic_index is not None and caption:
+            self.semantic_index.add(photo_id, f"{title}. {caption}")
+
+    def rebuild_semantic_index(self, batch_size=500):
+        """Re-embed every captioned photo in the store; returns how many were indexed."""
+        def captioned():
+            after = None
+            while page := self.store.page_photos(batch_size, after):
+                for photo_id, photo in page:
+                    if photo.get('caption'):
+                        yield photo_id, f"{photo.get('title')}. {photo['caption']}"
+                last_id, last = page[-1]
+                after = (last.get('timestamp', ''), last_id)
+
+        with metrics.time('semantic_rebuild'):
+            return self.semantic_index.rebuild(captioned())
+
+    def add_variants(self, photo_id, variants):
+        """Store rendered derivatives and return the photo's full ``variants`` map."""
+        self.update_photo(photo_id, variants=variants)
+        return self.store.get_photo(photo_id)['variants']
+
     def get_photo(self, photo_id):
         """Retrieve a photo from the database."""
-        photo = self.photos_db.get(photo_id)
-        if photo:
-            # Ensure the photo has a display URL
-            if 'display_url' not in photo and 'image_data' in photo:
-                photo['display_url'] = f"data:image/jpeg;base64,{photo['image_data']}"
-        return photo
-        
+        return self._with_media_urls(photo_id, self.store.get_photo(photo_id))
+
     def list_photos(self):
         """List all photos in the database."""
-        # Ensure all photos have display URLs
-        for photo_id, photo in self.photos_db.items():
-            if 'display_url' not in photo and 'image_data' in photo:
-                photo['display_url'] = f"data:image/jpeg;base64,{photo['image_data']}"
-        return self.photos_db
-        
+        photos = self.store.list_photos()
+        for photo_id, photo in photos.items():
+            self._with_media_urls(photo_id, photo)
+        return photos
+
     def search_photos(self, query):
-        """Search photos by title or caption."""
-        query = query.lower()
-        matching_photos = {}
-        for photo_id, photo_info in self.photos_db.items():
-            if (query in photo_info['title'].lower() or 
-                query in photo_info.get('caption', '').lower()):
-                # Ensure the photo has a display URL
-                if 'display_url' not in photo_info and 'image_data' in photo_info:
-                    photo_info['display_url'] = f"data:image/jpeg;base64,{photo_info['image_data']}"
-                matching_photos[photo_id] = photo_info
+        """Search photos by title or caption, best matches first."""
+        matching_photos = self.store.search_photos(query)
+        for photo_id, photo in matching_photos.items():
+            self._with_media_urls(photo_id, photo)
         return matching_photos
 
+    def count(self, query=None):
+        """Number of photos in the database."""
+        return self.store.count(query)
+
+    def page_photos(self, limit, after=None):
+        """One page of ``(photo_id, photo)`` pairs in listing order."""
+        return [
+            (photo_id, self._with_media_urls(photo_id, photo))
+            for photo_id, photo in self.store.page_photos(limit, after)
+        ]
+
+    def search_page(self, query, limit, after=None):
+        """One page of ranked ``(photo_id, photo, key)`` search hits."""
+        with metrics.time('search'):
+            hits = self.store.search_page(query, limit, after)
+        return [(photo_id, self._with_media_urls(photo_id, photo), key) for photo_id, photo, key in hits]
+
+    def semantic_page(self, query, limit, after=None, min_score=0.0):
+        """``(total, hits)`` for captions most similar to ``query``; hits as in :meth:`search_page`."""
+        with metrics.time('semantic_search'):
+            total, hits = self.semantic_index.search(query, limit, after, min_score)
+        page = []
+        for photo_id, _, key in hits:
+            photo = self.get_photo(photo_id)
+            if photo is not None:
+                page.append((photo_id, photo, key))
+        return total, page
+
+    def changes_since(self, version, limit):
+        """Up to ``limit`` ``(photo_id, photo, version)`` written after ``version``, oldest first."""
+        return [
+            (photo_id, self._with_media_urls(photo_id, photo), photo_version)
+            for photo_id, photo, photo_version in self.store.changes_since(version, limit)
+        ]
+
+    def version(self):
+        """Album version, bumped by every photo write."""
+        return self.store.version()
+
+    def blob_path(self, digest):
+        """Filesystem path of a stored blob."""
+        return self.blobs.path(digest)
+
 class PhotoAlbum:
-    def __init__(self):
-        self.photo_db = PhotoDatabase()
-        
-    def generate_image_caption(self, image, title):
-        """Generate detailed caption for the image using OpenAI's model."""
-        try:
-            # Create a copy of the image for processing
-            image_copy = image.copy()
-            
-            # Resize the image
-            max_size = (800, 800)
-            image_copy.thumbnail(max_size, Image.Resampling.LANCZOS)
+    def __init__(self, store=None, blobs=None, result_cache=None, synthesizer=None,
+                 caption_engine=None, prompt_version=BaseConfig.CAPTION_PROMPT_VERSION,
+                 image_options=None, image_workers=None, upload_workers=4, semantic_index=None,
+                 storage=None, upload_policy=None, decode_budget=None):
+        self.photo_db = PhotoDatabase(store, blobs, semantic_index)
+        # Checked against image headers before an upload is decoded
+        self.upload_policy = upload_policy or UploadPolicy(BaseConfig.ALLOWED_EXTENSIONS)
+        self.decode_budget = decode_budget or MemoryBudget()
+        # Public object store behind image_url; S3 builds its client on first upload
+        self.storage = storage
+        # Set by create_services(); photos an unavailable upstream held up are retried there
+        self.job_queue = None
+        self.result_cache = result_cache
+        self.synthesizer = synthesizer
+        self.caption_engine = caption_engine
+        self.prompt_version = prompt_version
+        # Decoding and resizing are CPU-bound and run in worker processes
+        self.prepare = partial(preprocess_image, **(image_options or {}))
+        self.preprocess_pool = ProcessPoolExecutor(max_workers=image_workers)
+        # Uploads run here, alongside captioning rather than ahead of it
+        self._upload_executor = ThreadPoolExecutor(upload_workers, thread_name_prefix='storage-upload')
 
-            # Compress image
-            buffered = io.BytesIO()
-            image_copy.save(buffered, format="JPEG", quality=70)
-            
-            # Upload to S3
-            file_name = f"photos/{int(time.time())}.jpg"
-            s3_client.upload_fileobj(
-                io.BytesIO(buffered.getvalue()),
-                BUCKET_NAME,
-                file_name,
-                ExtraArgs={'ACL': 'public-read'}
-            )
+    def stored_image(self, photo_id):
+        """Bytes of the original upload of a stored photo."""
+        return self.photo_db.blobs.read(self.photo_db.store.get_photo(photo_id)['image_blob'])
 
-            # Generate S3 URL
-            url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{file_name}"
+    def prepare_image(self, image_data):
+        """Decode an upload once into its storage, model and thumbnail JPEGs."""
+        with metrics.time('preprocess', size=len(image_data)):
+            return self.preprocess_pool.submit(self.prepare, image_data).result()
 
-            # Generate caption using image agent
-            if title:
-                result = user_proxy.initiate_chat(
-                    image_agent,
-                    message=f"""This is the image
-                    <img {url}>. {title}""",
-                )
-            else:
-                result = user_proxy.initiate_chat(
-                    image_agent,
-                    message=f"""This is the image
-                    <img {url}>.""",
-                )
-            
-            return result.summary, url
+    def upload_image(self, jpeg_data):
+        """Upload the storage-sized JPEG and return its public URL.
+
+        The key is the content hash, so simultaneous uploads never share one.
+        Any failure is raised as :class:`StorageUnavailable`.
+        """
+        with metrics.time('storage_upload', size=len(jpeg_data)):
+            try:
+                return self.storage.put_content(jpeg_data, prefix='photos', suffix='.jpg')
+            except Exception as e:
+                logger.error(f"Error uploading image to storage: {str(e)}")
+                raise StorageUnavailable(f"Storage upload failed: {e}") from e
+
+    def caption_image(self, jpeg_data, title):
+        """Caption a model-sized JPEG, sent inline to the caption engine."""
+        return self.caption_engine.caption(jpeg_data_uri(jpeg_data), title)
+
+    def generate_image_caption(self, derivatives, title):
+        """Generate detailed caption for the image using OpenAI's model.
 
+        The storage copy uploads meanwhile; returns ``(caption, upload)``,
+        ``upload`` being the future of its public URL, so the caption can be
+        kept whatever becomes of the upload.
+        """
+        # Upload the storage copy while the model looks at a small inline copy
+        upload = self._upload_executor.submit(self.upload_image, derivatives['storage'])
+        try:
+            return self.caption_image(derivatives['model'], title), upload
+
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error generating caption: {str(e)}")
-            return None, None
+            return None, upload
 
     def text_to_speech(self, text):
         """Convert text to speech using Google's TTS API."""
         try:
-            synthesis_input = texttospeech.SynthesisInput(text=text)
-            voice = texttospeech.VoiceSelectionParams(
-                language_code="en-US",
-                ssml_gender=texttospeech.SsmlVoiceGender.SSML_VOICE_GENDER_UNSPECIFIED,
-                name="en-US-Neural2-C"
-            )
-            audio_config = texttospeech.AudioConfig(
-                audio_encoding=texttospeech.AudioEncoding.MP3,
-                speaking_rate=0.9,
-                pitch=0.0
-            )
-            response = tts_client.synthesize_speech(
-                input=synthesis_input,
-                voice=voice,
-                audio_config=audio_config
-            )
-            return base64.b64encode(response.audio_content).decode()
+            return self.synthesizer.synthesize(text)
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error converting text to speech: {str(e)}")
             return None
 
-    def add_photo(self, image_data, title=None):
-        """Add a new photo to the album with caption and audio description."""
+    def ingest_photo(self, upload, title=None, filename=None):
+        """Validate an uploaded photo and store it so it can be captioned in the background.
+
+        ``upload`` is bytes or a seekable binary file, such as the spooled
+        temp file behind a multipart upload; files are streamed into the
+        blob store rather than read into memory. Raises
+        :class:`UploadRejected` for files the upload policy refuses and
+        :class:`IngestBusy` when the decode memory budget stays full.
+        """
+        source = io.BytesIO(upload) if isinstance(upload, bytes) else upload
+        size = source.seek(0, io.SEEK_END)
+        image = self.upload_policy.open(source, filename)
+        image_format = image.format
+        # The perceptual hash only needs a draft decode; reserve memory for that
+        with metrics.time('decode', size=size):
+            image.draft('L', (64, 64))
+            with self.decode_budget.reserve(decode_bytes(image)):
+                image_dhash = dhash(image)
+
+        with metrics.time('blob_write', size=size):
+            source.seek(0)
+            image_blob = self.photo_db.blobs.put_file(source)
+
+        # ULIDs sort by upload time and stay unique however many arrive at once
+        photo_id = new_ulid()
+
+        return self.photo_db.add_photo(
+            photo_id=photo_id,
+            photo_data=None,
+            image_blob=image_blob,
+            image_url=None,
+            title=title,
+            caption=None,
+            audio=None,
+            image_mimetype=Image.MIME.get(image_format, 'application/octet-stream'),
+            status='processing',
+            user_title=title,
+            image_dhash=f"{image_dhash:016x}"
+        )
+
+    @property
+    def voice_version(self):
+        return self.synthesizer.voice_version
+
+    def _cache_key(self, photo):
+        # Cached audio is only good for the voice it was made with
+        return (
+            photo['image_blob'],
+            int(photo['image_dhash'], 16) if photo.get('image_dhash') else None,
+            photo.get('user_title'),
+            (self.prompt_version, self.voice_version)
+        )
+
+    def cached_result(self, photo_id, photo=None):
+        """Caption and audio fields of an earlier identical or near-identical upload, or ``None``.
+
+        Only those carry over: the photo still gets its own derivatives and
+        public URL.
+        """
+        if self.result_cache is None:
+            return None
+        photo = photo or self.photo_db.get_photo(photo_id)
+        cached = self.result_cache.get(*self._cache_key(photo))
+        if not cached or not self.photo_db.blobs.exists(cached['audio_blob']):
+            return None
+        return cached
+
+    def remember_result(self, photo_id):
+        """Cache a finished photo's caption and audio for later duplicates."""
+        if self.result_cache is None:
+            return
+        photo = self.photo_db.get_photo(photo_id)
+        if photo and photo.get('caption') and photo.get('audio_blob'):
+            self.result_cache.put(*self._cache_key(photo), {
+                'caption': photo['caption'],
+                'audio_blob': photo['audio_blob'],
+                'audio_mimetype': photo['audio_mimetype'],
+                'prompt_version': self.prompt_version,
+                'voice_version': self.voice_version
+            })
+
+    def defer_photo(self, photo_id, retry_after=None, error=None, job=None, **fields):
+        """Keep what a photo has so far and finish it in a later background job.
+
+        A photo that already has its caption waits as ``awaiting_audio``;
+        :meth:`process_photo` then only voices it. ``job`` is the photo's
+        job if it has one already (see :meth:`JobQueue.attach`).
+        """
+        if job is not None:
+            self.job_queue.confirm(job)
+        fields.setdefault('status', 'awaiting_audio' if fields.get('caption') else 'processing')
+        self.photo_db.update_photo(photo_id, **fields)
+        if job is not None:
+            self.job_queue.postpone(job, retry_after, error)
+        elif self.job_queue is not None:
+            self.job_queue.defer({'photo_id': photo_id}, retry_after, error)
+
+    def process_photo(self, photo_id, set_state=lambda state: None):
+        """Generate the caption and audio description for a stored photo.
+
+        A photo captioned by an earlier, deferred run keeps its caption, and
+        one the result cache knows gets its caption and audio from there.
+        Returns ``{'photo_id', 'cached'}``.
+        Raises :class:`Deferred` when an upstream is unavailable, so the job
+        is retried later instead of failing. ``set_state`` is called again
+        with the current stage before each result is written, so a job
+        another worker has reclaimed stops there (:class:`LeaseLost`).
+        """
+        photo = self.photo_db.get_photo(photo_id)
+        if not photo:
+            raise KeyError(f"Photo {photo_id} not found")
+
         try:
-            # Open image from bytes
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Generate caption and get S3 URL
-            caption, image_url = self.generate_image_caption(image, title)
-            
+            caption, image_url = photo.get('caption'), photo.get('image_url')
+            # Same bytes (or a re-saved copy) with the same title: no caption or TTS calls
+            cached = None if caption else self.cached_result(photo_id, photo)
+            if cached:
+                caption = cached['caption']
+
             if not caption or not image_url:
-                return None
-            
+                # Generate caption and get the public image URL
+                set_state('captioning')
+                derivatives = self.prepare_image(self.photo_db.blobs.read(photo['image_blob']))
+                self.photo_db.update_photo(
+                    photo_id, thumbnail=derivatives['thumbnail'], variants=derivatives.get('variants')
+                )
+                if caption:
+                    image_url = self.upload_image(derivatives['storage'])
+                else:
+                    caption, upload = self.generate_image_caption(derivatives, photo.get('user_title'))
+                    if not caption:
+                        raise RuntimeError('Caption generation failed')
+                    # Keep the paid-for caption: if the upload fails the job is
+                    # deferred (StorageUnavailable) and its next run only uploads
+                    set_state('captioning')
+                    self.photo_db.update_photo(photo_id, caption=caption)
+                    image_url = upload.result()
+
+                set_state('captioning')
+                self.photo_db.update_photo(photo_id, caption=caption, image_url=image_url)
+
+            if cached:
+                self.photo_db.update_photo(photo_id, status='ready', **cached)
+                return {'photo_id': photo_id, 'cached': True}
+
             # Generate audio description
-            audio = self.text_to_speech(caption)
-            
-            # Create unique ID for the photo
-            photo_id = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Store in database
-            return self.photo_db.add_photo(
-                photo_id=photo_id,
-                photo_data=image_data,
-                image_url=image_url,
-                title=title,
-                caption=caption,
-                audio=audio
+            set_state('voicing')
+            try:
+                audio = self.text_to_speech(caption)
+            except UpstreamUnavailable:
+                self.photo_db.update_photo(photo_id, status='awaiting_audio')
+                raise
+            set_state('voicing')
+            self.photo_db.update_photo(
+                photo_id, audio=audio, status='ready', prompt_version=self.prompt_version,
+                voice_version=self.voice_version
             )
-            
+            self.remember_result(photo_id)
+            return {'photo_id': photo_id, 'cached': False}
+
+        except UpstreamUnavailable as e:
+            raise Deferred(str(e), retry_after=e.retry_after) from e
+        except LeaseLost:
+            # Another worker is finishing this photo
+            raise
+        except Exception:
+            self.photo_db.update_photo(photo_id, status='failed')
+            raise
+
+    def narrate_photo(self, photo_id):
+        """Caption and voice a stored photo, yielding ``(event, data)`` as it goes.
+
+        Caption tokens are forwarded as the model streams them and every
+        finished sentence is voiced straight away, so the first sentence can
+        be played long before the whole caption exists. The first event is
+        ``accepted``. A photo the narration does not finish, because an
+        upstream is unavailable or the generator is closed early (the client
+        went away), is handed to a background job with whatever is done,
+        including the caption once it is complete.
+        """
+        photo = self.photo_db.get_photo(photo_id)
+        if not photo:
+            raise KeyError(f"Photo {photo_id} not found")
+
+        caption, derivatives, upload, stored = None, None, None, False
+
+        def finish_later(retry_after, error):
+            fields = {}
+            if caption:
+                fields['caption'] = caption
+            if derivatives is not None:
+                fields.update(thumbnail=derivatives['thumbnail'], variants=derivatives.get('variants'))
+            if upload is not None and upload.done() and upload.exception() is None:
+                fields['image_url'] = upload.result()
+            self.defer_photo(photo_id, retry_after, error, **fields)
+
+        try:
+            yield 'accepted', {'photo_id': photo_id}
+            cached = self.cached_result(photo_id, photo)
+            if cached:
+                # Play the cached narration at once; this upload still gets its own copies
+                audio = self.photo_db.blobs.read(cached['audio_blob'])
+                yield 'caption', {'text': cached['caption']}
+                yield 'audio', {'index': 0, 'audio': base64.b64encode(audio).decode()}
+
+            derivatives = self.prepare_image(self.photo_db.blobs.read(photo['image_blob']))
+            upload = self._upload_executor.submit(self.upload_image, derivatives['storage'])
+
+            if cached:
+                self.photo_db.update_photo(
+                    photo_id, image_url=upload.result(), thumbnail=derivatives['thumbnail'],
+                    variants=derivatives.get('variants'), status='ready', **cached
+                )
+                stored = True
+                yield 'done', {'photo_id': photo_id, 'cached': True, 'timings': {}}
+                return
+
+            tokens = self.caption_engine.stream(
+                jpeg_data_uri(derivatives['model']), photo.get('user_title')
+            )
+            for event, data in narrate(tokens, self.synthesizer.synthesize_chunk,
+                                       self.synthesizer.executor):
+                if event == 'captioned':
+                    caption = data['caption']
+                    continue
+                if event != 'done':
+                    yield event, data
+                    continue
+
+                if not data['caption']:
+                    raise RuntimeError('Caption generation failed')
+                # Cached first, so a job finishing a failed upload voices it for free
+                self.synthesizer.remember(data['caption'], data['audio'])
+                image_url = upload.result()
+                self.photo_db.update_photo(
+                    photo_id, caption=data['caption'], image_url=image_url, audio=data['audio'],
+                    thumbnail=derivatives['thumbnail'], variants=derivatives.get('variants'),
+                    status='ready', prompt_version=self.prompt_version,
+                    voice_version=self.voice_version
+                )
+                stored = True
+                self.remember_result(photo_id)
+                logger.info(
+                    f"Narrated {photo_id}: first audio after {data['timings'].get('first_audio')}s, "
+                    f"total {data['timings']['total']}s"
+                )
+                yield 'done', {'photo_id': photo_id, 'cached': False, 'timings': data['timings']}
+
+        except UpstreamUnavailable as e:
+            logger.warning(f"Deferring {photo_id}: {str(e)}")
+            finish_later(e.retry_after, str(e))
+            yield 'deferred', {'photo_id': photo_id, 'retry_after': e.retry_after}
+        except GeneratorExit:
+            if not stored:
+                logger.warning(f"Client left before {photo_id} was narrated; finishing it in the background")
+                finish_later(0, 'Client disconnected')
+            raise
+        except Exception:
+            self.photo_db.update_photo(photo_id, status='failed')
+            raise
+
+    def regenerate_photo(self, photo_id, recaption=False):
+        """Voice a finished photo again, first re-captioning it if ``recaption``.
+
+        Used by backfills after the caption prompt or the voice settings
+        change; the photo stays ``ready`` with its old caption and audio
+        until the new ones are stored. :class:`UpstreamUnavailable` is
+        raised as is, for the caller to retry.
+        """
+        photo = self.photo_db.get_photo(photo_id)
+        if not photo:
+            raise KeyError(f"Photo {photo_id} not found")
+
+        caption, fields = photo['caption'], {}
+        if recaption:
+            derivatives = self.prepare_image(self.photo_db.blobs.read(photo['image_blob']))
+            caption = self.caption_image(derivatives['model'], photo.get('user_title'))
+            if not caption:
+                raise RuntimeError('Caption generation failed')
+            fields = {'caption': caption, 'prompt_version': self.prompt_version}
+
+        audio = self.synthesizer.synthesize(caption)
+        self.photo_db.update_photo(photo_id, audio=audio, voice_version=self.voice_version, **fields)
+        self.remember_result(photo_id)
+        return photo_id
+
+    def add_photo(self, image_data, title=None):
+        """Add a new photo to the album with caption and audio description."""
+        try:
+            photo_id = self.ingest_photo(image_data, title)
+            return self.process_photo(photo_id)['photo_id']
+
         except Exception as e:
             logger.error(f"Error adding photo: {str(e)}")
             return None
 
-# Initialize photo album
-photo_album = PhotoAlbum()
+def create_services(config):
+    """Build the album services described by ``config``.
+
+    Nothing here talks to an upstream service: the TTS and S3 clients are
+    :class:`LazyClient` factories, built on first use in each process.
+    """
+    tts_client = LazyClient(google_tts_client)
+    storage_client = LazyClient(s3_client(config))
+    # Quotas, retries and circuit breakers shared by every caller of each provider
+    upstreams = {
+        'openai': create_upstream(
+            config, 'openai',
+            requests_per_minute=config['OPENAI_REQUESTS_PER_MINUTE'],
+            tokens_per_minute=config['OPENAI_TOKENS_PER_MINUTE'],
+            max_concurrency=config['OPENAI_MAX_CONCURRENCY']
+        ),
+        'tts': create_upstream(
+            config, 'tts',
+            requests_per_minute=config['TTS_REQUESTS_PER_MINUTE'],
+            tokens_per_minute=config['TTS_CHARACTERS_PER_MINUTE'],
+            max_concurrency=config['TTS_MAX_CONCURRENCY']
+        ),
+    }
+    photo_store = create_store(config)
+    photo_blobs = BlobStore(config['BLOB_STORAGE_PATH'])
+    photo_album = PhotoAlbum(
+        store=photo_store,
+        blobs=photo_blobs,
+        result_cache=ResultCache(
+            photo_store,
+            max_entries=config['RESULT_CACHE_SIZE'],
+            max_distance=config['RESULT_CACHE_MAX_DISTANCE']
+        ),
+        synthesizer=SpeechSynthesizer(
+            GuardedSpeechBackend(
+                GoogleSpeechBackend(
+                    tts_client,
+                    language_code=config['TTS_LANGUAGE_CODE'],
+                    voice_name=config['TTS_VOICE_NAME'],
+                    speaking_rate=config['TTS_SPEAKING_RATE'],
+                    pitch=config['TTS_PITCH']
+                ),
+                upstreams['tts']
+            ),
+            store=photo_store,
+            blobs=photo_blobs,
+            max_entries=config['TTS_CACHE_SIZE'],
+            chunk_chars=config['TTS_CHUNK_CHARS'],
+            max_workers=config['TTS_CHUNK_WORKERS']
+        ),
+        caption_engine=GuardedCaptionEngine(
+            create_caption_engine(config),
+            upstreams['openai'],
+            cost=config['CAPTION_PROMPT_TOKENS'] + config['CAPTION_MAX_TOKENS']
+        ),
+        prompt_version=config['CAPTION_PROMPT_VERSION'],
+        image_options={
+            'model_size': (config['CAPTION_IMAGE_SIZE'],) * 2,
+            'storage_size': config['MAX_IMAGE_SIZE'],
+            'thumbnail_size': config['THUMBNAIL_SIZE'],
+            'quality': config['JPEG_QUALITY'],
+            **({
+                'variant_widths': config['DERIVATIVE_WIDTHS'],
+                'variant_formats': supported_formats(config['DERIVATIVE_FORMATS'])
+            } if config['DERIVATIVES_EAGER'] else {})
+        },
+        image_workers=config['IMAGE_WORKERS'],
+        upload_workers=config['STORAGE_UPLOAD_WORKERS'],
+        semantic_index=SemanticIndex(
+            config['SEMANTIC_INDEX_PATH'],
+            dim=config['SEMANTIC_DIM']
+        ),
+        storage=create_storage(config, storage_client),
+        upload_policy=UploadPolicy(
+            config['ALLOWED_EXTENSIONS'],
+            max_bytes=config['MAX_CONTENT_LENGTH'],
+            max_pixels=config['MAX_IMAGE_PIXELS']
+        ),
+        decode_budget=MemoryBudget(
+            config['UPLOAD_MEMORY_BUDGET'],
+            timeout=config['UPLOAD_MEMORY_WAIT']
+        )
+    )
+
+    job_queue = JobQueue(
+        photo_store,
+        lambda job, set_state: photo_album.process_photo(job['payload']['photo_id'], set_state),
+        max_workers=config['JOB_WORKERS'],
+        max_pending=config['JOB_MAX_PENDING'],
+        lease_seconds=config['JOB_LEASE_SECONDS']
+    )
+    photo_album.job_queue = job_queue
+
+    return {
+        'tts_client': tts_client,
+        's3_client': storage_client,
+        'upstreams': upstreams,
+        'photo_album': photo_album,
+        # Deltas for clients syncing the album (/photos/changes)
+        'change_feed': ChangeFeed(
+            photo_album.photo_db,
+            poll_interval=config['CHANGES_POLL_INTERVAL']
+        ),
+        # Responsive sizes and encodings for /photos/<id>/image?w=
+        'photo_derivatives': Derivatives(
+            photo_album.photo_db,
+            widths=config['DERIVATIVE_WIDTHS'],
+            formats=config['DERIVATIVE_FORMATS'],
+            max_size=config['MAX_IMAGE_SIZE'],
+            quality=config['JPEG_QUALITY'],
+            executor=photo_album.preprocess_pool
+        ),
+        # Background captioning and voicing of uploads
+        'job_queue': job_queue,
+        # Whole-album backups (/export, /import)
+        'album_archive': AlbumArchive(
+            photo_album.photo_db,
+            batch_size=config['ARCHIVE_BATCH_SIZE']
+        ),
+        # Staged pipeline for multi-photo uploads
+        'batch_processor': BatchProcessor(
+            photo_album,
+            cpu_pool=photo_album.preprocess_pool,
+            upload_concurrency=config['BATCH_UPLOAD_CONCURRENCY'],
+            caption_concurrency=config['BATCH_CAPTION_CONCURRENCY'],
+            tts_concurrency=config['BATCH_TTS_CONCURRENCY'],
+            max_in_flight=config['BATCH_MAX_IN_FLIGHT']
+        ),
+    }
+
+def _service(name):
+    """Proxy to a service of the app handling the current request."""
+    return LocalProxy(lambda: current_app.extensions['album'][name])
+
+photo_album = _service('photo_album')
+photo_derivatives = _service('photo_derivatives')
+job_queue = _service('job_queue')
+batch_processor = _service('batch_processor')
+change_feed = _service('change_feed')
+album_archive = _service('album_archive')
+
+def warm_up(app):
+    """Do the one-off setup requests would otherwise pay for, and time each step.
+
+    Optional: builds the upstream clients of this process, starts the image
+    worker processes and generates the semantic projection, filling the
+    semantic index from the store if it is empty (e.g. kept in memory). With
+    ``VALIDATE_CREDENTIALS`` the Google credentials are checked first.
+    Returns seconds per step.
+    """
+    if app.config['VALIDATE_CREDENTIALS']:
+        is_valid, message = validate_google_credentials()
+        if not is_valid:
+            raise RuntimeError(message)
+
+    services = app.extensions['album']
+    album = services['photo_album']
+    steps = {
+        'tts_client': services['tts_client'],
+        's3_client': services['s3_client'],
+        'caption_client': lambda: getattr(album.caption_engine, 'client', None),
+        'image_workers': lambda: album.preprocess_pool.submit(os.getpid).result(),
+    }
+    index = album.photo_db.semantic_index
+    if index is not None:
+        steps['semantic_index'] = lambda: index.projection
+        if not len(index):
+            steps['semantic_rebuild'] = album.photo_db.rebuild_semantic_index
+
+    timings = {}
+    for name, step in steps.items():
+        started = time.perf_counter()
+        step()
+        timings[name] = round(time.perf_counter() - started, 3)
+    logger.info(f"Warm-up finished: {timings}")
+    return timings
 
-@app.route('/upload', methods=['POST'])
+def create_app(config_class=None):
+    """Create the Flask app from a config class or its dotted path.
+
+    Defaults to ``APP_CONFIG``, then ``DevelopmentConfig``. Upstream clients
+    are built on first use; set ``WARM_UP`` (or run ``flask warm-up``) to
+    pay that cost before the first request instead.
+    """
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.config.from_object(
+        config_class or os.getenv('APP_CONFIG', 'config.config.DevelopmentConfig')
+    )
+    app.extensions['album'] = create_services(app.config)
+    app.extensions['album']['job_queue'].start()
+    app.register_blueprint(bp)
+
+    @app.cli.command('warm-up')
+    def warm_up_command():
+        """Build clients and worker processes and report how long each took."""
+        print(json.dumps(warm_up(app), indent=2))
+
+    @app.cli.command('semantic-rebuild')
+    def semantic_rebuild_command():
+        """Re-embed every captioned photo, replacing the semantic index."""
+        indexed = app.extensions['album']['photo_album'].photo_db.rebuild_semantic_index()
+        print(json.dumps({'indexed': indexed}))
+
+    @app.cli.command('backfill')
+    @click.option('--captions', is_flag=True, help='Re-caption photos from older prompt versions.')
+    @click.option('--no-audio', is_flag=True, help='Do not re-voice photos with a stale voice.')
+    @click.option('--batch-size', type=int, default=app.config['BACKFILL_BATCH_SIZE'])
+    @click.option('--concurrency', type=int, default=app.config['BACKFILL_CONCURRENCY'])
+    @click.option('--restart', is_flag=True, help='Ignore the checkpoint and start from the top.')
+    def backfill_command(captions, no_audio, batch_size, concurrency, restart):
+        """Regenerate captions and audio left behind by a prompt or voice change.
+
+        Prints one JSON progress line per batch; rerun after an interruption
+        to resume from the checkpoint.
+        """
+        backfill = Backfill(
+            app.extensions['album']['photo_album'],
+            Checkpoint(app.config['BACKFILL_CHECKPOINT_PATH']),
+            captions=captions,
+            audio=not no_audio,
+            batch_size=batch_size,
+            concurrency=concurrency
+        )
+        report = lambda progress: print(json.dumps(progress), flush=True)
+        report(backfill.run(restart=restart, on_progress=report))
+
+    if app.config['WARM_UP']:
+        warm_up(app)
+    return app
+
+# Trace ids supplied by a proxy are echoed back if they look sane
+TRACE_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+@bp.before_app_request
+def start_trace():
+    """Give the request a trace id and start collecting its stage timings."""
+    trace_id = request.headers.get('X-Request-ID', '')
+    g.trace_id = trace_id if TRACE_ID_PATTERN.match(trace_id) else new_ulid()
+    g.started = time.perf_counter()
+    start_request_timings()
+
+@bp.after_app_request
+def finish_trace(response):
+    """Tag the response with its trace id and a ``Server-Timing`` breakdown."""
+    started = g.pop('started', None)
+    if started is None:
+        return response
+    total = time.perf_counter() - started
+    response.headers['X-Request-ID'] = g.trace_id
+    response.headers['Server-Timing'] = server_timing(total)
+    metrics.http_seconds.observe(
+        total, method=request.method, endpoint=request.endpoint or 'unknown',
+        status=response.status_code
+    )
+    return response
+
+# Registered after finish_trace so it runs first and is counted in the timing
+@bp.after_app_request
+def compress(response):
+    """Compress JSON and text bodies for clients that accept brotli or gzip."""
+    return compress_response(
+        response,
+        current_app.config['COMPRESSION_MIN_SIZE'],
+        current_app.config['COMPRESSION_LEVELS']
+    )
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text exposition of this process's metrics."""
+    services = current_app.extensions['album']
+    metrics.jobs_pending.set(services['job_queue'].pending)
+    for upstream in services['upstreams'].values():
+        upstream.stats()
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@bp.route('/health', methods=['GET'])
+def health_check():
+    """Report that the app is up, which upstream clients are built and each circuit's state."""
+    services = current_app.extensions['album']
+    return jsonify({
+        'status': 'healthy',
+        'clients': {name: services[name].built for name in ('tts_client', 's3_client')},
+        'upstreams': {name: upstream.stats() for name, upstream in services['upstreams'].items()},
+        'upload_memory': services['photo_album'].decode_budget.stats(),
+        'result_cache': services['photo_album'].result_cache.stats()
+    })
+
+def _queue_full_response():
+    response = jsonify({'error': 'Too many uploads in progress, try again shortly'})
+    response.headers['Retry-After'] = str(current_app.config['JOB_RETRY_AFTER'])
+    return response, 503
+
+def _rejected_response(error):
+    """Answer for an upload refused before it was stored."""
+    if isinstance(error, IngestBusy):
+        return _queue_full_response()
+    if isinstance(error, RequestEntityTooLarge):
+        limit = current_app.config['MAX_CONTENT_LENGTH']
+        return jsonify({'error': f'Uploads are limited to {limit} bytes'}), 413
+    return jsonify({'error': str(error)}), error.status
+
+@bp.route('/upload', methods=['POST'])
 def upload_photo():
-    """Handle photo upload and processing."""
+    """Accept a photo and queue caption and audio generation."""
     try:
         if 'photo' not in request.files:
             return jsonify({'error': 'No photo provided'}), 400
-            
+
+        # Reject early rather than storing a photo nobody will process
+        if job_queue.pending >= job_queue.max_pending:
+            return _queue_full_response()
+
         photo = request.files['photo']
         title = request.form.get('title')
-        
-        # Read image data
-        image_data = photo.read()
-        
-        # Add photo to album
-        photo_id = photo_album.add_photo(image_data, title)
-        
-        if photo_id:
-            return jsonify({
-                'status': 'success',
-                'photo_id': photo_id,
-                'details': photo_album.photo_db.get_photo(photo_id)
-            })
-        else:
-            return jsonify({'error': 'Failed to process photo'}), 500
-            
+
+        # Werkzeug spools large files to disk; validate and store from there
+        photo_id = photo_album.ingest_photo(photo.stream, title, photo.filename)
+        try:
+            job = job_queue.submit({'photo_id': photo_id})
+        except QueueFull:
+            photo_album.photo_db.update_photo(photo_id, status='failed')
+            return _queue_full_response()
+
+        return jsonify({
+            'status': 'accepted',
+            'photo_id': photo_id,
+            'job_id': job['id'],
+            'job_url': f"/jobs/{job['id']}",
+            'details': photo_album.photo_db.get_photo(photo_id)
+        }), 202
+
+    except (UploadRejected, IngestBusy, RequestEntityTooLarge) as e:
+        return _rejected_response(e)
     except Exception as e:
         logger.error(f"Upload error: {str(e)}")
         return jsonify({'error': 'Server error'}), 500
 
-@app.route('/photos/<photo_id>', methods=['GET'])
+@bp.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    """Process many photos at once, streaming one NDJSON result per photo.
+
+    Photos come either as repeated ``photos`` multipart files or as a single
+    ZIP/tar ``archive``. An optional ``title`` is applied to every photo.
+    """
+    try:
+        photos = request.files.getlist('photos')
+        archive = request.files.get('archive')
+    except RequestEntityTooLarge as e:
+        return _rejected_response(e)
+    if not photos and not archive:
+        return jsonify({'error': 'No photos provided'}), 400
+
+    title = request.form.get('title')
+    max_files = current_app.config['BATCH_MAX_FILES']
+    if archive:
+        sources = iter_archive(
+            archive.stream,
+            current_app.config['ALLOWED_EXTENSIONS'],
+            max_bytes=current_app.config['MAX_CONTENT_LENGTH']
+        )
+    else:
+        if len(photos) > max_files:
+            return jsonify({'error': f'At most {max_files} photos per batch'}), 413
+        # Spooled multipart files stream into the blob store, as on /upload
+        sources = ((photo.filename, photo.stream) for photo in photos)
+
+    rejected = []
+
+    def ingest():
+        for count, (filename, image_data) in enumerate(sources, 1):
+            if count > max_files:
+                rejected.append({'filename': filename, 'status': 'rejected',
+                                 'error': f'At most {max_files} photos per batch'})
+                break
+            try:
+                if image_data is None:
+                    raise UploadRejected('File is too large', 413)
+                photo_id = photo_album.ingest_photo(image_data, title, filename)
+                # Streamed files are read back from the blob store when their turn comes
+                yield photo_id, image_data if isinstance(image_data, bytes) else None, title
+            except Exception as e:
+                rejected.append({'filename': filename, 'status': 'rejected', 'error': str(e)})
+
+    def generate():
+        started = time.perf_counter()
+        counts = {'ready': 0, 'deferred': 0, 'failed': 0}
+        for result in batch_processor.run(ingest()):
+            counts[result['status']] += 1
+            yield json.dumps(result) + '\n'
+        for result in rejected:
+            yield json.dumps(result) + '\n'
+        yield json.dumps({'summary': {
+            **counts,
+            'rejected': len(rejected),
+            'seconds': round(time.perf_counter() - started, 3)
+        }}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@bp.route('/upload/stream', methods=['POST'])
+def upload_photo_stream():
+    """Upload a photo and stream its caption and audio back as Server-Sent Events.
+
+    Events: ``caption`` (token text), ``sentence`` (a finished sentence),
+    ``audio`` (base64 MP3 for one sentence, in order), then ``done`` with
+    timings, ``deferred`` when an upstream is unavailable and the photo will
+    be finished in the background, or ``error``.
+    """
+    try:
+        if 'photo' not in request.files:
+            return jsonify({'error': 'No photo provided'}), 400
+
+        photo = request.files['photo']
+        title = request.form.get('title')
+        photo_id = photo_album.ingest_photo(photo.stream, title, photo.filename)
+
+    except (UploadRejected, IngestBusy, RequestEntityTooLarge) as e:
+        return _rejected_response(e)
+    except Exception as e:
+        logger.error(f"Upload error: {str(e)}")
+        return jsonify({'error': 'Server error'}), 500
+
+    def generate():
+        try:
+            # Closed with the response, so a client that leaves hands the photo to a job
+            with closing(photo_album.narrate_photo(photo_id)) as events:
+                for event, data in events:
+                    yield sse(event, data)
+        except Exception as e:
+            logger.error(f"Error narrating photo: {str(e)}")
+            yield sse('error', {'photo_id': photo_id, 'error': 'Failed to process photo'})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@bp.route('/export', methods=['GET'])
+def export_album():
+    """Download the whole album as an archive, streamed as it is built.
+
+    ``format=tar`` (default) or ``zip``; see :class:`AlbumArchive` for the
+    layout. ``POST /import`` loads it back.
+    """
+    archive_format = request.args.get('format', 'tar')
+    if archive_format not in ARCHIVE_TYPES:
+        return jsonify({'error': 'format must be tar or zip'}), 400
+    filename = f"album-{datetime.now():%Y%m%d-%H%M%S}.{archive_format}"
+    return Response(
+        stream_with_context(album_archive.export(archive_format)),
+        mimetype=ARCHIVE_TYPES[archive_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@bp.route('/import', methods=['POST'])
+def import_album():
+    """Load an archive made by ``/export``, sent as the raw request body.
+
+    Tar archives (``Content-Type: application/x-tar``, optionally gzipped)
+    are read as they arrive. A ZIP (``application/zip``) keeps its index at
+    the end, so it is spooled to a temp file first. The body may be up to
+    ``IMPORT_MAX_BYTES``, independent of ``MAX_CONTENT_LENGTH``.
+    """
+    try:
+        body = get_input_stream(
+            request.environ, max_content_length=current_app.config['IMPORT_MAX_BYTES']
+        )
+        if request.mimetype in ('application/zip', 'application/x-zip-compressed'):
+            with tempfile.TemporaryFile() as spooled:
+                shutil.copyfileobj(body, spooled, 1024 * 1024)
+                spooled.seek(0)
+                summary = album_archive.load(spooled, 'zip')
+        else:
+            summary = album_archive.load(body, 'tar')
+        return jsonify(summary)
+
+    except RequestEntityTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except (ValueError, tarfile.TarError, zipfile.BadZipFile) as e:
+        return jsonify({'error': f'Invalid archive: {e}'}), 400
+    except Exception as e:
+        logger.error(f"Import error: {str(e)}")
+        return jsonify({'error': 'Server error'}), 500
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Report the state and per-stage timings of a background job."""
+    try:
+        job = job_queue.get(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+
+        return jsonify({
+            'id': job['id'],
+            'state': job['state'],
+            'photo_id': job['payload'].get('photo_id'),
+            'stages': job['stages'],
+            # True when the caption and audio were reused from an identical upload
+            'cached': bool((job.get('result') or {}).get('cached')),
+            'error': job['error'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at']
+        })
+
+    except Exception as e:
+        logger.error(f"Error retrieving job: {str(e)}")
+        return jsonify({'error': 'Server error'}), 500
+
+@bp.route('/photos/<photo_id>', methods=['GET'])
 def get_photo_details(photo_id):
     """Retrieve photo details including caption and audio description."""
     try:
@@ -268,65 +1130,245 @@ def get_photo_details(photo_id):
         if not photo_info:
             return jsonify({'error': 'Photo not found'}), 404
             
-        return jsonify(photo_info)
+        return conditional_json(photo_info)
         
     except Exception as e:
         logger.error(f"Error retrieving photo details: {str(e)}")
         return jsonify({'error': 'Server error'}), 500
 
-@app.route('/photos', methods=['GET'])
+def _album_etag():
+    """Weak ETag of the requested listing page; it changes whenever any photo does."""
+    return listing_etag(f"album-{photo_album.photo_db.version()}")
+
+def _photo_page(query=None, semantic=False):
+    """Build one page of a listing from ``limit``/``cursor``/``fields`` args.
+
+    Search pages also carry ``total``, the number of matches.
+    """
+    limit = parse_limit(
+        request.args.get('limit'),
+        current_app.config['PAGE_SIZE_DEFAULT'],
+        current_app.config['PAGE_SIZE_MAX']
+    )
+    fields = parse_fields(request.args.get('fields'))
+    after = decode_cursor(request.args.get('cursor'))
+
+    # Fetch one extra row to know whether another page follows
+    result = {}
+    if query is None:
+        page = photo_album.photo_db.page_photos(limit + 1, after)
+        next_cursor = encode_cursor(*page[limit - 1]) if len(page) > limit else None
+    else:
+        if semantic:
+            result['total'], hits = photo_album.photo_db.semantic_page(
+                query, limit + 1, after, current_app.config['SEMANTIC_MIN_SCORE']
+            )
+        else:
+            result['total'] = photo_album.photo_db.count(query)
+            hits = photo_album.photo_db.search_page(query, limit + 1, after)
+        next_cursor = encode_key(hits[limit - 1][2]) if len(hits) > limit else None
+        page = [(photo_id, photo) for photo_id, photo, _ in hits]
+    result.update({
+        'photos': [project(photo_id, photo, fields) for photo_id, photo in page[:limit]],
+        'next_cursor': next_cursor
+    })
+    return result
+
+@bp.route('/photos', methods=['GET'])
 def list_photos():
-    """List all photos in the album."""
+    """List photos in the album, one page at a time."""
     try:
-        return jsonify({
-            'total_photos': len(photo_album.photo_db.photos_db),
-            'photos': photo_album.photo_db.list_photos()
-        })
-        
+        etag = _album_etag()
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
+
+        page = _photo_page()
+        return with_weak_etag(stream_json({
+            'total_photos': photo_album.photo_db.count(),
+            **page
+        }, 'photos'), etag)
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error listing photos: {str(e)}")
         return jsonify({'error': 'Server error'}), 500
 
-@app.route('/search', methods=['GET'])
+def _change_args():
+    """``(since, limit, fields)`` of a change feed request.
+
+    ``since`` falls back to ``Last-Event-ID``, which browsers send when an
+    event stream reconnects.
+    """
+    since = decode_version(request.args.get('since') or request.headers.get('Last-Event-ID'))
+    limit = parse_limit(
+        request.args.get('limit'),
+        current_app.config['PAGE_SIZE_DEFAULT'],
+        current_app.config['PAGE_SIZE_MAX']
+    )
+    return since, limit, parse_fields(request.args.get('fields'))
+
+@bp.route('/photos/changes', methods=['GET'])
+def photo_changes():
+    """Photos added or updated after the ``since`` cursor, oldest change first.
+
+    Without ``since`` this walks the whole album. Follow ``cursor`` while
+    ``has_more`` is true, then keep it for the next sync. ``wait=<seconds>``
+    holds a request that has nothing new until something changes (a long
+    poll, capped at ``CHANGES_MAX_WAIT``).
+    """
+    try:
+        since, limit, fields = _change_args()
+        wait = max(0.0, min(float(request.args.get('wait') or 0),
+                            current_app.config['CHANGES_MAX_WAIT']))
+        changes, version, has_more = change_feed.page(since, limit)
+        if not changes and wait and change_feed.wait(since, wait):
+            changes, version, has_more = change_feed.page(since, limit)
+        return stream_json({
+            'photos': [project(photo_id, photo, fields) for photo_id, photo, _ in changes],
+            'cursor': encode_version(version),
+            'has_more': has_more
+        }, 'photos')
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error reading album changes: {str(e)}")
+        return jsonify({'error': 'Server error'}), 500
+
+@bp.route('/photos/changes/stream', methods=['GET'])
+def photo_changes_stream():
+    """Push album changes as Server-Sent Events.
+
+    Each ``photos`` event carries changed photos and the ``cursor`` after
+    them, which is also the event id, so a reconnecting client resumes
+    where it left off. Quiet periods are filled with comment heartbeats.
+    """
+    try:
+        since, limit, fields = _change_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    heartbeat = current_app.config['CHANGES_HEARTBEAT']
+
+    def generate():
+        for changes, version in change_feed.follow(since, limit, heartbeat):
+            if not changes:
+                yield ': keep-alive\n\n'
+                continue
+            cursor = encode_version(version)
+            yield sse('photos', {
+                'photos': [project(photo_id, photo, fields) for photo_id, photo, _ in changes],
+                'cursor': cursor
+            }, event_id=cursor)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@bp.route('/search', methods=['GET'])
 def search_photos():
-    """Search photos by title or caption."""
+    """Search photos by title or caption, best matches first, one page at a time.
+
+    ``mode=semantic`` ranks captions by similarity of meaning instead of
+    shared words.
+    """
     try:
+        mode = request.args.get('mode', 'keyword')
+        if mode not in ('keyword', 'semantic'):
+            raise ValueError('mode must be keyword or semantic')
+
+        etag = _album_etag()
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
+
         query = request.args.get('query', '').lower()
-        matching_photos = photo_album.photo_db.search_photos(query)
-        
-        return jsonify({
+        page = _photo_page(query, semantic=mode == 'semantic')
+
+        return with_weak_etag(stream_json({
             'status': 'success',
-            'total_results': len(matching_photos),
-            'photos': matching_photos
-        })
-        
+            'mode': mode,
+            'total_results': page.pop('total'),
+            **page
+        }, 'photos'), etag)
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error searching photos: {str(e)}")
         return jsonify({'error': 'Server error'}), 500
 
-@app.route('/photos/<photo_id>/image', methods=['GET'])
+def _send_blob(photo_id, blob_field, mimetype_field):
+    """Stream a stored blob from disk (sendfile where the server supports it)."""
+    photo_info = photo_album.photo_db.get_photo(photo_id)
+    if not photo_info or not photo_info.get(blob_field):
+        return jsonify({'error': 'Photo not found'}), 404
+
+    return send_blob(
+        photo_album.photo_db.blob_path(photo_info[blob_field]),
+        photo_info[mimetype_field],
+        photo_info[blob_field]
+    )
+
+def _send_derivative(photo_id, requested_width):
+    """Serve the derivative matching ``?w=`` in the best format the client accepts."""
+    width = photo_derivatives.pick_width(requested_width)
+    photo_info = photo_album.photo_db.get_photo(photo_id)
+    if not photo_info or not photo_info.get('image_blob'):
+        return jsonify({'error': 'Photo not found'}), 404
+
+    image_format = photo_derivatives.negotiate(request.accept_mimetypes)
+    digest = photo_derivatives.get(photo_id, photo_info, width, image_format)
+    response = send_blob(
+        photo_album.photo_db.blob_path(digest),
+        photo_derivatives.mimetype(image_format),
+        digest
+    )
+    response.vary.add('Accept')
+    return response
+
+@bp.route('/photos/<photo_id>/image', methods=['GET'])
 def get_photo_image(photo_id):
-    """Retrieve the actual image data for a photo."""
+    """Retrieve the image for a photo: the original, or a resized copy with ``?w=``."""
     try:
-        photo_info = photo_album.photo_db.get_photo(photo_id)
-        if not photo_info or 'image_data' not in photo_info:
-            return jsonify({'error': 'Photo not found'}), 404
-            
-        # Decode base64 image data
-        image_data = base64.b64decode(photo_info['image_data'])
-        
-        # Create file-like object
-        image_io = io.BytesIO(image_data)
-        
-        return send_file(
-            image_io,
-            mimetype='image/jpeg',
-            as_attachment=False
-        )
-        
+        if 'w' in request.args:
+            return _send_derivative(photo_id, request.args['w'])
+        return _send_blob(photo_id, 'image_blob', 'image_mimetype')
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error retrieving photo image: {str(e)}")
         return jsonify({'error': 'Server error'}), 500
 
+@bp.route('/photos/<photo_id>/audio', methods=['GET'])
+def get_photo_audio(photo_id):
+    """Retrieve the audio description for a photo."""
+    try:
+        return _send_blob(photo_id, 'audio_blob', 'audio_mimetype')
+
+    except Exception as e:
+        logger.error(f"Error retrieving photo audio: {str(e)}")
+        return jsonify({'error': 'Server error'}), 500
+
+@bp.route('/media/<digest>.<ext>', methods=['GET'])
+def get_media(digest, ext):
+    """Serve a blob by content hash; the URL never changes meaning, so it is immutable."""
+    try:
+        mimetype = MEDIA_TYPES.get(ext.lower())
+        if mimetype is None or not photo_album.photo_db.blobs.exists(digest):
+            return jsonify({'error': 'Media not found'}), 404
+
+        return send_blob(photo_album.photo_db.blob_path(digest), mimetype, digest, immutable=True)
+
+    except ValueError:
+        return jsonify({'error': 'Media not found'}), 404
+    except Exception as e:
+        logger.error(f"Error retrieving media: {str(e)}")
+        return jsonify({'error': 'Server error'}), 500
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
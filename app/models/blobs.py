@@ -0,0 +1,87 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    """Content-addressed blob store on the local filesystem.
+
+    Blobs are keyed by the SHA-256 of their bytes and sharded two levels deep
+    (``ab/cd/abcd...``) so no directory grows unbounded. Writes go to a temp
+    file in the same directory and are published with ``os.replace``, so a
+    reader never sees a partially written blob.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest):
+        """Filesystem path for ``digest`` (whether or not it exists)."""
+        if len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+            raise ValueError(f"Invalid blob digest: {digest!r}")
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def exists(self, digest):
+        return self.path(digest).is_file()
+
+    def put(self, data):
+        """Store ``data`` and return its SHA-256 hex digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        if not self.exists(digest):
+            self._publish(digest, lambda f: f.write(data))
+        return digest
+
+    def put_file(self, fileobj):
+        """Stream ``fileobj`` into the store, hashing as it is copied."""
+        hasher = hashlib.sha256()
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.incoming-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+                    out.write(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+            digest = hasher.hexdigest()
+            target = self.path(digest)
+            if target.exists():
+                os.unlink(tmp_path)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, target)
+            return digest
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _publish(self, digest, write):
+        target = self.path(digest)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                write(out)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def open(self, digest):
+        """Open a stored blob for binary reading."""
+        return open(self.path(digest), 'rb')
+
+    def read(self, digest):
+        with self.open(digest) as f:
+            return f.read()
+
+    def size(self, digest):
+        return self.path(digest).stat().st_size
@@ -0,0 +1,223 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+from collections import OrderedDict
+
+WORD = re.compile(r'\w+')
+
+# Common words plus the filler of spoken searches ("show me pictures of ...")
+STOPWORDS = frozenset("""
+    a about all an and any are as at be by can could did do does for from
+    had has have her his i in into is it its me my of on or our over please
+    she show so some that the their them there these they this those to up
+    us was we were what when where which who with you your
+    find search look looking see want photo photos picture pictures pic pics
+    image images one ones
+""".split())
+
+# Suffix -> replacement, first match wins; a light stand-in for Porter stemming
+STEM_RULES = (
+    ('sses', 'ss'), ('ies', 'y'), ('ches', 'ch'), ('shes', 'sh'), ('xes', 'x'),
+    ('ingly', ''), ('edly', ''), ('ing', ''), ('ed', ''), ('ly', ''), ('s', ''),
+)
+
+# Query terms shorter than this match whole words only
+MIN_PREFIX_LENGTH = 3
+# Cap on indexed words one prefix may expand to
+MAX_EXPANSIONS = 64
+# When no photo has every query word and any of them may match, words in
+# more than this share of the album are dropped: they would match (and
+# rank) most of it while telling nothing apart
+COMMON_WORD_SHARE = 0.5
+
+
+def tokenize(text):
+    """Lowercased word tokens of ``text``."""
+    return WORD.findall((text or '').lower())
+
+
+def stem(word):
+    """Strip common English inflections, keeping a stem of at least three letters."""
+    if len(word) <= 3 or word.isdigit() or word.endswith(('ss', 'us', 'is')):
+        return word
+    for suffix, replacement in STEM_RULES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)] + replacement
+            if replacement == '' and suffix in ('ing', 'ed') and word[-1] == word[-2] \
+                    and word[-1] not in 'lsz':
+                word = word[:-1]
+            break
+    return word
+
+
+def query_terms(query):
+    """Meaningful words of a typed or spoken query, in order, without repeats."""
+    return list(dict.fromkeys(t for t in tokenize(query) if t not in STOPWORDS))
+
+
+def fts_query(terms, expansions=None, match_all=True):
+    """FTS5 MATCH expression for ``terms``.
+
+    Each term matches itself or any of its ``expansions`` (term -> the
+    indexed words it is a prefix of); the stemming tokenizer reduces all of
+    them to stems. Requires every term with ``match_all``, otherwise any of
+    them.
+    """
+    groups = []
+    for term in terms:
+        words = dict.fromkeys([term, *(expansions or {}).get(term, ())])
+        group = ' OR '.join(f'"{word}"' for word in words)
+        groups.append(f'({group})' if len(words) > 1 else group)
+    return (' AND ' if match_all else ' OR ').join(groups)
+
+
+class InvertedIndex:
+    """In-memory BM25 index over photo titles and captions.
+
+    Documents are added and replaced one at a time, so the index is always
+    current. Query words match by stem, and partial words also match the
+    words they begin as written (before stemming shortens them). Documents
+    must contain every query word; only when none does, documents with any
+    of them match, which suits wordy spoken queries (words common to most
+    documents are then left out, see :data:`COMMON_WORD_SHARE`). Hits are ranked by
+    BM25, with title words counting ``title_weight`` times. Ranks are
+    negated scores, so lower is better, the same convention as SQLite FTS5.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, title_weight=2.0, cache_size=64):
+        self.k1 = k1
+        self.b = b
+        self.title_weight = title_weight
+        self._postings = {}  # term -> {doc_id: weighted term frequency}
+        self._documents = {}  # doc_id -> (weighted length, term frequencies, words)
+        self._words = {}  # word as written -> number of documents with it
+        self._vocabulary = []  # sorted words as written, for prefix expansion
+        self._total_length = 0.0
+        # Scores of recent queries, so paging and counting reuse one scoring pass
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, doc_id, title, caption):
+        """Index (or re-index) a document."""
+        frequencies, words = {}, set()
+        for weight, text in ((self.title_weight, title), (1.0, caption)):
+            for token in tokenize(text):
+                term = stem(token)
+                frequencies[term] = frequencies.get(term, 0.0) + weight
+                words.add(token)
+        with self._lock:
+            current = self._documents.get(doc_id)
+            if current is not None and current[1:] == (frequencies, words):
+                return
+            self._remove(doc_id)
+            self._cache.clear()
+            for term, frequency in frequencies.items():
+                self._postings.setdefault(term, {})[doc_id] = frequency
+            for word in words:
+                if word not in self._words:
+                    self._words[word] = 0
+                    bisect.insort(self._vocabulary, word)
+                self._words[word] += 1
+            length = sum(frequencies.values())
+            self._documents[doc_id] = (length, frequencies, words)
+            self._total_length += length
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+            self._cache.clear()
+
+    def _remove(self, doc_id):
+        document = self._documents.pop(doc_id, None)
+        if document is None:
+            return
+        length, frequencies, words = document
+        self._total_length -= length
+        for term in frequencies:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        for word in words:
+            self._words[word] -= 1
+            if not self._words[word]:
+                del self._words[word]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, word)]
+
+    def _expand(self, token):
+        """Indexed stems a query word stands for: its own and those of the words it begins."""
+        terms = [stem(token)]
+        if len(token) >= MIN_PREFIX_LENGTH:
+            start = bisect.bisect_left(self._vocabulary, token)
+            for word in self._vocabulary[start:start + MAX_EXPANSIONS]:
+                if not word.startswith(token):
+                    break
+                terms.append(stem(word))
+        return [term for term in dict.fromkeys(terms) if term in self._postings]
+
+    def _scores(self, query):
+        key = tuple(query_terms(query))
+        scores = self._cache.get(key)
+        if scores is None:
+            scores = self._cache[key] = self._score(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return scores
+
+    def _score(self, tokens):
+        count = len(self._documents)
+        if not count:
+            return {}
+        # Postings of each query word: {term: postings} over its prefix expansions
+        words = [
+            {term: self._postings[term] for term in self._expand(token)}
+            for token in tokens
+        ]
+        words = [word for word in words if word]
+        if not words:
+            return {}
+
+        matches = [set().union(*word.values()) for word in words]
+        candidates = set.intersection(*matches)
+        if not candidates:
+            rare = [word for word, docs in zip(words, matches) if len(docs) <= COMMON_WORD_SHARE * count]
+            words = rare or words
+
+        average_length = self._total_length / count
+        scores = {}
+        for word in words:
+            for postings in word.values():
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                if candidates:
+                    matches = ((d, postings[d]) for d in candidates if d in postings)
+                else:
+                    matches = postings.items()
+                for doc_id, frequency in matches:
+                    length = self._documents[doc_id][0]
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    score = idf * frequency * (self.k1 + 1) / (frequency + norm)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + score
+        return scores
+
+    def search(self, query, limit=None, after=None):
+        """``(rank, doc_id)`` pairs, best first, strictly after the ``after`` pair."""
+        with self._lock:
+            ranked = ((-score, doc_id) for doc_id, score in self._scores(query).items())
+            if after is not None:
+                after = (float(after[0]), after[1])
+                ranked = (item for item in ranked if item > after)
+            if limit is None:
+                return sorted(ranked)
+            return heapq.nsmallest(limit, ranked)
+
+    def count(self, query):
+        with self._lock:
+            return len(self._scores(query))
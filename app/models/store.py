@@ -0,0 +1,664 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from app.models.search import (
+    COMMON_WORD_SHARE, MAX_EXPANSIONS, MIN_PREFIX_LENGTH, InvertedIndex, fts_query, query_terms
+)
+
+logger = logging.getLogger(__name__)
+
+# Job states after which a job is never picked up again
+FINISHED_JOB_STATES = frozenset({'done', 'failed'})
+
+
+def merge_record(photo, fields, variants=None):
+    """``photo`` with ``fields`` set and ``variants`` merged into its ``variants`` map."""
+    photo = {**photo, **fields}
+    if variants:
+        photo['variants'] = {**(photo.get('variants') or {}), **variants}
+    return photo
+
+
+class PhotoStore:
+    """Interface for photo metadata backends.
+
+    Records are plain dicts keyed by photo id. Every backend returns them
+    ordered by ``(timestamp, id)`` so listings are stable across backends.
+    """
+
+    def add_photo(self, photo_id, record):
+        """Insert or replace a single photo record."""
+        return self.add_photos([(photo_id, record)])[0]
+
+    def add_photos(self, items):
+        """Insert or replace many ``(photo_id, record)`` pairs in one batch."""
+        raise NotImplementedError
+
+    def update_photo(self, photo_id, fields, variants=None):
+        """Set ``fields`` on a stored record and merge ``variants`` into its own, atomically.
+
+        The read and the write happen in one transaction, so concurrent
+        updates from any process never drop each other's changes. Returns
+        the updated record, or ``None`` if there is no such photo.
+        """
+        raise NotImplementedError
+
+    def get_photo(self, photo_id):
+        """Return the record for ``photo_id`` or ``None``."""
+        raise NotImplementedError
+
+    def list_photos(self):
+        """Return every record as an ordered ``{photo_id: record}`` dict."""
+        raise NotImplementedError
+
+    def search_photos(self, query):
+        """Return every record matching ``query`` as a ``{photo_id: record}`` dict, best first."""
+        return {photo_id: record for photo_id, record, _ in self.search_page(query, None)}
+
+    def page_photos(self, limit, after=None):
+        """Return up to ``limit`` ``(photo_id, record)`` pairs.
+
+        ``after`` is the ``(timestamp, photo_id)`` key of the last item of the
+        previous page.
+        """
+        raise NotImplementedError
+
+    def search_page(self, query, limit, after=None):
+        """Return up to ``limit`` ``(photo_id, record, key)`` search hits, best first.
+
+        Titles and captions must contain every meaningful word of ``query``
+        (by stem, or as the start of a word as written, so partial words
+        match while typing), or any of them when no photo has them
+        all; hits are ranked by BM25. ``key`` is an opaque pair to pass back
+        as ``after`` for the next page.
+        """
+        raise NotImplementedError
+
+    def count(self, query=None):
+        """Return the number of stored photos (matching ``query`` if given)."""
+        raise NotImplementedError
+
+    def changes_since(self, version, limit):
+        """Up to ``limit`` ``(photo_id, record, version)`` written after ``version``.
+
+        Every written record takes the next album version, so this is the
+        album's change log, oldest change first; a photo written again moves
+        to the end.
+        """
+        raise NotImplementedError
+
+    def version(self):
+        """Album version: a counter bumped by every photo write."""
+        raise NotImplementedError
+
+    def save_job(self, job_id, job, owner=None):
+        """Insert or replace a background job record.
+
+        With ``owner`` the record is only replaced while the stored job is
+        still held by that owner (see :meth:`claim_stale_jobs`); returns
+        whether it was written.
+        """
+        raise NotImplementedError
+
+    def get_job(self, job_id):
+        """Return the job record for ``job_id`` or ``None``."""
+        raise NotImplementedError
+
+    def renew_job(self, job_id, owner, now):
+        """Set ``updated_at = now`` on an unfinished job ``owner`` still holds.
+
+        Returns False when the job has finished or another owner has claimed it.
+        """
+        raise NotImplementedError
+
+    def claim_stale_jobs(self, cutoff, now, owner=None):
+        """Claim unfinished jobs not touched since ``cutoff``.
+
+        Claimed jobs get ``updated_at = now`` and ``owner`` in the same
+        transaction, so two workers polling at once never pick up the same
+        job and the worker that let it go stale can no longer write it.
+        """
+        raise NotImplementedError
+
+    def cache_get(self, namespace, key):
+        """Return a cached string value and mark it as recently used."""
+        raise NotImplementedError
+
+    def cache_put(self, namespace, key, value, max_entries):
+        """Cache a string value, evicting least recently used entries over ``max_entries``."""
+        raise NotImplementedError
+
+    def cache_scan(self, namespace, prefix):
+        """``(key, value)`` of every cached entry whose key starts with ``prefix``.
+
+        Unlike :meth:`cache_get` this does not mark the entries as used.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release any resources held by the backend."""
+
+
+class MemoryPhotoStore(PhotoStore):
+    """Process-local dict backend, used by the test configuration."""
+
+    def __init__(self):
+        self.photos_db = {}
+        self.jobs_db = {}
+        self.cache_db = {}
+        self.album_version = 0
+        # photo id -> version of its last write, in write order
+        self.versions = OrderedDict()
+        self.index = InvertedIndex()
+        self._lock = threading.Lock()
+
+    def add_photos(self, items):
+        with self._lock:
+            for photo_id, record in items:
+                self._put(photo_id, record)
+        return [photo_id for photo_id, _ in items]
+
+    def _put(self, photo_id, record):
+        self.photos_db[photo_id] = dict(record)
+        self.index.add(photo_id, record.get('title'), record.get('caption'))
+        self.album_version += 1
+        self.versions[photo_id] = self.album_version
+        self.versions.move_to_end(photo_id)
+
+    def update_photo(self, photo_id, fields, variants=None):
+        with self._lock:
+            photo = self.photos_db.get(photo_id)
+            if photo is None:
+                return None
+            photo = merge_record(photo, fields, variants)
+            self._put(photo_id, photo)
+        return dict(photo)
+
+    def get_photo(self, photo_id):
+        photo = self.photos_db.get(photo_id)
+        return dict(photo) if photo else None
+
+    def _ordered(self):
+        with self._lock:
+            items = list(self.photos_db.items())
+        items.sort(key=lambda item: (item[1].get('timestamp', ''), item[0]))
+        return items
+
+    def list_photos(self):
+        return {photo_id: dict(photo) for photo_id, photo in self._ordered()}
+
+    def page_photos(self, limit, after=None):
+        page = []
+        for photo_id, photo in self._ordered():
+            if after is not None and (photo.get('timestamp', ''), photo_id) <= tuple(after):
+                continue
+            page.append((photo_id, dict(photo)))
+            if len(page) == limit:
+                break
+        return page
+
+    def search_page(self, query, limit, after=None):
+        hits = []
+        for rank, photo_id in self.index.search(query, limit, after):
+            photo = self.get_photo(photo_id)
+            if photo is not None:
+                hits.append((photo_id, photo, (rank, photo_id)))
+        return hits
+
+    def count(self, query=None):
+        if query is None:
+            return len(self.photos_db)
+        return self.index.count(query)
+
+    def changes_since(self, version, limit):
+        # Versions only grow along the log, so walk back from the newest write
+        changed = []
+        with self._lock:
+            for photo_id, photo_version in reversed(self.versions.items()):
+                if photo_version <= version:
+                    break
+                changed.append((photo_id, dict(self.photos_db[photo_id]), photo_version))
+        return changed[::-1][:limit]
+
+    def version(self):
+        return self.album_version
+
+    def save_job(self, job_id, job, owner=None):
+        with self._lock:
+            stored = self.jobs_db.get(job_id)
+            if owner is not None and (stored is None or stored.get('owner') != owner):
+                return False
+            self.jobs_db[job_id] = dict(job)
+            return True
+
+    def get_job(self, job_id):
+        job = self.jobs_db.get(job_id)
+        return dict(job) if job else None
+
+    def renew_job(self, job_id, owner, now):
+        with self._lock:
+            job = self.jobs_db.get(job_id)
+            if job is None or job.get('owner') != owner or job['state'] in FINISHED_JOB_STATES:
+                return False
+            job['updated_at'] = now
+            return True
+
+    def claim_stale_jobs(self, cutoff, now, owner=None):
+        claimed = []
+        with self._lock:
+            for job in self.jobs_db.values():
+                if job['state'] not in FINISHED_JOB_STATES and job['updated_at'] < cutoff:
+                    job['updated_at'] = now
+                    job['owner'] = owner
+                    claimed.append(dict(job))
+        return claimed
+
+    def cache_get(self, namespace, key):
+        with self._lock:
+            entries = self.cache_db.get(namespace)
+            if not entries or key not in entries:
+                return None
+            entries.move_to_end(key)
+            return entries[key]
+
+    def cache_put(self, namespace, key, value, max_entries):
+        with self._lock:
+            entries = self.cache_db.setdefault(namespace, OrderedDict())
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > max_entries:
+                entries.popitem(last=False)
+
+    def cache_scan(self, namespace, prefix):
+        with self._lock:
+            return [(key, value) for key, value in self.cache_db.get(namespace, {}).items()
+                    if key.startswith(prefix)]
+
+
+class SQLitePhotoStore(PhotoStore):
+    """SQLite backend in WAL mode, safe to share between worker processes.
+
+    Each thread gets its own connection; WAL lets readers in any process run
+    alongside a single writer, and ``busy_timeout`` serialises writers.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS photos (
+            id TEXT PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            title TEXT,
+            caption TEXT,
+            data TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_photos_timestamp ON photos (timestamp, id);
+        CREATE VIRTUAL TABLE IF NOT EXISTS photos_fts USING fts5(
+            title, caption, tokenize = 'porter unicode61'
+        );
+        CREATE TRIGGER IF NOT EXISTS photos_fts_insert AFTER INSERT ON photos BEGIN
+            INSERT INTO photos_fts (rowid, title, caption)
+            VALUES (new.rowid, new.title, new.caption);
+        END;
+        CREATE TRIGGER IF NOT EXISTS photos_fts_update AFTER UPDATE OF title, caption ON photos
+        WHEN old.title IS NOT new.title OR old.caption IS NOT new.caption BEGIN
+            DELETE FROM photos_fts WHERE rowid = old.rowid;
+            INSERT INTO photos_fts (rowid, title, caption)
+            VALUES (new.rowid, new.title, new.caption);
+        END;
+        CREATE TRIGGER IF NOT EXISTS photos_fts_delete AFTER DELETE ON photos BEGIN
+            DELETE FROM photos_fts WHERE rowid = old.rowid;
+        END;
+        -- Unstemmed words, only to expand partial query words: "wedd" must
+        -- find "wedding", whose stem is "wed"
+        CREATE VIRTUAL TABLE IF NOT EXISTS photos_words USING fts5(
+            title, caption, content = '', tokenize = 'unicode61'
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS photos_words_vocab USING fts5vocab(photos_words, 'row');
+        CREATE TRIGGER IF NOT EXISTS photos_words_insert AFTER INSERT ON photos BEGIN
+            INSERT INTO photos_words (rowid, title, caption)
+            VALUES (new.rowid, new.title, new.caption);
+        END;
+        CREATE TRIGGER IF NOT EXISTS photos_words_update AFTER UPDATE OF title, caption ON photos
+        WHEN old.title IS NOT new.title OR old.caption IS NOT new.caption BEGIN
+            INSERT INTO photos_words (photos_words, rowid, title, caption)
+            VALUES ('delete', old.rowid, old.title, old.caption);
+            INSERT INTO photos_words (rowid, title, caption)
+            VALUES (new.rowid, new.title, new.caption);
+        END;
+        CREATE TRIGGER IF NOT EXISTS photos_words_delete AFTER DELETE ON photos BEGIN
+            INSERT INTO photos_words (photos_words, rowid, title, caption)
+            VALUES ('delete', old.rowid, old.title, old.caption);
+        END;
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, updated_at);
+        CREATE TABLE IF NOT EXISTS cache (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (namespace, key)
+        );
+        CREATE INDEX IF NOT EXISTS idx_cache_last_used ON cache (namespace, last_used);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('album_version', 0);
+    """
+
+    # BM25 column weights for (title, caption)
+    RANK_FUNCTION = 'bm25(2.0, 1.0)'
+
+    def __init__(self, path, busy_timeout=5000):
+        self.path = str(path)
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        if self.path != ':memory:':
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            self._migrate_versions(conn)
+            # Albums created before the search index existed get it built once
+            if conn.execute('SELECT NOT EXISTS (SELECT 1 FROM photos_fts)').fetchone()[0]:
+                conn.execute(
+                    'INSERT INTO photos_fts (rowid, title, caption) '
+                    'SELECT rowid, title, caption FROM photos'
+                )
+            if conn.execute(
+                'SELECT NOT EXISTS (SELECT 1 FROM photos_words_vocab) '
+                'AND EXISTS (SELECT 1 FROM photos WHERE title IS NOT NULL OR caption IS NOT NULL)'
+            ).fetchone()[0]:
+                conn.execute(
+                    'INSERT INTO photos_words (rowid, title, caption) '
+                    'SELECT rowid, title, caption FROM photos'
+                )
+
+    @staticmethod
+    def _migrate_versions(conn):
+        """Give albums created before the change feed a version per photo."""
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(photos)')}
+        if 'version' not in columns:
+            conn.execute('ALTER TABLE photos ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+            conn.execute('UPDATE photos SET version = rowid')
+            conn.execute(
+                "UPDATE meta SET value = MAX(value, (SELECT COALESCE(MAX(rowid), 0) FROM photos)) "
+                "WHERE key = 'album_version'"
+            )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_photos_version ON photos (version)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_record(row):
+        return json.loads(row['data'])
+
+    def add_photos(self, items):
+        with self._connect() as conn:
+            return self._write(conn, list(items))
+
+    def update_photo(self, photo_id, fields, variants=None):
+        conn = self._connect()
+        with conn:
+            # BEGIN IMMEDIATE takes the write lock before the read, so no
+            # other process can write the record in between
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT data FROM photos WHERE id = ?', (photo_id,)).fetchone()
+            if row is None:
+                return None
+            photo = merge_record(self._row_to_record(row), fields, variants)
+            self._write(conn, [(photo_id, photo)])
+        return photo
+
+    @staticmethod
+    def _write(conn, items):
+        # Bumping the version first takes the write lock, so the versions
+        # handed out below are ours alone
+        conn.execute(
+                "UPDATE meta SET value = value + ? WHERE key = 'album_version'", (len(items),)
+        )
+        last = conn.execute("SELECT value FROM meta WHERE key = 'album_version'").fetchone()[0]
+        rows = [
+            (
+                photo_id,
+                record.get('timestamp', ''),
+                record.get('title'),
+                record.get('caption'),
+                json.dumps(record),
+                version,
+            )
+            for version, (photo_id, record) in enumerate(items, last - len(items) + 1)
+        ]
+        # An upsert keeps the rowid, which the search index is keyed on
+        conn.executemany(
+            'INSERT INTO photos (id, timestamp, title, caption, data, version) '
+            'VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET timestamp = excluded.timestamp, '
+            'title = excluded.title, caption = excluded.caption, data = excluded.data, '
+            'version = excluded.version',
+            rows,
+        )
+        return [row[0] for row in rows]
+
+    def get_photo(self, photo_id):
+        row = self._connect().execute(
+            'SELECT data FROM photos WHERE id = ?', (photo_id,)
+        ).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def list_photos(self):
+        rows = self._connect().execute(
+            'SELECT id, data FROM photos ORDER BY timestamp, id'
+        )
+        return {row['id']: self._row_to_record(row) for row in rows}
+
+    def page_photos(self, limit, after=None):
+        where, params = '', ()
+        if after is not None:
+            where, params = 'WHERE (timestamp, id) > (?, ?) ', tuple(after)
+        rows = self._connect().execute(
+            f'SELECT id, data FROM photos {where}ORDER BY timestamp, id LIMIT ?',
+            (*params, int(limit)),
+        )
+        return [(row['id'], self._row_to_record(row)) for row in rows]
+
+    def _match_expression(self, query):
+        """Every query word if some photo has them all, otherwise any of them.
+
+        Words in most of the album are left out of the fallback, as in
+        :class:`InvertedIndex`.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return None
+        expansions = {term: self._expand(term) for term in terms}
+        match_all = fts_query(terms, expansions)
+        if len(terms) == 1 or self._connect().execute(
+            'SELECT EXISTS (SELECT 1 FROM photos_fts WHERE photos_fts MATCH ?)', (match_all,)
+        ).fetchone()[0]:
+            return match_all
+        common = COMMON_WORD_SHARE * self.count()
+        rare = [term for term in terms if 0 < self._matches(fts_query([term], expansions)) <= common]
+        return fts_query(rare or terms, expansions, match_all=False)
+
+    def _matches(self, expression):
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM photos_fts WHERE photos_fts MATCH ?', (expression,)
+        ).fetchone()[0]
+
+    def _expand(self, term):
+        """Indexed words, as written, that start with ``term``."""
+        if len(term) < MIN_PREFIX_LENGTH:
+            return []
+        # A key range rather than LIKE, so the vocabulary is searched in order
+        upper = term[:-1] + chr(ord(term[-1]) + 1)
+        rows = self._connect().execute(
+            'SELECT term FROM photos_words_vocab WHERE term >= ? AND term < ? ORDER BY term LIMIT ?',
+            (term, upper, MAX_EXPANSIONS),
+        )
+        return [row['term'] for row in rows]
+
+    def search_page(self, query, limit, after=None):
+        expression = self._match_expression(query)
+        if expression is None:
+            return []
+        clauses = ['photos_fts MATCH ?', 'rank MATCH ?']
+        params = [expression, self.RANK_FUNCTION]
+        if after is not None:
+            clauses.append('(rank, rowid) > (?, ?)')
+            params.extend([float(after[0]), int(after[1])])
+        # Rank inside the index first; only the winning rows are joined
+        rows = self._connect().execute(
+            'SELECT photos.id, photos.data, hits.rank, hits.rowid FROM ('
+            f'SELECT rowid, rank FROM photos_fts WHERE {" AND ".join(clauses)} '
+            'ORDER BY rank, rowid LIMIT ?'
+            ') AS hits JOIN photos ON photos.rowid = hits.rowid ORDER BY hits.rank, hits.rowid',
+            (*params, -1 if limit is None else int(limit)),
+        )
+        return [
+            (row['id'], self._row_to_record(row), (row['rank'], row['rowid']))
+            for row in rows
+        ]
+
+    def count(self, query=None):
+        if query is None:
+            return self._connect().execute('SELECT COUNT(*) FROM photos').fetchone()[0]
+        expression = self._match_expression(query)
+        if expression is None:
+            return 0
+        return self._matches(expression)
+
+    def changes_since(self, version, limit):
+        rows = self._connect().execute(
+            'SELECT id, data, version FROM photos WHERE version > ? ORDER BY version LIMIT ?',
+            (int(version), int(limit)),
+        )
+        return [(row['id'], self._row_to_record(row), row['version']) for row in rows]
+
+    def version(self):
+        return self._connect().execute(
+            "SELECT value FROM meta WHERE key = 'album_version'"
+        ).fetchone()[0]
+
+    def save_job(self, job_id, job, owner=None):
+        with self._connect() as conn:
+            if owner is None:
+                conn.execute(
+                    'INSERT OR REPLACE INTO jobs (id, state, updated_at, data) VALUES (?, ?, ?, ?)',
+                    (job_id, job['state'], job['updated_at'], json.dumps(job)),
+                )
+                return True
+            return conn.execute(
+                "UPDATE jobs SET state = ?, updated_at = ?, data = ? "
+                "WHERE id = ? AND json_extract(data, '$.owner') = ?",
+                (job['state'], job['updated_at'], json.dumps(job), job_id, owner),
+            ).rowcount == 1
+
+    def get_job(self, job_id):
+        row = self._connect().execute(
+            'SELECT data FROM jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def renew_job(self, job_id, owner, now):
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET updated_at = ?, data = json_set(data, '$.updated_at', ?) "
+                "WHERE id = ? AND json_extract(data, '$.owner') = ? AND state NOT IN (?, ?)",
+                (now, now, job_id, owner, *FINISHED_JOB_STATES),
+            ).rowcount == 1
+
+    def claim_stale_jobs(self, cutoff, now, owner=None):
+        conn = self._connect()
+        finished = tuple(FINISHED_JOB_STATES)
+        with conn:
+            # BEGIN IMMEDIATE takes the write lock up front so the
+            # select-then-update is atomic across processes.
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(
+                'SELECT id, data FROM jobs WHERE state NOT IN (?, ?) AND updated_at < ?',
+                (*finished, cutoff),
+            ).fetchall()
+            claimed = []
+            for row in rows:
+                job = self._row_to_record(row)
+                job['updated_at'] = now
+                job['owner'] = owner
+                conn.execute(
+                    'UPDATE jobs SET updated_at = ?, data = ? WHERE id = ?',
+                    (now, json.dumps(job), row['id']),
+                )
+                claimed.append(job)
+        return claimed
+
+    def cache_get(self, namespace, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT value FROM cache WHERE namespace = ? AND key = ?', (namespace, key)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                'UPDATE cache SET last_used = ? WHERE namespace = ? AND key = ?',
+                (time.time(), namespace, key),
+            )
+        return row['value']
+
+    def cache_put(self, namespace, key, value, max_entries):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO cache (namespace, key, value, last_used) VALUES (?, ?, ?, ?)',
+                (namespace, key, value, time.time()),
+            )
+            conn.execute(
+                'DELETE FROM cache WHERE namespace = ? AND key IN ('
+                'SELECT key FROM cache WHERE namespace = ? '
+                'ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                (namespace, namespace, int(max_entries)),
+            )
+
+    def cache_scan(self, namespace, prefix):
+        # A key range rather than LIKE, so the primary key index is used
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        rows = self._connect().execute(
+            'SELECT key, value FROM cache WHERE namespace = ? AND key >= ? AND key < ?',
+            (namespace, prefix, upper),
+        ).fetchall()
+        return [(row['key'], row['value']) for row in rows]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def create_store(config):
+    """Build the metadata backend named by ``PHOTO_DB_BACKEND`` in ``config``."""
+    backend = config.get('PHOTO_DB_BACKEND', 'sqlite')
+    if backend == 'memory':
+        return MemoryPhotoStore()
+    if backend == 'sqlite':
+        return SQLitePhotoStore(
+            config['PHOTO_DB_PATH'],
+            busy_timeout=config.get('PHOTO_DB_BUSY_TIMEOUT', 5000),
+        )
+    raise ValueError(f"Unknown photo store backend: {backend}")
@@ -0,0 +1,255 @@
+import hashlib
+import json
+import logging
+import re
+import tarfile
+import tempfile
+import time
+import zipfile
+
+from app.models.blobs import CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.ndjson'
+MEDIA_NAME = re.compile(r'^media/([0-9a-f]{64})\.[a-z0-9]+$')
+ARCHIVE_TYPES = {'tar': 'application/x-tar', 'zip': 'application/zip'}
+
+# The manifest is written last, once every photo has been seen; until then
+# it is kept in memory up to this size and on disk beyond
+MANIFEST_SPOOL_BYTES = 1024 * 1024
+# Imported blobs are checked against their hash before they are stored;
+# meanwhile they are kept in memory up to this size and on disk beyond
+MEDIA_SPOOL_BYTES = 4 * 1024 * 1024
+# Import errors reported individually; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+_EXTENSIONS = {
+    'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif', 'image/webp': 'webp',
+    'image/avif': 'avif', 'audio/mpeg': 'mp3',
+}
+
+
+def photo_media(record):
+    """``(digest, extension)`` of every blob a photo record points at."""
+    media = []
+    if record.get('image_blob'):
+        media.append((record['image_blob'], _EXTENSIONS.get(record.get('image_mimetype'), 'bin')))
+    if record.get('thumbnail_blob'):
+        media.append((record['thumbnail_blob'], 'jpg'))
+    for name, digest in (record.get('variants') or {}).items():
+        media.append((digest, name.rsplit('.', 1)[-1]))
+    if record.get('audio_blob'):
+        media.append((record['audio_blob'], 'mp3'))
+    return media
+
+
+class _Sink:
+    """Write-only file that hands over what was written since the last :meth:`drain`."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class TarStream:
+    """Builds a tar archive as a stream of chunks, one file at a time."""
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._offset = 0
+
+    def _emit(self, data):
+        self._offset += len(data)
+        return data
+
+    def entry(self, name, fileobj, size, mtime, compress=False):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        yield self._emit(info.tobuf(tarfile.PAX_FORMAT))
+        for chunk in iter(lambda: fileobj.read(self.chunk_size), b''):
+            yield self._emit(chunk)
+        if size % tarfile.BLOCKSIZE:
+            yield self._emit(tarfile.NUL * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE))
+
+    def close(self):
+        # Two empty blocks end the archive; tar pads it to a whole record
+        end = self._offset + 2 * tarfile.BLOCKSIZE
+        yield self._emit(tarfile.NUL * (2 * tarfile.BLOCKSIZE + (-end) % tarfile.RECORDSIZE))
+
+
+class ZipStream:
+    """Builds a ZIP archive as a stream of chunks, one file at a time.
+
+    Sizes and CRCs follow each file in a data descriptor, so nothing has to
+    be seeked back to. Media is stored as is; ``compress`` deflates.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, 'w', zipfile.ZIP_STORED, allowZip64=True)
+
+    def entry(self, name, fileobj, size, mtime, compress=False):
+        info = zipfile.ZipInfo(name, date_time=time.localtime(max(mtime, 315532800))[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        info.file_size = size
+        with self._zip.open(info, 'w') as dest:
+            for chunk in iter(lambda: fileobj.read(self.chunk_size), b''):
+                dest.write(chunk)
+                yield self._sink.drain()
+        yield self._sink.drain()
+
+    def close(self):
+        self._zip.close()
+        yield self._sink.drain()
+
+
+def _iter_members(fileobj, archive_format):
+    """Yield ``(name, open)`` for every file in a tar stream or a seekable ZIP."""
+    if archive_format == 'zip':
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, lambda info=info: archive.open(info)
+        return
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if member.isfile():
+                yield member.name, lambda member=member: archive.extractfile(member)
+
+
+class AlbumArchive:
+    """Whole-album export and import as tar or ZIP archives.
+
+    An archive holds every blob a photo uses (original, thumbnail,
+    derivatives and audio) as ``media/<sha256>.<ext>``, followed by
+    ``manifest.ndjson`` with one ``{"id", "record"}`` line per photo. Blobs
+    are copied ``chunk_size`` bytes at a time and the manifest is spooled
+    to disk while it is written, so neither direction holds more than a
+    few MB of payload however big the album is.
+    """
+
+    def __init__(self, photo_db, batch_size=200, chunk_size=CHUNK_SIZE):
+        self.photo_db = photo_db
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+
+    def export(self, archive_format='tar'):
+        """Yield the album as a tar or ZIP archive, chunk by chunk."""
+        if archive_format not in ARCHIVE_TYPES:
+            raise ValueError(f"Unsupported archive format: {archive_format}")
+        writer = (TarStream if archive_format == 'tar' else ZipStream)(self.chunk_size)
+        blobs, now = self.photo_db.blobs, time.time()
+        # Photos often share blobs (repeat uploads, one voice clip per
+        # caption); each goes into the archive once
+        written = set()
+
+        with tempfile.SpooledTemporaryFile(MANIFEST_SPOOL_BYTES) as manifest:
+            after = None
+            while page := self.photo_db.store.page_photos(self.batch_size, after):
+                for photo_id, record in page:
+                    for digest, ext in photo_media(record):
+                        if digest in written or not blobs.exists(digest):
+                            continue
+                        written.add(digest)
+                        with blobs.open(digest) as f:
+                            yield from writer.entry(
+                                f"media/{digest}.{ext}", f, blobs.size(digest), now
+                            )
+                    manifest.write(json.dumps({'id': photo_id, 'record': record}).encode() + b'\n')
+                last_id, last = page[-1]
+                after = (last.get('timestamp', ''), last_id)
+
+            size = manifest.tell()
+            manifest.seek(0)
+            yield from writer.entry(MANIFEST_NAME, manifest, size, now, compress=True)
+        yield from writer.close()
+
+    def load(self, fileobj, archive_format='tar'):
+        """Import an archive made by :meth:`export`; returns counts and errors.
+
+        Tar archives (optionally compressed) are read as a stream; ZIP files
+        must be seekable. Blobs already stored are skipped by their hash,
+        as are photos whose id is already in the album. Records are written
+        ``batch_size`` at a time exactly as exported: nothing is captioned
+        or voiced again.
+        """
+        if archive_format not in ARCHIVE_TYPES:
+            raise ValueError(f"Unsupported archive format: {archive_format}")
+        summary = {'photos': 0, 'photos_existing': 0, 'blobs': 0, 'blobs_existing': 0,
+                   'failed': 0, 'errors': []}
+        for name, open_member in _iter_members(fileobj, archive_format):
+            if name == MANIFEST_NAME:
+                with open_member() as manifest:
+                    self._load_manifest(manifest, summary)
+            elif MEDIA_NAME.match(name):
+                self._load_blob(name, open_member, summary)
+        return summary
+
+    def _error(self, summary, message):
+        summary['failed'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append(message)
+
+    def _load_blob(self, name, open_member, summary):
+        digest = MEDIA_NAME.match(name).group(1)
+        if self.photo_db.blobs.exists(digest):
+            summary['blobs_existing'] += 1
+            return
+        hasher = hashlib.sha256()
+        with tempfile.SpooledTemporaryFile(MEDIA_SPOOL_BYTES) as spooled:
+            with open_member() as member:
+                for chunk in iter(lambda: member.read(CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+                    spooled.write(chunk)
+            # A blob that does not match its name never reaches the store
+            if hasher.hexdigest() != digest:
+                self._error(summary, f"{name}: content does not match its hash")
+                return
+            spooled.seek(0)
+            self.photo_db.blobs.put_file(spooled)
+        summary['blobs'] += 1
+
+    def _load_manifest(self, manifest, summary):
+        batch = []
+        for number, line in enumerate(manifest, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                photo_id, record = entry['id'], entry['record']
+            except (ValueError, KeyError, TypeError):
+                self._error(summary, f"{MANIFEST_NAME} line {number}: not a photo entry")
+                continue
+            if self.photo_db.store.get_photo(photo_id) is not None:
+                summary['photos_existing'] += 1
+                continue
+            missing = [d for d, _ in photo_media(record) if not self.photo_db.blobs.exists(d)]
+            if missing:
+                self._error(summary, f"Photo {photo_id}: {len(missing)} media files missing")
+                continue
+            batch.append((photo_id, record))
+            if len(batch) == self.batch_size:
+                self._store(batch, summary)
+                batch = []
+        if batch:
+            self._store(batch, summary)
+
+    def _store(self, batch, summary):
+        self.photo_db.import_photos(batch)
+        summary['photos'] += len(batch)
+        logger.info(f"Imported {summary['photos']} photos")
@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from app.services.upstream import UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+UPDATED = 'updated'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+
+class Checkpoint:
+    """Progress of a backfill, kept in a JSON file that is replaced atomically."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def load(self):
+        try:
+            return json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return None
+
+    def save(self, state):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix='.checkpoint-')
+        try:
+            with os.fdopen(fd, 'w') as out:
+                json.dump(state, out)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+
+class Backfill:
+    """Brings every finished photo to the album's current caption prompt and voice.
+
+    Photos are read ``batch_size`` at a time in listing order. A photo whose
+    ``prompt_version`` is not the album's is captioned again (with
+    ``captions``) and then voiced; one whose ``voice_version`` is stale is
+    only voiced again (with ``audio``). Photos already at the target are
+    skipped, as are photos still waiting for their first caption, which
+    their own jobs will finish.
+
+    Each batch runs ``concurrency`` photos at once; the album's upstream
+    guards keep the calls within every provider's quota. When a provider
+    stays unavailable the photo is retried after its ``retry_after``, up to
+    ``max_waits`` times. After each batch the position is saved to
+    ``checkpoint``, so a run that is interrupted resumes from the last
+    finished batch. A checkpoint written for another target is ignored, and
+    a run that reaches the end removes it, so the next run starts over.
+    """
+
+    def __init__(self, album, checkpoint, captions=False, audio=True, batch_size=50,
+                 concurrency=4, max_waits=5, clock=time.monotonic, sleep=time.sleep):
+        if not captions and not audio:
+            raise ValueError('Nothing to backfill: enable captions, audio or both')
+        self.album = album
+        self.checkpoint = checkpoint
+        self.captions = captions
+        self.audio = audio
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_waits = max_waits
+        self.clock = clock
+        self.sleep = sleep
+
+    def target(self):
+        return {
+            'prompt_version': self.album.prompt_version if self.captions else None,
+            'voice_version': self.album.synthesizer.voice_version if self.audio else None,
+        }
+
+    def needs(self, photo):
+        """``'caption'``, ``'audio'`` or ``None``: the work ``photo`` needs to reach the target."""
+        if not photo.get('caption'):
+            return None
+        target = self.target()
+        if self.captions and photo.get('prompt_version') != target['prompt_version']:
+            return 'caption'
+        if self.audio and photo.get('voice_version') != target['voice_version']:
+            return 'audio'
+        return None
+
+    def _process(self, photo_id, work):
+        for attempt in range(self.max_waits + 1):
+            try:
+                self.album.regenerate_photo(photo_id, recaption=work == 'caption')
+                return UPDATED
+            except UpstreamUnavailable as e:
+                if attempt == self.max_waits:
+                    logger.error(f"Backfill gave up on {photo_id}: {str(e)}")
+                    return FAILED
+                wait = e.retry_after or 1.0
+                logger.warning(f"Backfill waiting {wait:.1f}s before retrying {photo_id}: {str(e)}")
+                self.sleep(wait)
+            except Exception as e:
+                logger.error(f"Backfill failed for {photo_id}: {str(e)}")
+                return FAILED
+
+    def _resume(self, restart):
+        state = None if restart else self.checkpoint.load()
+        if state is None or state.get('target') != self.target():
+            state = {'target': self.target(), 'after': None,
+                     'counts': {UPDATED: 0, SKIPPED: 0, FAILED: 0}}
+        elif state['after'] is not None:
+            logger.info(f"Resuming backfill after {state['after'][1]}")
+        return state
+
+    def run(self, restart=False, on_progress=None):
+        """Backfill the album; ``on_progress(progress)`` is called after each batch.
+
+        Returns the final progress (see :meth:`progress`).
+        """
+        state = self._resume(restart)
+        total = self.album.photo_db.count()
+        started, scanned = self.clock(), 0
+        progress = self.progress(state, total, 0, 0.0)
+
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='backfill') as executor:
+            while True:
+                after = tuple(state['after']) if state['after'] else None
+                page = self.album.photo_db.page_photos(self.batch_size, after)
+                if not page:
+                    break
+                work = [(photo_id, self.needs(photo)) for photo_id, photo in page]
+                todo = [(photo_id, need) for photo_id, need in work if need]
+                state['counts'][SKIPPED] += len(work) - len(todo)
+                for outcome in executor.map(lambda item: self._process(*item), todo):
+                    state['counts'][outcome] += 1
+
+                last_id, last = page[-1]
+                state['after'] = [last.get('timestamp', ''), last_id]
+                self.checkpoint.save(state)
+                scanned += len(page)
+                progress = self.progress(state, total, scanned, self.clock() - started)
+                if on_progress is not None:
+                    on_progress(progress)
+
+        # Finished: a later run (e.g. to retry failures) must start from the top
+        self.checkpoint.clear()
+        progress['done'] = True
+        return progress
+
+    @staticmethod
+    def progress(state, total, scanned, elapsed):
+        """Counts so far, with this run's throughput and the estimated time left.
+
+        The estimate assumes the rest of the album needs the same mix of
+        work and skips as the photos scanned so far in this run.
+        """
+        counts = state['counts']
+        seen = sum(counts.values())
+        rate = scanned / elapsed if elapsed else 0.0
+        return {
+            **counts,
+            'scanned': seen,
+            'total': total,
+            'photos_per_second': round(rate, 2),
+            'eta_seconds': round(max(total - seen, 0) / rate, 1) if rate else None,
+            'done': False,
+        }
@@ -0,0 +1,266 @@
+import logging
+import queue
+import tarfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import PurePosixPath
+
+from app.services.jobs import LeaseLost
+from app.services.metrics import metrics
+from app.services.upstream import UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+class BatchItem:
+    """Progress of one photo through the batch pipeline."""
+
+    def __init__(self, photo_id, title):
+        self.photo_id = photo_id
+        self.title = title
+        self.image_url = None
+        self.caption = None
+        self.audio = None
+        self.thumbnail = None
+        self.variants = None
+        # Caption and audio fields reused from an identical earlier upload
+        self.cached = None
+        # Background job standing in for this run, should the process die
+        self.job = None
+        self.timings = {}
+        self.failed = False
+        self._remaining = 2  # the upload and caption/voice branches
+        self._lock = threading.Lock()
+
+    def branch_done(self):
+        """Mark one branch finished; True when it was the last one."""
+        with self._lock:
+            self._remaining -= 1
+            return self._remaining == 0
+
+    def fail(self):
+        """Mark the item failed; True only for the first failure."""
+        with self._lock:
+            first, self.failed = not self.failed, True
+            return first
+
+    def result(self, status, error=None):
+        return {
+            'photo_id': self.photo_id,
+            'status': status,
+            'error': error,
+            'cached': self.cached is not None,
+            'job_id': self.job['id'] if self.job else None,
+            'timings': self.timings,
+        }
+
+
+class BatchProcessor:
+    """Pipeline that pushes many photos through resize, upload, caption and TTS.
+
+    Every stage has its own pool, so its size is that stage's concurrency
+    limit: resizing runs in a process pool (it is CPU-bound), the upstream
+    calls run in thread pools. Once a photo is resized its S3 upload and its
+    caption (from the inline model-sized copy) run side by side; TTS follows
+    the caption. A photo moves on as soon as a stage is done, so slow
+    captioning never holds up uploads. A photo the result cache knows skips
+    captioning and TTS but is still resized and uploaded. A photo held up by
+    an unavailable provider is reported as ``deferred`` and finished by a
+    background job.
+
+    With the album's job queue, every photo gets a job before its stages
+    start and the pipeline acts as that job's worker: if the process dies
+    mid-batch, the job is reclaimed and the photo finished in the background.
+    """
+
+    def __init__(self, album, cpu_pool=None, upload_concurrency=8,
+                 caption_concurrency=4, tts_concurrency=4, max_in_flight=64):
+        self.album = album
+        self.max_in_flight = max_in_flight
+        self._pools = {
+            'prepare': cpu_pool or ProcessPoolExecutor(),
+            'upload': ThreadPoolExecutor(upload_concurrency, thread_name_prefix='batch-upload'),
+            'caption': ThreadPoolExecutor(caption_concurrency, thread_name_prefix='batch-caption'),
+            'voice': ThreadPoolExecutor(tts_concurrency, thread_name_prefix='batch-voice'),
+        }
+
+    def run(self, items):
+        """Process ``(photo_id, image_data, title)`` items, yielding results as they finish.
+
+        At most ``max_in_flight`` photos are held in the pipeline; reading more
+        input waits until earlier photos are done. ``image_data`` may be
+        ``None`` for a photo whose upload is already in the blob store.
+        """
+        results = queue.Queue()
+        in_flight = 0
+        for photo_id, image_data, title in items:
+            while in_flight >= self.max_in_flight:
+                yield results.get()
+                in_flight -= 1
+            item = BatchItem(photo_id, title)
+            item.cached = self.album.cached_result(photo_id)
+            if image_data is None:
+                image_data = self.album.stored_image(photo_id)
+            if self.album.job_queue is not None:
+                item.job = self.album.job_queue.attach({'photo_id': photo_id})
+            self._submit(item, 'prepare', self.album.prepare, (image_data,), self._prepared, results)
+            in_flight += 1
+            # Hand back anything already finished while the rest is read in
+            while True:
+                try:
+                    result = results.get_nowait()
+                except queue.Empty:
+                    break
+                in_flight -= 1
+                yield result
+        for _ in range(in_flight):
+            yield results.get()
+
+    def shutdown(self, wait=True):
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
+
+    def _submit(self, item, stage, fn, args, then, results):
+        started = time.perf_counter()
+
+        def done(future):
+            seconds = time.perf_counter() - started
+            item.timings[stage] = round(seconds, 4)
+            # Includes waiting for a free slot in the stage's pool
+            metrics.observe(f'batch_{stage}', seconds)
+            try:
+                value = future.result()
+            except Exception as e:
+                self._fail(item, stage, e, results)
+                return
+            if not item.failed:
+                then(item, value, results)
+
+        self._pools[stage].submit(fn, *args).add_done_callback(done)
+
+    def _fail(self, item, stage, error, results):
+        if not item.fail():
+            return
+        if isinstance(error, UpstreamUnavailable):
+            self._defer(item, stage, error, results)
+            return
+        if isinstance(error, LeaseLost):
+            # Another worker reclaimed the job and finishes the photo
+            logger.warning(f"Batch {stage} handed {item.photo_id} over: {str(error)}")
+            results.put(item.result('deferred', f"{stage}: {error}"))
+            return
+        logger.error(f"Batch {stage} failed for {item.photo_id}: {str(error)}")
+        try:
+            if item.job is not None:
+                self.album.job_queue.confirm(item.job)
+            self.album.photo_db.update_photo(item.photo_id, status='failed')
+            if item.job is not None:
+                self.album.job_queue.fail(item.job, f"{stage}: {error}")
+        except LeaseLost as e:
+            logger.warning(f"Batch left {item.photo_id} to another worker: {str(e)}")
+        finally:
+            results.put(item.result('failed', f"{stage}: {error}"))
+
+    def _defer(self, item, stage, error, results):
+        # The provider is throttled or down: keep the caption, if there is
+        # one, and let a background job finish the photo later
+        logger.warning(f"Batch {stage} deferred for {item.photo_id}: {str(error)}")
+        try:
+            self.album.defer_photo(
+                item.photo_id, error.retry_after, str(error), job=item.job, caption=item.caption,
+                thumbnail=item.thumbnail, variants=item.variants
+            )
+        except LeaseLost as e:
+            logger.warning(f"Batch left {item.photo_id} to another worker: {str(e)}")
+        finally:
+            results.put(item.result('deferred', f"{stage}: {error}"))
+
+    def _prepared(self, item, derivatives, results):
+        item.thumbnail = derivatives['thumbnail']
+        item.variants = derivatives.get('variants')
+        self._submit(item, 'upload', self.album.upload_image, (derivatives['storage'],),
+                     self._uploaded, results)
+        if item.cached is not None:
+            # Repeat photos take their caption and audio from the result cache
+            item.caption = item.cached['caption']
+            self._branch_done(item, results)
+            return
+        self._submit(item, 'caption', self.album.caption_image, (derivatives['model'], item.title),
+                     self._captioned, results)
+
+    def _uploaded(self, item, url, results):
+        item.image_url = url
+        self._branch_done(item, results)
+
+    def _captioned(self, item, caption, results):
+        if not caption:
+            self._fail(item, 'caption', RuntimeError('Caption generation failed'), results)
+            return
+        item.caption = caption
+        self._submit(item, 'voice', self.album.text_to_speech, (caption,),
+                     self._voiced, results)
+
+    def _voiced(self, item, audio, results):
+        item.audio = audio
+        self._branch_done(item, results)
+
+    def _branch_done(self, item, results):
+        if not item.branch_done():
+            return
+        if item.cached is not None:
+            outcome = dict(item.cached)
+        else:
+            outcome = {'caption': item.caption, 'audio': item.audio,
+                       'prompt_version': self.album.prompt_version,
+                       'voice_version': self.album.voice_version}
+        try:
+            if item.job is not None:
+                self.album.job_queue.confirm(item.job)
+            self.album.photo_db.update_photo(
+                item.photo_id, image_url=item.image_url, thumbnail=item.thumbnail,
+                variants=item.variants, status='ready', **outcome
+            )
+            if item.cached is None:
+                self.album.remember_result(item.photo_id)
+            if item.job is not None:
+                self.album.job_queue.finish(
+                    item.job, {'photo_id': item.photo_id, 'cached': item.cached is not None}
+                )
+        except Exception as e:
+            self._fail(item, 'store', e, results)
+            return
+        results.put(item.result('ready'))
+
+
+def iter_archive(fileobj, allowed_extensions, max_bytes=None):
+    """Yield ``(filename, data)`` for every image in a ZIP or tar archive.
+
+    ``fileobj`` must be seekable for ZIP files; tar archives (optionally
+    compressed) are read as a stream, one member at a time. Members whose
+    declared size is over ``max_bytes`` are not extracted and come with
+    ``data=None``.
+    """
+    def too_large(size):
+        return max_bytes is not None and size > max_bytes
+
+    def allowed(name):
+        path = PurePosixPath(name)
+        return (not path.name.startswith('.')
+                and path.suffix.lower().lstrip('.') in allowed_extensions)
+
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and allowed(info.filename):
+                    yield info.filename, None if too_large(info.file_size) else archive.read(info)
+        return
+
+    fileobj.seek(0)
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if member.isfile() and allowed(member.name):
+                yield member.name, (None if too_large(member.size)
+                                    else archive.extractfile(member).read())
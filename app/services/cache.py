@@ -0,0 +1,86 @@
+import hashlib
+import json
+import threading
+
+from app.services.imaging import hamming_distance
+from app.services.metrics import metrics
+
+
+class ResultCache:
+    """Caption and audio of photos already processed, kept in the photo store.
+
+    Entries live in the store's cache table (like the speech cache), so they
+    survive restarts and are shared by every worker; the store evicts the
+    least recently used ones over ``max_entries``. They are keyed by the
+    exact content hash of the upload plus the title and prompt version,
+    because both are folded into the caption prompt. When there is no exact
+    match, an entry whose perceptual hash is within ``max_distance`` bits
+    (same title and prompt version) counts as a near-duplicate hit, so a
+    re-saved or resized copy of a photo is reused too.
+    """
+
+    NAMESPACE = 'result'
+
+    def __init__(self, store, max_entries=1024, max_distance=6):
+        self.store = store
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prefix(title, prompt_version):
+        # Entries that may stand in for each other share a key prefix
+        payload = json.dumps([title, prompt_version])
+        return hashlib.sha256(payload.encode()).hexdigest()[:32] + ':'
+
+    def _count(self, outcome):
+        with self._lock:
+            if outcome == 'hit':
+                self.hits += 1
+            elif outcome == 'near_hit':
+                self.near_hits += 1
+            else:
+                self.misses += 1
+        metrics.cache_lookups.inc(cache=self.NAMESPACE, outcome=outcome)
+
+    def get(self, content_hash, image_dhash, title, prompt_version):
+        """Return the cached result for a photo, or ``None`` on a miss."""
+        prefix = self._prefix(title, prompt_version)
+        value = self.store.cache_get(self.NAMESPACE, prefix + content_hash)
+        if value is not None:
+            self._count('hit')
+            return json.loads(value)['result']
+
+        if image_dhash is not None and self.max_distance >= 0:
+            best_key, best_entry, best_distance = None, None, self.max_distance + 1
+            for key, value in self.store.cache_scan(self.NAMESPACE, prefix):
+                entry = json.loads(value)
+                if entry['dhash'] is None:
+                    continue
+                distance = hamming_distance(image_dhash, entry['dhash'])
+                if distance < best_distance:
+                    best_key, best_entry, best_distance = key, entry, distance
+            if best_key is not None:
+                # Mark it used, so near-duplicates keep their original cached
+                self.store.cache_get(self.NAMESPACE, best_key)
+                self._count('near_hit')
+                return best_entry['result']
+
+        self._count('miss')
+        return None
+
+    def put(self, content_hash, image_dhash, title, prompt_version, result):
+        """Remember ``result`` for a photo, evicting the least recently used entries."""
+        self.store.cache_put(
+            self.NAMESPACE,
+            self._prefix(title, prompt_version) + content_hash,
+            json.dumps({'dhash': image_dhash, 'result': result}),
+            self.max_entries
+        )
+
+    def stats(self):
+        """Lookups answered by this process since it started."""
+        return {'hits': self.hits, 'near_hits': self.near_hits, 'misses': self.misses}
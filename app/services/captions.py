@@ -0,0 +1,254 @@
+import base64
+import hashlib
+import logging
+import queue
+import threading
+import time
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+IMAGE_AGENT_SYSTEM_MESSAGE = """
+    You are a helpful assistant that recounts personal photographs for visually impaired persons. Talk in first person, as someone who is a part of the photo.
+    You take care of it being a human and emotional summary. Give names to people, describe the situation by making up some back story
+    for the picture and use that, it should be like a story rather than a description."""
+
+
+def caption_prompt(title):
+    """User turn sent alongside the image; the title is folded into the prompt."""
+    return f"This is the image. {title}" if title else "This is the image."
+
+
+def jpeg_data_uri(jpeg_data):
+    return f"data:image/jpeg;base64,{base64.b64encode(jpeg_data).decode()}"
+
+
+class CaptionEngine:
+    """Interface for caption generators.
+
+    Engines receive the image inline as a ``data:`` URI, so captioning never
+    waits on object storage. Implementations must be safe to call from many
+    threads at once.
+    """
+
+    def caption(self, image_uri, title):
+        """Return the full caption for the image."""
+        return ''.join(self.stream(image_uri, title))
+
+    def stream(self, image_uri, title):
+        """Yield caption text as it is produced; by default all at once."""
+        yield self.caption(image_uri, title)
+
+
+class OpenAIVisionEngine(CaptionEngine):
+    """Calls the OpenAI chat completions API directly with an inline image.
+
+    ``detail`` is passed through as the vision detail level; ``low`` bills a
+    fixed small number of tokens and is plenty for a story-like caption. The
+    client is built on first use so importing this module needs no
+    credentials.
+    """
+
+    def __init__(self, api_key=None, model='gpt-4o', temperature=0.95, max_tokens=300,
+                 detail='low', system_message=IMAGE_AGENT_SYSTEM_MESSAGE):
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.detail = detail
+        self.system_message = system_message
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI(api_key=self.api_key)
+            return self._client
+
+    def messages(self, image_uri, title):
+        return [
+            {'role': 'system', 'content': self.system_message},
+            {'role': 'user', 'content': [
+                {'type': 'text', 'text': caption_prompt(title)},
+                {'type': 'image_url', 'image_url': {'url': image_uri, 'detail': self.detail}},
+            ]},
+        ]
+
+    def caption(self, image_uri, title):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=self.messages(image_uri, title),
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+        )
+        return response.choices[0].message.content
+
+    def stream(self, image_uri, title):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=self.messages(image_uri, title),
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            stream=True,
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class AutogenCaptionEngine(CaptionEngine):
+    """The original autogen image agent, with one agent pair per concurrent caller.
+
+    autogen agents keep conversation state, so a pair is checked out of a
+    pool for the length of one chat. Pairs are created lazily up to
+    ``pool_size``; further callers wait for a free pair.
+    """
+
+    def __init__(self, api_key=None, model='gpt-4o', temperature=0.95, max_tokens=300,
+                 pool_size=4, system_message=IMAGE_AGENT_SYSTEM_MESSAGE):
+        self.llm_config = {
+            'config_list': [{'model': model, 'api_key': api_key}],
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+        }
+        self.pool_size = pool_size
+        self.system_message = system_message
+        self._pool = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _create_pair(self):
+        import autogen
+        from autogen.agentchat.contrib.multimodal_conversable_agent import MultimodalConversableAgent
+
+        image_agent = MultimodalConversableAgent(
+            name="image-summarizer",
+            system_message=self.system_message,
+            max_consecutive_auto_reply=10,
+            llm_config=self.llm_config,
+        )
+        user_proxy = autogen.UserProxyAgent(
+            name="User_proxy",
+            system_message="Please summarize the image for me, and explain it in detail.",
+            human_input_mode="NEVER",
+            max_consecutive_auto_reply=0,
+            code_execution_config={"use_docker": False},
+        )
+        return user_proxy, image_agent
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.pool_size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return self._create_pair()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._pool.get()
+
+    def caption(self, image_uri, title):
+        user_proxy, image_agent = pair = self._acquire()
+        try:
+            message = f"""This is the image
+            <img {image_uri}>. {title}""" if title else f"""This is the image
+            <img {image_uri}>."""
+            result = user_proxy.initiate_chat(image_agent, message=message, clear_history=True)
+            return result.summary
+        finally:
+            self._pool.put(pair)
+
+    def stream(self, image_uri, title):
+        yield self.caption(image_uri, title)
+
+
+class FakeCaptionEngine(CaptionEngine):
+    """Deterministic offline engine for tests, demos and benchmarks.
+
+    The caption depends only on the image bytes and the title; ``latency``
+    seconds are spread over the streamed words to mimic a real model.
+    """
+
+    SUBJECTS = ('Grandma', 'Uncle Raj', 'my sister Maya', 'our dog Biscuit', 'Dad')
+    PLACES = ('at the beach', 'in the garden', 'at the birthday party', 'on the mountain trail')
+    FEELINGS = ('laughing', 'quietly proud', 'a little sunburnt', 'completely happy')
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def caption(self, image_uri, title):
+        if self.latency:
+            time.sleep(self.latency)
+        return ''.join(self._words(image_uri, title))
+
+    def stream(self, image_uri, title):
+        words = self._words(image_uri, title)
+        for word in words:
+            if self.latency:
+                time.sleep(self.latency / len(words))
+            yield word
+
+    def _words(self, image_uri, title):
+        seed = hashlib.sha256(f"{image_uri}|{title}".encode()).digest()
+        subject = self.SUBJECTS[seed[0] % len(self.SUBJECTS)]
+        place = self.PLACES[seed[1] % len(self.PLACES)]
+        feeling = self.FEELINGS[seed[2] % len(self.FEELINGS)]
+        text = f"I remember this day {place} with {subject}. We were all {feeling}."
+        if title:
+            text += f" {title.strip().rstrip('.')}."
+        words = text.split(' ')
+        return [word if i == len(words) - 1 else f"{word} " for i, word in enumerate(words)]
+
+
+class GuardedCaptionEngine(CaptionEngine):
+    """Runs another engine's calls through an :class:`~app.services.upstream.Upstream`.
+
+    ``cost`` is the token estimate drawn from the provider's tokens-per-minute
+    bucket for each caption: the prompt and image plus ``max_tokens``.
+    """
+
+    def __init__(self, engine, upstream, cost=1):
+        self.engine = engine
+        self.upstream = upstream
+        self.cost = cost
+
+    @property
+    def client(self):
+        return getattr(self.engine, 'client', None)
+
+    def caption(self, image_uri, title):
+        with metrics.time('caption'):
+            return self.upstream.call(self.engine.caption, image_uri, title, cost=self.cost)
+
+    def stream(self, image_uri, title):
+        with metrics.time('caption'):
+            yield from self.upstream.stream(self.engine.stream, image_uri, title, cost=self.cost)
+
+
+def create_caption_engine(config):
+    """Build the engine named by ``CAPTION_ENGINE`` in ``config``."""
+    engine = config.get('CAPTION_ENGINE', 'openai')
+    if engine == 'fake':
+        return FakeCaptionEngine(latency=config.get('CAPTION_FAKE_LATENCY', 0.0))
+    options = {
+        'api_key': config.get('OPENAI_API_KEY'),
+        'model': config.get('CAPTION_MODEL', 'gpt-4o'),
+        'temperature': config.get('CAPTION_TEMPERATURE', 0.95),
+        'max_tokens': config.get('CAPTION_MAX_TOKENS', 300),
+    }
+    if engine == 'openai':
+        return OpenAIVisionEngine(detail=config.get('CAPTION_IMAGE_DETAIL', 'low'), **options)
+    if engine == 'autogen':
+        return AutogenCaptionEngine(pool_size=config.get('CAPTION_AGENT_POOL_SIZE', 4), **options)
+    raise ValueError(f"Unknown caption engine: {engine}")
@@ -0,0 +1,55 @@
+import threading
+import time
+
+
+class ChangeFeed:
+    """The album's change log, with waiting for changes that have not happened yet.
+
+    Readers hold a version and ask for what was written after it. Writes in
+    this process wake waiters at once through ``photo_db.changed``; writes by
+    other workers are noticed by re-reading the album version every
+    ``poll_interval`` seconds.
+    """
+
+    def __init__(self, photo_db, poll_interval=1.0):
+        self.photo_db = photo_db
+        self.poll_interval = poll_interval
+
+    def page(self, since, limit):
+        """``(changes, version, has_more)``: up to ``limit`` changes after ``since``.
+
+        ``version`` is the cursor for the next call: the version of the last
+        change returned, or ``since`` when there was none.
+        """
+        changes = self.photo_db.changes_since(since, limit + 1)
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        return changes, changes[-1][2] if changes else since, has_more
+
+    def wait(self, since, timeout):
+        """Block until the album moves past ``since``; False on timeout."""
+        deadline = time.monotonic() + timeout
+        changed = self.photo_db.changed
+        while self.photo_db.version() <= since:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            with changed:
+                changed.wait(min(self.poll_interval, remaining))
+        return True
+
+    def follow(self, since, limit, heartbeat=15.0, stop=None):
+        """Yield ``(changes, version)`` batches as they happen, forever.
+
+        An empty batch is yielded after ``heartbeat`` quiet seconds so the
+        caller can keep its connection alive. Stops when ``stop`` is set.
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            changes, since, has_more = self.page(since, limit)
+            if changes:
+                yield changes, since
+                if has_more:
+                    continue
+            if not self.wait(since, heartbeat) and not stop.is_set():
+                yield [], since
@@ -0,0 +1,62 @@
+import os
+import threading
+
+
+class LazyClient:
+    """Build an upstream client on first use and cache it per process.
+
+    SDK clients hold sockets and threads that must not be shared across a
+    fork, so a worker process that inherits a built client builds its own.
+    Calling the instance returns the client.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._client = self.factory()
+                    self._pid = pid
+        return self._client
+
+    @property
+    def built(self):
+        return self._pid == os.getpid()
+
+
+def google_tts_client():
+    from google.cloud import texttospeech
+
+    return texttospeech.TextToSpeechClient()
+
+
+def s3_client(config):
+    """Factory for the S3 client described by ``config``.
+
+    The connection pool is sized for the concurrent uploads and multipart
+    parts in flight, and throttling or transient errors are retried with
+    botocore's adaptive, backed-off retry mode.
+    """
+    def build():
+        import boto3
+        from botocore.config import Config
+
+        return boto3.client(
+            's3',
+            aws_access_key_id=config.get('AWS_ID'),
+            aws_secret_access_key=config.get('AWS_KEY'),
+            region_name=config.get('S3_REGION'),
+            config=Config(
+                max_pool_connections=config.get('STORAGE_MAX_POOL_CONNECTIONS', 32),
+                retries={'max_attempts': config.get('STORAGE_MAX_ATTEMPTS', 5), 'mode': 'adaptive'},
+                connect_timeout=config.get('STORAGE_CONNECT_TIMEOUT', 5),
+                read_timeout=config.get('STORAGE_READ_TIMEOUT', 30)
+            )
+        )
+    return build
@@ -0,0 +1,72 @@
+import bisect
+from functools import partial
+
+from app.services.imaging import (
+    IMAGE_FORMATS, JPEG_QUALITY, STORAGE_IMAGE_SIZE, render_variant, supported_formats, variant_key,
+)
+from app.services.metrics import metrics
+
+DEFAULT_WIDTHS = (320, 960, 1920)
+DEFAULT_FORMATS = ('webp', 'jpeg')
+
+
+class Derivatives:
+    """Responsive sizes and encodings of album photos.
+
+    A derivative is identified by a width from ``widths`` (the longest edge,
+    never beyond ``max_size``) and a format from ``formats``. Derivatives
+    rendered at ingest are stored on the photo record under ``variants``;
+    any other combination is rendered from the original on first request,
+    on ``executor`` when given, and stored the same way, so it is rendered
+    only once.
+    """
+
+    def __init__(self, photo_db, widths=DEFAULT_WIDTHS, formats=DEFAULT_FORMATS,
+                 max_size=STORAGE_IMAGE_SIZE, quality=JPEG_QUALITY, executor=None):
+        self.photo_db = photo_db
+        self.widths = tuple(sorted(set(widths)))
+        self.formats = supported_formats(formats)
+        if not self.widths or not self.formats:
+            raise ValueError('At least one derivative width and format is required')
+        self.executor = executor
+        self._render = partial(render_variant, max_size=tuple(max_size), quality=quality)
+
+    def pick_width(self, requested):
+        """Smallest configured width that covers ``requested`` pixels."""
+        try:
+            requested = int(requested)
+        except (TypeError, ValueError):
+            raise ValueError('w must be a positive integer')
+        if requested <= 0:
+            raise ValueError('w must be a positive integer')
+        index = bisect.bisect_left(self.widths, requested)
+        return self.widths[min(index, len(self.widths) - 1)]
+
+    def negotiate(self, accept):
+        """Pick the best format for a parsed ``Accept`` header (``request.accept_mimetypes``).
+
+        Formats the client rates equally go by the order of ``formats``;
+        clients that accept none of them get the last (most compatible) one.
+        """
+        mimetypes = [self.mimetype(f) for f in self.formats]
+        best = accept.best_match(mimetypes, default=mimetypes[-1])
+        return self.formats[mimetypes.index(best)]
+
+    @staticmethod
+    def mimetype(image_format):
+        return IMAGE_FORMATS[image_format][1]
+
+    def get(self, photo_id, photo, width, image_format):
+        """Blob digest of a derivative, rendering and storing it if needed."""
+        key = variant_key(width, image_format)
+        digest = (photo.get('variants') or {}).get(key)
+        if digest and self.photo_db.blobs.exists(digest):
+            return digest
+
+        original = self.photo_db.blobs.read(photo['image_blob'])
+        with metrics.time('derivative', size=len(original)):
+            if self.executor is not None:
+                data = self.executor.submit(self._render, original, width, image_format).result()
+            else:
+                data = self._render(original, width, image_format)
+        return self.photo_db.add_variants(photo_id, {key: data})[key]
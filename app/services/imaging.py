@@ -0,0 +1,146 @@
+import io
+import numpy as np
+from PIL import Image
+
+MODEL_IMAGE_SIZE = (512, 512)
+STORAGE_IMAGE_SIZE = (1920, 1080)
+THUMBNAIL_SIZE = (320, 320)
+JPEG_QUALITY = 80
+
+EXIF_ORIENTATION = 0x0112
+# EXIF orientation -> transpose that puts the image upright
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+# Derivative encodings: PIL format, mimetype and save options
+IMAGE_FORMATS = {
+    'avif': ('AVIF', 'image/avif', {'speed': 8}),
+    'webp': ('WEBP', 'image/webp', {'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'optimize': True, 'progressive': True}),
+}
+
+
+def encode_jpeg(image, quality=JPEG_QUALITY):
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=quality, optimize=True)
+    return buffered.getvalue()
+
+
+def encode_image(image, image_format, quality=JPEG_QUALITY):
+    """Encode ``image`` as one of :data:`IMAGE_FORMATS`."""
+    pil_format, _, options = IMAGE_FORMATS[image_format]
+    buffered = io.BytesIO()
+    image.save(buffered, format=pil_format, quality=quality, **options)
+    return buffered.getvalue()
+
+
+def supported_formats(formats):
+    """The subset of ``formats`` this Pillow build can encode, in order.
+
+    Looks for a registered encoder: ``PIL.features`` does not know AVIF
+    before Pillow 11.3 and cannot see plugins such as ``pillow-avif-plugin``.
+    """
+    Image.init()
+    return tuple(f for f in formats if f in IMAGE_FORMATS and IMAGE_FORMATS[f][0] in Image.SAVE)
+
+
+def variant_key(width, image_format):
+    """Name of a derivative in a photo's ``variants`` map, e.g. ``320.webp``."""
+    return f"{width}.{image_format}"
+
+
+def _open_upright(image_data, box):
+    """Open an image, draft-decoded to cover ``box``, and return ``(image, width, height)``.
+
+    ``box`` is given for the upright image; ``width`` and ``height`` are the
+    upright size of the original.
+    """
+    image = Image.open(io.BytesIO(image_data))
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    width, height = image.size
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+        box = box[::-1]
+    image.draft('RGB', box)
+
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    if orientation in ORIENTATION_TRANSPOSE:
+        image = image.transpose(ORIENTATION_TRANSPOSE[orientation])
+    return image, width, height
+
+
+def preprocess_image(image_data, model_size=MODEL_IMAGE_SIZE, storage_size=STORAGE_IMAGE_SIZE,
+                     thumbnail_size=THUMBNAIL_SIZE, quality=JPEG_QUALITY,
+                     variant_widths=(), variant_formats=()):
+    """Decode an upload once and return every JPEG derivative the pipeline needs.
+
+    JPEGs are decoded with ``draft()`` straight at the smallest DCT scale
+    (1/2, 1/4 or 1/8) that still covers the largest derivative, so a 24MP
+    photo never materialises at full size. EXIF orientation is applied once
+    on the reduced frame, then each derivative is produced from the previous
+    one, largest first, with in-place ``thumbnail`` calls.
+
+    Returns a dict with ``storage``, ``model`` and ``thumbnail`` JPEG bytes
+    plus the upright ``width`` and ``height`` of the original. With
+    ``variant_widths`` and ``variant_formats`` it also renders the responsive
+    derivatives from the same decode, under ``variants`` keyed by
+    :func:`variant_key`; these fit the longest edge to the width and never
+    exceed ``storage_size``. Takes and returns plain bytes so it can run in a
+    process pool.
+    """
+    targets = [
+        ('storage', storage_size, None),
+        ('model', model_size, None),
+        ('thumbnail', thumbnail_size, None),
+    ] + [
+        (variant_key(w, f), (min(w, storage_size[0]), min(w, storage_size[1])), f)
+        for w in variant_widths for f in variant_formats
+    ]
+    targets.sort(key=lambda target: target[1][0] * target[1][1], reverse=True)
+    image, width, height = _open_upright(image_data, targets[0][1])
+
+    derivatives = {'width': width, 'height': height}
+    if variant_widths and variant_formats:
+        derivatives['variants'] = {}
+    for name, size, image_format in targets:
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        if image_format is None:
+            derivatives[name] = encode_jpeg(image, quality)
+        else:
+            derivatives['variants'][name] = encode_image(image, image_format, quality)
+    return derivatives
+
+
+def render_variant(image_data, width, image_format, max_size=STORAGE_IMAGE_SIZE,
+                   quality=JPEG_QUALITY):
+    """Render one responsive derivative on demand, with a draft-mode decode."""
+    box = (min(width, max_size[0]), min(width, max_size[1]))
+    image, _, _ = _open_upright(image_data, box)
+    image.thumbnail(box, Image.Resampling.LANCZOS)
+    return encode_image(image, image_format, quality)
+
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash of a PIL image, robust to re-encoding and resizing.
+
+    JPEGs are decoded in draft mode at a fraction of their size first, since
+    only a ``(hash_size + 1) x hash_size`` grayscale thumbnail is needed.
+    """
+    image.draft('L', (hash_size * 8, hash_size * 8))
+    gray = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
@@ -0,0 +1,133 @@
+import io
+import threading
+from contextlib import contextmanager
+from pathlib import PurePosixPath
+
+from PIL import Image, UnidentifiedImageError
+
+from app.services.metrics import metrics
+
+
+class UploadRejected(ValueError):
+    """An upload that will not be accepted as sent.
+
+    ``status`` is the HTTP status to answer with: 413 for files or images
+    that are too large, 415 for disallowed types, 400 for anything unreadable.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class IngestBusy(Exception):
+    """Too much decode memory is reserved by other uploads; retry shortly."""
+
+
+def image_formats(extensions):
+    """PIL format names for file extensions such as ``{'jpg', 'png'}``."""
+    registered = Image.registered_extensions()
+    return frozenset(
+        registered[f'.{ext.lower()}'] for ext in extensions if f'.{ext.lower()}' in registered
+    )
+
+
+def decode_bytes(image):
+    """Memory a decode of ``image`` takes at its current size, after any ``draft()``.
+
+    Counts the decoded frame plus one single-band working copy, as the
+    perceptual hash makes.
+    """
+    width, height = image.size
+    return width * height * (len(image.getbands()) + 1)
+
+
+class UploadPolicy:
+    """What an upload must look like before any of it is decoded.
+
+    :meth:`open` reads only the image header: the file extension (when the
+    client sent one) and the detected format must be in
+    ``allowed_extensions``, the file must fit in ``max_bytes`` and the image
+    in ``max_pixels``, which stops decompression bombs before they expand.
+    ``None`` disables a limit.
+    """
+
+    def __init__(self, allowed_extensions, max_bytes=None, max_pixels=None):
+        self.allowed_extensions = {ext.lower() for ext in allowed_extensions}
+        self.allowed_formats = image_formats(allowed_extensions)
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+
+    def check_size(self, size):
+        if self.max_bytes is not None and size > self.max_bytes:
+            raise UploadRejected(f"File is {size} bytes; at most {self.max_bytes} are accepted", 413)
+
+    def check_filename(self, filename):
+        suffix = PurePosixPath(filename or '').suffix.lower().lstrip('.')
+        if suffix and suffix not in self.allowed_extensions:
+            raise UploadRejected(f"File type .{suffix} is not allowed", 415)
+
+    def open(self, source, filename=None):
+        """Lazily open the seekable binary file ``source`` once it passes every check.
+
+        Returns the PIL image with nothing but its header read.
+        """
+        self.check_filename(filename)
+        self.check_size(source.seek(0, io.SEEK_END))
+        source.seek(0)
+        try:
+            image = Image.open(source)
+        except Image.DecompressionBombError as e:
+            raise UploadRejected(str(e), 413) from e
+        except (UnidentifiedImageError, OSError, SyntaxError) as e:
+            raise UploadRejected('Not a readable image') from e
+
+        if image.format not in self.allowed_formats:
+            raise UploadRejected(f"Image format {image.format} is not allowed", 415)
+        width, height = image.size
+        if self.max_pixels is not None and width * height > self.max_pixels:
+            raise UploadRejected(
+                f"Image is {width}x{height}; at most {self.max_pixels} pixels are accepted", 413
+            )
+        return image
+
+
+class MemoryBudget:
+    """Caps the decode memory that uploads in this process may hold at once.
+
+    Each decode reserves its estimated size (see :func:`decode_bytes`) and
+    waits up to ``timeout`` seconds for room, so concurrent large uploads
+    queue rather than exhaust the worker; :class:`IngestBusy` is raised if
+    room does not appear in time. ``peak`` is the most ever reserved.
+    ``limit=None`` only keeps the accounting.
+    """
+
+    def __init__(self, limit=None, timeout=5.0):
+        self.limit = limit
+        self.timeout = timeout
+        self.in_use = 0
+        self.peak = 0
+        self._room = threading.Condition()
+
+    @contextmanager
+    def reserve(self, amount):
+        if self.limit is not None and amount > self.limit:
+            raise UploadRejected(f"Image needs {amount} bytes to decode; the limit is {self.limit}", 413)
+        metrics.upload_decode_bytes.observe(amount)
+        with self._room:
+            if self.limit is not None and not self._room.wait_for(
+                    lambda: self.in_use + amount <= self.limit, self.timeout):
+                raise IngestBusy(f"{self.in_use} bytes of decode memory in use")
+            self.in_use += amount
+            self.peak = max(self.peak, self.in_use)
+            metrics.upload_memory.set(self.in_use)
+        try:
+            yield
+        finally:
+            with self._room:
+                self.in_use -= amount
+                metrics.upload_memory.set(self.in_use)
+                self._room.notify_all()
+
+    def stats(self):
+        return {'limit': self.limit, 'in_use': self.in_use, 'peak': self.peak}
@@ -0,0 +1,280 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+CAPTIONING = 'captioning'
+VOICING = 'voicing'
+DEFERRED = 'deferred'
+DONE = 'done'
+FAILED = 'failed'
+JOB_STATES = (QUEUED, CAPTIONING, VOICING, DEFERRED, DONE, FAILED)
+
+
+class QueueFull(Exception):
+    """Raised when the job queue is at its backpressure limit."""
+
+
+class LeaseLost(Exception):
+    """Raised when another worker has reclaimed a job this worker is still running."""
+
+
+class Deferred(Exception):
+    """Raised by a handler to have its job run again in ``retry_after`` seconds."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """Bounded worker pool for background photo processing.
+
+    Job records live in the photo store, so a job accepted by one process is
+    visible to every worker and is picked up again after a crash: a
+    heartbeat refreshes ``updated_at`` on running jobs every
+    ``lease_seconds / 4``, and any unfinished job left untouched for
+    ``lease_seconds`` is reclaimed by the reaper. Each run holds the job
+    under its own ``owner`` token, and every write is conditional on it, so
+    a run whose job was reclaimed (say, after a long stall) cannot overwrite
+    the new run's record.
+
+    ``handler(job, set_state)`` does the actual work; it calls
+    ``set_state(state)`` as it moves between stages so per-stage timings are
+    recorded, and returns normally on success (its return value is kept as
+    the job's ``result``) or raises on failure. Calling
+    ``set_state`` with the current state only confirms the lease; handlers
+    do so right before writing results. Either raises :class:`LeaseLost`
+    once the job belongs to another worker. A handler that raises
+    :class:`Deferred` leaves its job ``deferred``; the reaper runs it again
+    once ``retry_after`` has passed.
+
+    Work that runs elsewhere (the batch pipeline) records its jobs with
+    :meth:`attach`: the heartbeat holds them the same way, so if this
+    process dies the reaper runs them again with ``handler``.
+    """
+
+    def __init__(self, store, handler, max_workers=4, max_pending=32, lease_seconds=120):
+        self.store = store
+        self.handler = handler
+        self.max_pending = max_pending
+        self.lease_seconds = lease_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='photo-job')
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reaper = None
+        # Jobs running in this process, kept alive by the heartbeat
+        self._running = {}
+        self._lost = set()
+        self._running_lock = threading.Lock()
+        self._heartbeat = None
+
+    @property
+    def pending(self):
+        """Jobs accepted by this process that have not finished yet."""
+        return self._pending
+
+    def submit(self, payload):
+        """Persist a new job and schedule it; raises :class:`QueueFull` when saturated."""
+        with self._pending_lock:
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"{self._pending} jobs already pending")
+            self._pending += 1
+
+        job = self._new_job(payload, QUEUED)
+        try:
+            self.store.save_job(job['id'], job)
+            self._executor.submit(self._run, job)
+        except Exception:
+            self._release()
+            raise
+        return job
+
+    def defer(self, payload, retry_after=None, error=None):
+        """Persist a job to be run by the reaper in ``retry_after`` seconds.
+
+        Unlike :meth:`submit` this never raises :class:`QueueFull`: nothing
+        runs now, so it takes no slot until the job is picked up.
+        """
+        job = self._new_job(payload, DEFERRED)
+        job['error'] = error
+        self._delay(job, retry_after)
+        self.store.save_job(job['id'], job)
+        return job
+
+    def attach(self, payload):
+        """Persist a job the caller runs itself, and hold its lease until it settles.
+
+        Report the outcome with :meth:`finish`, :meth:`fail` or
+        :meth:`postpone`; call :meth:`confirm` before writing results.
+        Takes no slot in the pool.
+        """
+        job = self._new_job(payload, CAPTIONING)
+        self.store.save_job(job['id'], job)
+        self._track(job)
+        return job
+
+    def confirm(self, job):
+        """Raise :class:`LeaseLost` unless this process still holds ``job``."""
+        self._set_state(job, job['state'])
+
+    def finish(self, job, result=None):
+        """Record ``job`` as done with ``result``."""
+        try:
+            job['result'] = result
+            self._set_state(job, DONE)
+        finally:
+            self._untrack(job)
+
+    def fail(self, job, error):
+        """Record ``job`` as failed with ``error``."""
+        try:
+            self._set_state(job, FAILED, error=str(error))
+        finally:
+            self._untrack(job)
+
+    def postpone(self, job, retry_after=None, error=None):
+        """Leave ``job`` deferred, for the reaper to run again in ``retry_after`` seconds."""
+        try:
+            self._set_state(job, DEFERRED, error=error)
+        finally:
+            # Off the heartbeat, so the backdated time below stays
+            self._untrack(job)
+        self._delay(job, retry_after)
+        self.store.save_job(job['id'], job, owner=job['owner'])
+
+    def _new_job(self, payload, state):
+        now = time.time()
+        return {
+            'id': uuid.uuid4().hex,
+            'state': state,
+            'payload': payload,
+            'created_at': now,
+            'updated_at': now,
+            'stages': {state: {'started_at': now}},
+            'error': None,
+            'result': None,
+            'owner': uuid.uuid4().hex,
+        }
+
+    def _delay(self, job, retry_after):
+        # The reaper picks up jobs idle for lease_seconds, so backdate the
+        # record to make it due in retry_after seconds instead
+        delay = self.lease_seconds if retry_after is None else retry_after
+        job['updated_at'] = time.time() + min(delay, self.lease_seconds) - self.lease_seconds
+
+    def get(self, job_id):
+        return self.store.get_job(job_id)
+
+    def resume(self):
+        """Reclaim unfinished jobs whose lease has expired and run them again."""
+        now = time.time()
+        resumed = 0
+        owner = uuid.uuid4().hex
+        for job in self.store.claim_stale_jobs(now - self.lease_seconds, now, owner):
+            with self._pending_lock:
+                if self._pending >= self.max_pending:
+                    # Leave the rest for the next sweep (or another worker)
+                    job['updated_at'] = 0
+                    self.store.save_job(job['id'], job, owner=owner)
+                    continue
+                self._pending += 1
+            logger.info(f"Resuming job {job['id']} from state {job['state']}")
+            self._executor.submit(self._run, job)
+            resumed += 1
+        return resumed
+
+    def start(self):
+        """Resume stalled jobs now and keep sweeping for them in the background."""
+        self.resume()
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap, name='photo-job-reaper', daemon=True)
+            self._reaper.start()
+
+    def shutdown(self, wait=True):
+        self._stop.set()
+        self._executor.shutdown(wait=wait)
+
+    def _reap(self):
+        while not self._stop.wait(self.lease_seconds / 2):
+            try:
+                self.resume()
+            except Exception as e:
+                logger.error(f"Error resuming jobs: {str(e)}")
+
+    def _release(self):
+        with self._pending_lock:
+            self._pending -= 1
+
+    def _track(self, job):
+        with self._running_lock:
+            self._running[job['id']] = job
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(
+                    target=self._beat, name='photo-job-heartbeat', daemon=True
+                )
+                self._heartbeat.start()
+
+    def _untrack(self, job):
+        with self._running_lock:
+            self._running.pop(job['id'], None)
+            self._lost.discard(job['id'])
+
+    def _beat(self):
+        while not self._stop.wait(self.lease_seconds / 4):
+            with self._running_lock:
+                running = [(job['id'], job['owner']) for job in self._running.values()]
+            for job_id, owner in running:
+                try:
+                    if not self.store.renew_job(job_id, owner, time.time()):
+                        with self._running_lock:
+                            self._lost.add(job_id)
+                except Exception as e:
+                    logger.error(f"Error renewing job {job_id}: {str(e)}")
+
+    def _set_state(self, job, state, error=None):
+        if job['id'] in self._lost:
+            raise LeaseLost(f"Job {job['id']} was reclaimed by another worker")
+        now = time.time()
+        if state == job['state'] and state not in (DONE, FAILED):
+            # Same stage: only confirm this run still holds the job
+            if not self.store.renew_job(job['id'], job['owner'], now):
+                raise LeaseLost(f"Job {job['id']} was reclaimed by another worker")
+            job['updated_at'] = now
+            return
+        current = job['stages'].get(job['state'])
+        if current is not None and 'seconds' not in current:
+            current['seconds'] = round(now - current['started_at'], 4)
+        if state not in (DONE, FAILED):
+            job['stages'][state] = {'started_at': now}
+        job['state'] = state
+        job['updated_at'] = now
+        job['error'] = error
+        if not self.store.save_job(job['id'], job, owner=job['owner']):
+            raise LeaseLost(f"Job {job['id']} was reclaimed by another worker")
+
+    def _run(self, job):
+        self._track(job)
+        try:
+            try:
+                result = self.handler(job, lambda state: self._set_state(job, state))
+                self.finish(job, result)
+            except Deferred as e:
+                logger.warning(f"Job {job['id']} deferred: {str(e)}")
+                self.postpone(job, e.retry_after, str(e))
+            except LeaseLost:
+                raise
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {str(e)}")
+                self.fail(job, e)
+        except LeaseLost as e:
+            # The job's new owner records its outcome
+            logger.warning(f"Abandoning job {job['id']}: {str(e)}")
+        finally:
+            self._untrack(job)
+            self._release()
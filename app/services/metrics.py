@@ -0,0 +1,238 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers a cached DB read up to a slow vision-model call
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Bytes; thumbnails up to full-size uploads
+SIZE_BUCKETS = tuple(2 ** n for n in range(10, 26, 2))
+# Bytes; decoding a thumbnail-sized draft up to a full-resolution PNG
+MEMORY_BUCKETS = tuple(2 ** n for n in range(16, 32, 2))
+
+# Stage timings of the request being handled on this thread, for Server-Timing
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named family of samples, one per combination of label values."""
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram, as Prometheus expects."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ((0,) * (len(self.buckets) + 1), 0.0))
+            # Copy on write, so render() never sees a half-updated sample
+            counts = list(counts)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(self._key(labels), ((), 0.0))
+        return sum(counts)
+
+    def _samples(self, key, value):
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float('inf')), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, key)
+        yield f"{self.name}_sum{labels} {_format_value(total)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Metrics:
+    """The album's metrics, rendered in the Prometheus text format.
+
+    Values are per process: with several workers, scrape each one (or put
+    them behind a per-worker port) and let Prometheus aggregate.
+    """
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        # Callables given every (stage, seconds) observation, e.g. by benchmarks
+        # that need exact percentiles rather than buckets
+        self.listeners = []
+        self.stage_seconds = Histogram(
+            'album_stage_seconds', 'Latency of hot-path stages', ['stage'])
+        self.stage_in_flight = Gauge(
+            'album_stage_in_flight', 'Stage calls currently running', ['stage'])
+        self.stage_errors = Counter(
+            'album_stage_errors_total', 'Stage calls that raised', ['stage'])
+        self.payload_bytes = Histogram(
+            'album_payload_bytes', 'Size of payloads moved by each stage', ['stage'],
+            buckets=SIZE_BUCKETS)
+        self.upstream_errors = Counter(
+            'album_upstream_errors_total', 'Failed calls to upstream providers',
+            ['provider', 'reason'])
+        self.circuit_state = Gauge(
+            'album_upstream_circuit_state', 'Circuit breaker state: 0 closed, 1 half-open, 2 open',
+            ['provider'])
+        self.upload_decode_bytes = Histogram(
+            'album_upload_decode_bytes', 'Estimated memory each upload needed to decode',
+            buckets=MEMORY_BUCKETS)
+        self.upload_memory = Gauge(
+            'album_upload_memory_bytes', 'Decode memory currently reserved by uploads')
+        self.cache_lookups = Counter(
+            'album_cache_lookups_total', 'Cache lookups by outcome (hit, near_hit, miss)',
+            ['cache', 'outcome'])
+        self.jobs_pending = Gauge(
+            'album_jobs_pending', 'Background jobs accepted by this process and not finished')
+        self.http_seconds = Histogram(
+            'album_http_request_seconds', 'Time to build each HTTP response',
+            ['method', 'endpoint', 'status'])
+
+    def metrics(self):
+        return [value for value in vars(self).values() if isinstance(value, Metric)]
+
+    @contextmanager
+    def time(self, stage, size=None):
+        """Time the enclosed block as ``stage``, tracking in-flight calls and errors.
+
+        ``size`` (bytes) is recorded in the payload histogram. The duration
+        is also added to the current request's ``Server-Timing``.
+        """
+        if size is not None:
+            self.payload_bytes.observe(size, stage=stage)
+        self.stage_in_flight.inc(stage=stage)
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.stage_errors.inc(stage=stage)
+            raise
+        finally:
+            self.stage_in_flight.dec(stage=stage)
+            self.observe(stage, time.perf_counter() - started)
+
+    def observe(self, stage, seconds):
+        """Record a stage duration measured elsewhere."""
+        self.stage_seconds.observe(seconds, stage=stage)
+        for listener in self.listeners:
+            listener(stage, seconds)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, seconds))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def start_request_timings():
+    """Collect stage timings on this thread until :func:`server_timing` is called."""
+    _request_timings.set([])
+
+
+def server_timing(total=None):
+    """``Server-Timing`` header value for the stages timed in this request.
+
+    Repeated stages are summed and reported with their count.
+    """
+    timings = _request_timings.get() or []
+    _request_timings.set(None)
+    merged = {}
+    for stage, seconds in timings:
+        spent, count = merged.get(stage, (0.0, 0))
+        merged[stage] = (spent + seconds, count + 1)
+    entries = [
+        f'{stage};dur={spent * 1000:.1f}' + (f';desc="x{count}"' if count > 1 else '')
+        for stage, (spent, count) in merged.items()
+    ]
+    if total is not None:
+        entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+# Process-wide registry; instrumented code imports this
+metrics = Metrics()
@@ -0,0 +1,305 @@
+import hashlib
+import math
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process per index path
+    fcntl = None
+
+from app.models.search import STOPWORDS, stem, tokenize
+
+# Rows scored per matrix product; bounds the temporary memory of a query
+BATCH_ROWS = 65536
+# Initial row capacity; the matrix doubles when it fills up
+INITIAL_CAPACITY = 1024
+
+
+def _bucket(feature, buckets):
+    digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % buckets
+
+
+def features(text):
+    """Weighted sparse features of ``text``: word stems plus their character trigrams.
+
+    Trigrams let related word forms ("grandma", "grandmother") overlap even
+    when their stems differ. Each word contributes a total weight of 2.
+    """
+    weights = {}
+    for token in tokenize(text):
+        if token in STOPWORDS:
+            continue
+        word = stem(token)
+        weights[f"w:{word}"] = weights.get(f"w:{word}", 0.0) + 1.0
+        padded = f"#{token}#"
+        grams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+        for gram in grams:
+            weights[f"g:{gram}"] = weights.get(f"g:{gram}", 0.0) + 1.0 / len(grams)
+    return weights
+
+
+class SemanticIndex:
+    """Offline caption similarity search over a memory-mapped float32 matrix.
+
+    Captions are embedded locally: hashed TF-IDF features (see
+    :func:`features`) are projected to ``dim`` dimensions by a fixed random
+    matrix, which keeps cosine similarity roughly intact while making every
+    vector small and dense. Vectors are rows of one contiguous matrix; a
+    query is a batched matrix-vector product plus ``argpartition`` for the
+    top k.
+
+    With a ``path`` the matrix, document frequencies and row ids live in
+    files there and survive restarts; without one everything is in memory.
+    ``add`` updates the index in place, one photo at a time. Document
+    frequencies count the first text indexed for each photo, so re-indexing
+    a photo only replaces its vector.
+
+    Several processes may share a ``path``: writers take a file lock and
+    append at the row count of the ids file, and every instance picks up
+    rows added elsewhere before it writes or searches.
+    """
+
+    def __init__(self, path=None, dim=128, buckets=2 ** 15, seed=0):
+        self.path = Path(path) if path else None
+        self.dim = dim
+        self.buckets = buckets
+        self.seed = seed
+        self._projection = None
+        self._ids = []
+        self._rows = {}
+        self._lock = threading.Lock()
+        self._documents = 0
+        if self.path is None:
+            self._df = np.zeros(buckets, dtype=np.float64)
+            self._matrix = np.zeros((INITIAL_CAPACITY, dim), dtype=np.float32)
+            return
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock_file = (self.path / 'lock').open('a')
+        self._ids_path = self.path / 'ids.txt'
+        # Inode and byte length of the ids file loaded so far
+        self._ids_seen = (None, 0)
+        self._df = self._open_map('df.f64', np.float64, (buckets,))
+        self._matrix = self._open_map('vectors.f32', np.float32, (INITIAL_CAPACITY, dim))
+        with self._lock:
+            self._reload()
+
+    def __len__(self):
+        with self._lock:
+            self._reload()
+            return len(self._ids)
+
+    @property
+    def projection(self):
+        """The ``buckets x dim`` random projection, generated on first use."""
+        if self._projection is None:
+            projection = np.random.default_rng(self.seed).standard_normal(
+                (self.buckets, self.dim), dtype=np.float32)
+            self._projection = projection / np.float32(math.sqrt(self.dim))
+        return self._projection
+
+    def _open_map(self, name, dtype, shape):
+        file = self.path / name
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(file, 'ab') as handle:
+            if handle.tell() < size:
+                handle.truncate(size)
+        return np.memmap(file, dtype=dtype, mode='r+', shape=shape)
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize writers across the processes sharing ``path``."""
+        if self.path is None or fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _reload(self):
+        """Load ids appended to the ids file by other processes; hold ``_lock``.
+
+        A rebuild replaces the file, so a new inode means starting over.
+        """
+        if self.path is None:
+            return
+        try:
+            stat = self._ids_path.stat()
+        except FileNotFoundError:
+            return
+        inode, offset = self._ids_seen
+        if stat.st_ino != inode:
+            self._ids, self._rows, offset = [], {}, 0
+        elif stat.st_size <= offset:
+            return
+        with self._ids_path.open('rb') as handle:
+            handle.seek(offset)
+            data = handle.read()
+        # A writer may be half way through a line
+        data = data[:data.rfind(b'\n') + 1]
+        for photo_id in data.decode().splitlines():
+            self._rows[photo_id] = len(self._ids)
+            self._ids.append(photo_id)
+        self._ids_seen = (stat.st_ino, offset + len(data))
+        self._documents = len(self._ids)
+        self._grow(len(self._ids))
+
+    def _append_ids(self, photo_ids):
+        """Give ``photo_ids`` the next rows; hold ``_lock`` and the file lock."""
+        for photo_id in photo_ids:
+            self._rows[photo_id] = len(self._ids)
+            self._ids.append(photo_id)
+        if self.path is not None:
+            data = ''.join(f"{photo_id}\n" for photo_id in photo_ids).encode()
+            with self._ids_path.open('ab') as handle:
+                handle.write(data)
+            inode, offset = self._ids_seen
+            self._ids_seen = (inode or self._ids_path.stat().st_ino, offset + len(data))
+
+    def _grow(self, rows):
+        capacity = len(self._matrix)
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+        if self.path is None:
+            matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+            matrix[:len(self._matrix)] = self._matrix
+            self._matrix = matrix
+        else:
+            self._matrix.flush()
+            self._matrix = self._open_map('vectors.f32', np.float32, (capacity, self.dim))
+
+    def _weighted(self, text, idf):
+        weights = {}
+        for feature, weight in features(text).items():
+            bucket = _bucket(feature, self.buckets)
+            weights[bucket] = weights.get(bucket, 0.0) + weight
+        if not weights:
+            return None
+        buckets = np.fromiter(weights, dtype=np.int64, count=len(weights))
+        tf = 1.0 + np.log(np.fromiter(weights.values(), dtype=np.float64, count=len(weights)))
+        return buckets, (tf * idf(buckets)).astype(np.float32)
+
+    def _idf(self, buckets):
+        return np.log((1.0 + self._documents) / (1.0 + self._df[buckets])) + 1.0
+
+    def embed(self, text):
+        """Unit-length ``dim`` vector for ``text``, or ``None`` if it has no words."""
+        weighted = self._weighted(text, self._idf)
+        if weighted is None:
+            return None
+        buckets, weights = weighted
+        vector = weights @ self.projection[buckets]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def add(self, photo_id, text):
+        """Index (or re-index) the text of a photo."""
+        with self._lock, self._file_lock():
+            self._reload()
+            self._add(photo_id, text)
+
+    def _add(self, photo_id, text):
+        row = self._rows.get(photo_id)
+        if row is None:
+            for feature in {_bucket(f, self.buckets) for f in features(text)}:
+                self._df[feature] += 1
+            self._documents += 1
+        vector = self.embed(text)
+        if vector is None:
+            vector = np.zeros(self.dim, dtype=np.float32)
+        if row is None:
+            self._grow(len(self._ids) + 1)
+            # The vector goes in before its id, which is what readers go by
+            self._matrix[len(self._ids)] = vector
+            self._append_ids([photo_id])
+        else:
+            self._matrix[row] = vector
+
+    def extend(self, photo_ids, vectors):
+        """Append precomputed unit vectors for new photos, e.g. from a rebuild."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock():
+            self._reload()
+            start = len(self._ids)
+            self._grow(start + len(vectors))
+            self._matrix[start:start + len(vectors)] = vectors
+            self._append_ids(list(photo_ids))
+            self._documents = len(self._ids)
+
+    def rebuild(self, items):
+        """Replace the whole index with ``(photo_id, text)`` pairs; returns their count.
+
+        Recovers an index that lost rows or drifted from the photo store.
+        """
+        with self._lock, self._file_lock():
+            self._df[:] = 0
+            self._documents = 0
+            self._ids, self._rows = [], {}
+            if self.path is not None:
+                # A new file, so other processes notice and start over
+                fresh = self._ids_path.with_suffix('.new')
+                fresh.write_bytes(b'')
+                os.replace(fresh, self._ids_path)
+                self._ids_seen = (self._ids_path.stat().st_ino, 0)
+            for photo_id, text in items:
+                self._add(photo_id, text)
+            return len(self._ids)
+
+    def scores(self, query):
+        """Cosine similarity of ``query`` to every indexed photo, in row order."""
+        return self._scores(query)[0]
+
+    def _scores(self, query):
+        with self._lock:
+            self._reload()
+            ids, matrix = self._ids, self._matrix
+            count = len(ids)
+        vector = self.embed(query)
+        scores = np.zeros(count, dtype=np.float32)
+        if vector is None:
+            return scores, ids
+        for start in range(0, count, BATCH_ROWS):
+            stop = min(start + BATCH_ROWS, count)
+            np.dot(matrix[start:stop], vector, out=scores[start:stop])
+        return scores, ids
+
+    def search(self, query, limit, after=None, min_score=0.0):
+        """Return ``(total, hits)`` for photos scoring above ``min_score``.
+
+        ``hits`` holds up to ``limit`` ``(photo_id, score, key)`` tuples, most
+        similar first, strictly after the ``after`` key of a previous page;
+        ``total`` counts every match, ignoring ``after``.
+        """
+        # ``ids`` is only ever appended to, so its first rows match ``scores``
+        scores, ids = self._scores(query)
+        total = int(np.count_nonzero(scores > min_score))
+        if after is not None:
+            rank, row = float(after[0]), int(after[1])
+            seen = (-scores < rank) | ((-scores == rank) & (np.arange(len(scores)) <= row))
+            scores[seen] = -np.inf
+        candidates = np.arange(len(scores))
+        if len(scores) > limit:
+            candidates = np.argpartition(-scores, limit - 1)[:limit]
+        candidates = candidates[scores[candidates] > min_score]
+        # Best first; equal scores in row order so the cursor is stable
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return total, [
+            (ids[row], float(scores[row]), (-float(scores[row]), int(row)))
+            for row in candidates
+        ]
+
+    def close(self):
+        if self.path is not None:
+            self._matrix.flush()
+            self._df.flush()
+            self._lock_file.close()
@@ -0,0 +1,143 @@
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+
+from app.services.upstream import UpstreamUnavailable
+
+MB = 1024 * 1024
+
+
+class StorageUnavailable(UpstreamUnavailable):
+    """An upload to the object store failed; retry it later.
+
+    Raised like any other unavailable upstream, so a photo whose caption is
+    done is deferred with it rather than failed.
+    """
+
+
+def content_key(data, prefix='photos', suffix='.jpg'):
+    """Object key derived from the SHA-256 of ``data``.
+
+    Identical bytes always map to the same key and different bytes never
+    do, so concurrent uploads cannot overwrite each other and a retried
+    upload rewrites the same object.
+    """
+    return f"{prefix}/{hashlib.sha256(data).hexdigest()}{suffix}"
+
+
+class StorageBackend:
+    """Interface for the public object store behind ``image_url``.
+
+    Implementations must be safe to call from many threads at once.
+    """
+
+    def put(self, key, data, content_type='application/octet-stream'):
+        """Store ``data`` under ``key`` and return its public URL."""
+        raise NotImplementedError
+
+    def url(self, key):
+        raise NotImplementedError
+
+    def put_content(self, data, prefix='photos', suffix='.jpg', content_type='image/jpeg'):
+        """Store ``data`` under its :func:`content_key` and return its URL."""
+        return self.put(content_key(data, prefix, suffix), data, content_type)
+
+
+class S3Storage(StorageBackend):
+    """Public-read objects in an S3 bucket.
+
+    ``client_factory`` returns the boto3 client (a
+    :class:`~app.services.clients.LazyClient`), whose connection pool and
+    retry policy are set in :func:`~app.services.clients.s3_client`. Bodies
+    larger than ``multipart_threshold`` are sent as a multipart upload of
+    ``multipart_chunksize`` parts, ``max_concurrency`` at a time.
+    """
+
+    def __init__(self, client_factory, bucket_name, multipart_threshold=8 * MB,
+                 multipart_chunksize=8 * MB, max_concurrency=4):
+        self.client_factory = client_factory
+        self.bucket_name = bucket_name
+        self.transfer_options = {
+            'multipart_threshold': multipart_threshold,
+            'multipart_chunksize': multipart_chunksize,
+            'max_concurrency': max_concurrency,
+        }
+        self._transfer_config = None
+
+    @property
+    def transfer_config(self):
+        if self._transfer_config is None:
+            from boto3.s3.transfer import TransferConfig
+
+            self._transfer_config = TransferConfig(**self.transfer_options)
+        return self._transfer_config
+
+    def put(self, key, data, content_type='application/octet-stream'):
+        self.client_factory().upload_fileobj(
+            io.BytesIO(data),
+            self.bucket_name,
+            key,
+            ExtraArgs={'ACL': 'public-read', 'ContentType': content_type},
+            Config=self.transfer_config
+        )
+        return self.url(key)
+
+    def url(self, key):
+        return f"https://{self.bucket_name}.s3.amazonaws.com/{key}"
+
+
+class LocalStorage(StorageBackend):
+    """Objects as files under ``root``; an offline stand-in for S3.
+
+    Writes are published with ``os.replace`` so a reader never sees a
+    partial file. URLs are ``base_url`` plus the key when given, otherwise
+    ``file://`` URIs.
+    """
+
+    def __init__(self, root, base_url=None):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.base_url = base_url.rstrip('/') if base_url else None
+
+    def path(self, key):
+        target = (self.root / key).resolve()
+        if target == self.root or self.root not in target.parents:
+            raise ValueError(f"Invalid storage key: {key!r}")
+        return target
+
+    def put(self, key, data, content_type='application/octet-stream'):
+        target = self.path(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(data)
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return self.url(key)
+
+    def url(self, key):
+        if self.base_url:
+            return f"{self.base_url}/{key}"
+        return self.path(key).as_uri()
+
+
+def create_storage(config, client_factory=None):
+    """Build the backend named by ``STORAGE_BACKEND`` in ``config``."""
+    backend = config.get('STORAGE_BACKEND', 's3')
+    if backend == 'local':
+        return LocalStorage(config['STORAGE_LOCAL_PATH'], base_url=config.get('STORAGE_PUBLIC_URL'))
+    if backend == 's3':
+        return S3Storage(
+            client_factory,
+            config['S3_BUCKET'],
+            multipart_threshold=config.get('STORAGE_MULTIPART_THRESHOLD', 8 * MB),
+            multipart_chunksize=config.get('STORAGE_MULTIPART_CHUNKSIZE', 8 * MB),
+            max_concurrency=config.get('STORAGE_MULTIPART_CONCURRENCY', 4)
+        )
+    raise ValueError(f"Unknown storage backend: {backend}")
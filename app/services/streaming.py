@@ -0,0 +1,86 @@
+import base64
+import json
+import time
+from collections import deque
+
+from app.services.tts import SENTENCE_END
+
+
+def sse(event, data, event_id=None):
+    """Format one Server-Sent Events message.
+
+    ``event_id`` is sent back by a reconnecting browser as ``Last-Event-ID``.
+    """
+    message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return f"id: {event_id}\n{message}" if event_id is not None else message
+
+
+class SentenceSplitter:
+    """Cuts a stream of text deltas into complete sentences."""
+
+    def __init__(self):
+        self._buffer = ''
+
+    def feed(self, text):
+        """Add a delta and return the sentences it completed."""
+        self._buffer += text
+        parts = SENTENCE_END.split(self._buffer)
+        self._buffer = parts.pop()
+        return [part.strip() for part in parts if part.strip()]
+
+    def flush(self):
+        rest, self._buffer = self._buffer.strip(), ''
+        return [rest] if rest else []
+
+
+def narrate(tokens, synthesize, executor):
+    """Turn streamed caption tokens into caption, sentence and audio events.
+
+    Each finished sentence is voiced right away on ``executor`` while tokens
+    keep arriving; audio events are emitted in sentence order as soon as the
+    next one is ready. Yields ``(event, data)`` pairs: ``captioned`` with
+    the full caption once the last token is in, and finally ``done``, whose
+    data carries the caption, the joined audio and the timings (seconds to
+    first token, first sentence, first audio, and total).
+    """
+    started = time.perf_counter()
+    timings = {}
+    splitter = SentenceSplitter()
+    pending = deque()
+    caption, audio_chunks = [], []
+
+    def mark(name):
+        timings.setdefault(name, round(time.perf_counter() - started, 4))
+
+    def voice(sentences):
+        for sentence in sentences:
+            mark('first_sentence')
+            index = len(audio_chunks) + len(pending)
+            pending.append((index, executor.submit(synthesize, sentence)))
+            yield 'sentence', {'index': index, 'text': sentence}
+
+    def ready_audio(wait):
+        while pending and (wait or pending[0][1].done()):
+            index, future = pending.popleft()
+            audio = future.result()
+            audio_chunks.append(audio)
+            mark('first_audio')
+            yield 'audio', {'index': index, 'audio': base64.b64encode(audio).decode()}
+
+    for token in tokens:
+        mark('first_token')
+        caption.append(token)
+        yield 'caption', {'text': token}
+        yield from voice(splitter.feed(token))
+        yield from ready_audio(wait=False)
+
+    yield 'captioned', {'caption': ''.join(caption).strip()}
+    yield from voice(splitter.flush())
+    yield from ready_audio(wait=True)
+    timings['total'] = round(time.perf_counter() - started, 4)
+
+    yield 'done', {
+        'caption': ''.join(caption).strip(),
+        'audio': b''.join(audio_chunks),
+        'timings': timings,
+    }
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different captions share a cache entry."""
+    return WHITESPACE.sub(' ', text or '').strip()
+
+
+def split_sentences(text):
+    return [sentence for sentence in SENTENCE_END.split(text) if sentence]
+
+
+def chunk_sentences(text, max_chars):
+    """Group whole sentences into chunks of at most ``max_chars`` characters.
+
+    A single sentence longer than ``max_chars`` becomes a chunk of its own.
+    """
+    chunks, current = [], ''
+    for sentence in split_sentences(text):
+        candidate = f"{current} {sentence}" if current else sentence
+        if current and len(candidate) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class GoogleSpeechBackend:
+    """Google Cloud Text-to-Speech with voice and audio settings built once.
+
+    ``client_factory`` returns the ``TextToSpeechClient`` (e.g. a
+    :class:`~app.services.clients.LazyClient`); neither it nor the SDK is
+    touched until the first synthesis.
+    """
+
+    encoding = 'MP3'
+
+    def __init__(self, client_factory, language_code, voice_name, speaking_rate, pitch=0.0):
+        self.client_factory = client_factory
+        self.params = {
+            'voice_name': voice_name,
+            'language_code': language_code,
+            'speaking_rate': speaking_rate,
+            'pitch': pitch,
+            'encoding': self.encoding,
+        }
+        self._settings = None
+
+    def settings(self):
+        """The SDK module plus voice and audio config objects, built on first use."""
+        if self._settings is None:
+            from google.cloud import texttospeech
+
+            voice = texttospeech.VoiceSelectionParams(
+                language_code=self.params['language_code'],
+                ssml_gender=texttospeech.SsmlVoiceGender.SSML_VOICE_GENDER_UNSPECIFIED,
+                name=self.params['voice_name']
+            )
+            audio_config = texttospeech.AudioConfig(
+                audio_encoding=texttospeech.AudioEncoding.MP3,
+                speaking_rate=self.params['speaking_rate'],
+                pitch=self.params['pitch']
+            )
+            self._settings = (texttospeech, voice, audio_config)
+        return self._settings
+
+    def synthesize(self, text):
+        texttospeech, voice, audio_config = self.settings()
+        response = self.client_factory().synthesize_speech(
+            input=texttospeech.SynthesisInput(text=text),
+            voice=voice,
+            audio_config=audio_config
+        )
+        return response.audio_content
+
+
+class GuardedSpeechBackend:
+    """Runs another backend's syntheses through an :class:`~app.services.upstream.Upstream`.
+
+    Each call draws its character count from the provider's per-minute
+    bucket, which is how Google meters TTS quota.
+    """
+
+    def __init__(self, backend, upstream):
+        self.backend = backend
+        self.upstream = upstream
+
+    @property
+    def params(self):
+        return self.backend.params
+
+    def synthesize(self, text):
+        with metrics.time('tts'):
+            audio = self.upstream.call(self.backend.synthesize, text, cost=len(text))
+        metrics.payload_bytes.observe(len(audio or b''), stage='tts')
+        return audio
+
+
+class SpeechSynthesizer:
+    """Caching, chunking front end for a speech backend.
+
+    Results are cached by a hash of the normalized text and every voice
+    setting (``backend.params``); the audio itself lives in the blob store, so
+    the cache only maps that key to a blob digest. Captions longer than
+    ``chunk_chars`` are split on sentence boundaries, the chunks are
+    synthesized in parallel and the MP3 frames are concatenated in order.
+    """
+
+    CACHE_NAMESPACE = 'tts'
+
+    def __init__(self, backend, store=None, blobs=None, max_entries=4096,
+                 chunk_chars=400, max_workers=4):
+        self.backend = backend
+        self.store = store
+        self.blobs = blobs
+        self.max_entries = max_entries
+        self.chunk_chars = chunk_chars
+        self.hits = 0
+        self.misses = 0
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tts-chunk')
+        self._lock = threading.Lock()
+
+    @property
+    def voice_version(self):
+        """Short hash of every voice setting; stored with audio to spot stale voicings."""
+        payload = json.dumps(self.backend.params, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()[:12]
+
+    def cache_key(self, text):
+        payload = json.dumps([normalize_text(text), self.backend.params], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def synthesize(self, text):
+        """Return MP3 bytes for ``text``, from the cache when possible."""
+        text = normalize_text(text)
+        key = self.cache_key(text)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        chunks = chunk_sentences(text, self.chunk_chars)
+        if len(chunks) <= 1:
+            audio = self.backend.synthesize(text)
+        else:
+            audio = b''.join(self.executor.map(self.backend.synthesize, chunks))
+
+        self._remember(key, audio)
+        return audio
+
+    def synthesize_chunk(self, text):
+        """Voice one piece of a longer text, bypassing the cache."""
+        return self.backend.synthesize(normalize_text(text))
+
+    def remember(self, text, audio):
+        """Cache audio for ``text`` that was assembled outside :meth:`synthesize`."""
+        self._remember(self.cache_key(text), audio)
+
+    def _cached(self, key):
+        if self.store is None or self.blobs is None:
+            return None
+        digest = self.store.cache_get(self.CACHE_NAMESPACE, key)
+        if digest is not None and self.blobs.exists(digest):
+            with self._lock:
+                self.hits += 1
+            metrics.cache_lookups.inc(cache='tts', outcome='hit')
+            return self.blobs.read(digest)
+        with self._lock:
+            self.misses += 1
+        metrics.cache_lookups.inc(cache='tts', outcome='miss')
+        return None
+
+    def _remember(self, key, audio):
+        if self.store is None or self.blobs is None or not audio:
+            return
+        try:
+            digest = self.blobs.put(audio)
+            self.store.cache_put(self.CACHE_NAMESPACE, key, digest, self.max_entries)
+        except Exception as e:
+            logger.error(f"Error caching speech: {str(e)}")
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,289 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+CIRCUIT_STATES = ('closed', 'half-open', 'open')
+
+
+class UpstreamUnavailable(Exception):
+    """An upstream provider cannot take the call now; try again later.
+
+    ``retry_after`` is a hint, in seconds, for when that might change.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(UpstreamUnavailable):
+    """Raised without calling the provider while its breaker is open."""
+
+
+def status_code(error):
+    """HTTP status carried by an SDK exception, if any.
+
+    Covers the OpenAI SDK (``status_code``), google-api-core (``code``) and
+    botocore (``response['ResponseMetadata']``).
+    """
+    for attr in ('status_code', 'code'):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        return response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return getattr(response, 'status_code', None)
+
+
+def is_retryable(error):
+    """Throttling, server errors and dropped connections are worth retrying."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    status = status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # SDKs without a status on the exception still name the condition
+    name = type(error).__name__
+    return any(word in name for word in ('RateLimit', 'Timeout', 'Connection', 'Unavailable',
+                                         'ResourceExhausted', 'TooManyRequests'))
+
+
+def retry_after(error):
+    """Seconds the provider asked us to wait, from a ``Retry-After`` header."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    try:
+        return float(headers.get('retry-after')) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Refills ``rate`` units per minute, holding at most ``capacity``.
+
+    :meth:`acquire` blocks until the units are available, so callers are
+    spread evenly over the minute instead of bursting into a quota error.
+    A request larger than the capacity waits for a full bucket and then
+    takes it all.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate / 60.0
+        self.capacity = capacity or rate
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1):
+        """Take ``amount`` units, waiting as needed; returns seconds waited."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(self.clock())
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                wait = (amount - self._tokens) / self.rate
+            self.sleep(wait)
+            waited += wait
+
+
+class CircuitBreaker:
+    """Stops calling a provider after ``failure_threshold`` failures in a row.
+
+    While open, calls fail at once with :class:`CircuitOpen`. After
+    ``reset_timeout`` seconds one trial call is let through (half-open); its
+    success closes the breaker and its failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if self.clock() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def remaining(self):
+        """Seconds until a trial call is allowed (0 when closed)."""
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (self.clock() - self._opened_at))
+
+    def allow(self):
+        """Raise :class:`CircuitOpen` unless a call may go ahead."""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return
+            wait = self.remaining() or self.reset_timeout
+        raise CircuitOpen(f"{self.name} circuit is open", retry_after=wait)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial:
+                    logger.warning(f"Opening {self.name} circuit after {self.failures} failures")
+                self._opened_at = self.clock()
+                self._trial = False
+
+
+class Upstream:
+    """Admission control for one provider.
+
+    Every call passes the circuit breaker, takes a concurrency slot and
+    draws from the request and token buckets (``None`` disables a limit),
+    then is retried on throttling and transient errors with full-jitter
+    exponential backoff. Retries draw from the buckets again, so a throttled
+    provider is never hit harder than its quota. When retries run out or
+    the breaker is open, :class:`UpstreamUnavailable` is raised; other
+    errors (bad requests, bad credentials) propagate unchanged and do not
+    count against the breaker.
+    """
+
+    def __init__(self, name, requests_per_minute=None, tokens_per_minute=None,
+                 max_concurrency=None, max_attempts=4, backoff_base=0.5, backoff_max=20.0,
+                 failure_threshold=5, reset_timeout=30.0, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sleep = sleep
+        self.requests = requests_per_minute and TokenBucket(requests_per_minute, clock=clock, sleep=sleep)
+        self.tokens = tokens_per_minute and TokenBucket(tokens_per_minute, clock=clock, sleep=sleep)
+        self.slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout, clock=clock)
+
+    def backoff(self, attempt, error=None):
+        """Seconds to wait before retry number ``attempt`` (1-based)."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        asked = retry_after(error) if error is not None else None
+        return min(self.backoff_max, max(delay, asked or 0.0))
+
+    @contextmanager
+    def _slot(self):
+        if self.slots is None:
+            yield
+            return
+        with self.slots:
+            yield
+
+    def _admit(self, cost):
+        try:
+            self.breaker.allow()
+        except CircuitOpen:
+            metrics.upstream_errors.inc(provider=self.name, reason='circuit_open')
+            raise
+        if self.requests:
+            self.requests.acquire()
+        if self.tokens and cost:
+            self.tokens.acquire(cost)
+
+    def _failed(self, attempt, error):
+        """Re-raise ``error`` unless it is worth retrying, then back off."""
+        metrics.upstream_errors.inc(
+            provider=self.name, reason=str(status_code(error) or type(error).__name__)
+        )
+        if not is_retryable(error):
+            # The provider answered, so it is up even if the request was bad
+            self.breaker.record_success()
+            raise error
+        self.breaker.record_failure()
+        if attempt == self.max_attempts:
+            raise UpstreamUnavailable(
+                f"{self.name} failed after {attempt} attempts: {error}",
+                retry_after=self.breaker.remaining() or self.backoff_max
+            ) from error
+        wait = self.backoff(attempt, error)
+        logger.warning(f"{self.name} call failed ({error}); retry {attempt} in {wait:.2f}s")
+        self.sleep(wait)
+
+    def call(self, fn, *args, cost=1, **kwargs):
+        """Call ``fn(*args, **kwargs)`` under this provider's limits."""
+        with self._slot():
+            for attempt in range(1, self.max_attempts + 1):
+                self._admit(cost)
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    self._failed(attempt, e)
+                    continue
+                self.breaker.record_success()
+                return result
+
+    def stream(self, fn, *args, cost=1, **kwargs):
+        """Like :meth:`call` for a function returning an iterator.
+
+        Opening the stream and waiting for its first item are retried;
+        once items have been handed on, a failure propagates as is.
+        """
+        with self._slot():
+            for attempt in range(1, self.max_attempts + 1):
+                self._admit(cost)
+                try:
+                    iterator = iter(fn(*args, **kwargs))
+                    first = next(iterator, None)
+                except Exception as e:
+                    self._failed(attempt, e)
+                    continue
+                self.breaker.record_success()
+                if first is not None:
+                    yield first
+                    yield from iterator
+                return
+
+    def stats(self):
+        state = self.breaker.state
+        metrics.circuit_state.set(CIRCUIT_STATES.index(state), provider=self.name)
+        return {'state': state, 'failures': self.breaker.failures}
+
+
+def create_upstream(config, name, requests_per_minute=None, tokens_per_minute=None,
+                    max_concurrency=None):
+    """An :class:`Upstream` with the retry and breaker settings in ``config``."""
+    return Upstream(
+        name,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        max_concurrency=max_concurrency,
+        max_attempts=config.get('UPSTREAM_MAX_ATTEMPTS', 4),
+        backoff_base=config.get('UPSTREAM_BACKOFF_BASE', 0.5),
+        backoff_max=config.get('UPSTREAM_BACKOFF_MAX', 20.0),
+        failure_threshold=config.get('UPSTREAM_BREAKER_FAILURES', 5),
+        reset_timeout=config.get('UPSTREAM_BREAKER_RESET', 30.0)
+    )
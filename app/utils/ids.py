@@ -0,0 +1,37 @@
+import os
+import threading
+import time
+
+# Crockford's base32: no I, L, O or U, so ids survive being read aloud
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+_lock = threading.Lock()
+_last = (0, 0)
+
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, 32)
+        chars.append(ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+def new_ulid(now=None):
+    """A 26-character ULID: 48 bits of milliseconds, then 80 random bits.
+
+    ULIDs sort by creation time. Within one millisecond the random part is
+    incremented instead of redrawn, so ids from one process stay unique and
+    ordered however many are made; across processes 80 random bits make a
+    collision vanishingly unlikely.
+    """
+    global _last
+    millis = int((time.time() if now is None else now) * 1000)
+    with _lock:
+        last_millis, last_random = _last
+        if millis <= last_millis and last_random < 2 ** 80 - 1:
+            millis, randomness = last_millis, last_random + 1
+        else:
+            randomness = int.from_bytes(os.urandom(10), 'big')
+        _last = (millis, randomness)
+    return _encode(millis, 10) + _encode(randomness, 16)
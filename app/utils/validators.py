@@ -1,12 +1,14 @@
 # app/utils/validators.py
 import json
+import os
 from pathlib import Path
-from google.oauth2 import service_account
-from google.cloud import texttospeech
 
 def validate_google_credentials():
     """Validate Google Cloud credentials and TTS API access."""
     try:
+        from google.oauth2 import service_account
+        from google.cloud import texttospeech
+
         # Get credentials path from environment
         creds_path = Path(os.getenv('GOOGLE_APPLICATION_CREDENTIALS')).expanduser()
         
@@ -36,21 +38,9 @@ def validate_google_credentials():
         
         # Try to create a client and make a simple request
         client = texttospeech.TextToSpeechClient(credentials=credentials)
-        voices = client.list_voices()
+        client.list_voices()
         
         return True, "Credentials validated successfully"
         
     except Exception as e:
         return False, f"Credential validation failed: {str(e)}"
-
-# Add to app/main.py initialization
-def create_app():
-    app = Flask(__name__)
-    
-    # Validate credentials during startup
-    is_valid, message = validate_google_credentials()
-    if not is_valid:
-        app.logger.error(message)
-        raise RuntimeError(message)
-    
-    return app
\ No newline at end of file
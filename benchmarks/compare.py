@@ -0,0 +1,85 @@
+"""Compare two ``benchmarks.suite`` reports and flag regressions.
+
+Latencies (``*_ms``, ``seconds``) and memory (``*_mb``) regress when they
+grow, throughput (``*_per_second``) when it shrinks. Exits non-zero when any
+metric moved the wrong way by more than ``--threshold``.
+
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 0.1]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def flatten(report):
+    """``{metric path: value}`` for every number in the upload and album sections."""
+    values = {}
+
+    def walk(prefix, node):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                walk(f"{prefix}.{key}", value)
+        elif isinstance(node, (int, float)) and not isinstance(node, bool):
+            values[prefix] = node
+
+    for run in report.get('upload', []):
+        walk(f"upload[workers={run['workers']}]",
+             {'photos_per_second': run['photos_per_second'], 'stages': run['stages']})
+    for run in report.get('album', []):
+        walk(f"album[photos={run['photos']}]",
+             {key: value for key, value in run.items() if key != 'photos'})
+    return values
+
+
+def direction(metric):
+    """+1 when bigger is worse, -1 when smaller is worse, 0 when not compared."""
+    name = metric.rsplit('.', 1)[-1]
+    if name.endswith('_per_second'):
+        return -1
+    if name.endswith(('_ms', '_mb', '_bytes', 'seconds')):
+        return 1
+    return 0
+
+
+def compare(baseline, candidate, threshold):
+    before, after = flatten(baseline), flatten(candidate)
+    rows = []
+    for metric in sorted(before.keys() & after.keys()):
+        sign = direction(metric)
+        if not sign or not before[metric]:
+            continue
+        change = (after[metric] - before[metric]) / before[metric]
+        rows.append({
+            'metric': metric,
+            'before': before[metric],
+            'after': after[metric],
+            'change': round(change, 4),
+            'regressed': sign * change > threshold,
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline', type=Path)
+    parser.add_argument('candidate', type=Path)
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args(argv)
+    baseline = json.loads(args.baseline.read_text())
+    candidate = json.loads(args.candidate.read_text())
+    rows = compare(baseline, candidate, args.threshold)
+    json.dump({
+        'benchmark': 'compare',
+        'baseline': baseline.get('commit'),
+        'candidate': candidate.get('commit'),
+        'threshold': args.threshold,
+        'regressions': [row for row in rows if row['regressed']],
+        'results': rows,
+    }, sys.stdout, indent=2)
+    print()
+    return 1 if any(row['regressed'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Deterministic local stand-ins for OpenAI, Google TTS and S3, and synthetic photos.
+
+Every fake takes a :class:`Faults` describing its latency and how often it
+fails. Failures raise :class:`FakeUpstreamError` with an HTTP status, so the
+admission layer retries, backs off and trips breakers as it would against
+the real providers.
+"""
+import hashlib
+import io
+import random
+import threading
+import time
+
+from PIL import Image
+
+from app.services.captions import CaptionEngine, FakeCaptionEngine
+from app.services.storage import LocalStorage
+
+
+class FakeUpstreamError(Exception):
+    def __init__(self, status_code, message=None):
+        super().__init__(message or f"Injected HTTP {status_code}")
+        self.status_code = status_code
+
+
+class Faults:
+    """Latency and error injection for one fake provider.
+
+    Each call sleeps ``latency`` seconds, plus up to ``jitter`` more, and
+    fails with probability ``error_rate`` (as ``status``). The random draws
+    are seeded, so a run with the same settings injects the same faults.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, status=503, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.status = status
+        self.calls = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            failed = self._rng.random() < self.error_rate
+            self.errors += failed
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise FakeUpstreamError(self.status)
+
+    def stats(self):
+        return {'calls': self.calls, 'errors': self.errors}
+
+
+class FakeVisionEngine(CaptionEngine):
+    """The vision model: :class:`FakeCaptionEngine` captions behind injected faults."""
+
+    def __init__(self, faults=None):
+        self.faults = faults or Faults()
+        self._captions = FakeCaptionEngine()
+
+    def caption(self, image_uri, title):
+        self.faults()
+        return self._captions.caption(image_uri, title)
+
+    def stream(self, image_uri, title):
+        self.faults()
+        yield from self._captions.stream(image_uri, title)
+
+
+class FakeSpeechBackend:
+    """Google TTS: returns MP3-sized bytes derived from the text."""
+
+    params = {'voice_name': 'fake', 'language_code': 'en-US', 'speaking_rate': 0.9,
+              'pitch': 0.0, 'encoding': 'MP3'}
+
+    # Roughly what 24 kbps speech costs per character of text
+    BYTES_PER_CHAR = 200
+
+    def __init__(self, faults=None):
+        self.faults = faults or Faults()
+
+    def synthesize(self, text):
+        self.faults()
+        digest = hashlib.sha256(text.encode()).digest()
+        size = max(len(text), 1) * self.BYTES_PER_CHAR
+        return b'ID3' + (digest * (size // len(digest) + 1))[:size]
+
+
+class FakeObjectStorage(LocalStorage):
+    """S3: objects on the local filesystem, behind injected faults."""
+
+    def __init__(self, root, faults=None):
+        super().__init__(root)
+        self.faults = faults or Faults()
+
+    def put(self, key, data, content_type='application/octet-stream'):
+        self.faults()
+        return super().put(key, data, content_type)
+
+
+def synthetic_photo(seed, megapixels=0.3, quality=85):
+    """A JPEG of smoothly blended random colour blocks.
+
+    Different seeds give perceptually different photos, so the near-duplicate
+    cache does not answer a benchmark upload from an earlier one.
+    """
+    rng = random.Random(seed)
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    blocks = Image.new('RGB', (9, 8))
+    blocks.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(9 * 8)])
+    image = blocks.resize((width, height), Image.Resampling.BILINEAR)
+    buffered = io.BytesIO()
+    image.save(buffered, format='JPEG', quality=quality)
+    return buffered.getvalue()
@@ -0,0 +1,135 @@
+"""Peak RSS and wall time of image preprocessing per megapixel.
+
+Compares the single-decode draft pipeline (``preprocess_image``) with the
+previous full decode + ``copy()`` + LANCZOS ``thumbnail`` path. Each run
+happens in a fresh process, and the peak is taken from the kernel's
+high-water mark after resetting it, so it reflects that run alone.
+
+    python -m benchmarks.preprocess [--megapixels 2 12 24] [--repeat 3]
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.services.imaging import preprocess_image
+
+
+def synthetic_jpeg(megapixels, seed=0):
+    """A noisy gradient JPEG, which compresses like a real photo."""
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    pixels += rng.normal(0, 12, pixels.shape).astype(np.float32)
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'RGB')
+    buffered = io.BytesIO()
+    image.save(buffered, format='JPEG', quality=90)
+    return buffered.getvalue()
+
+
+def legacy_preprocess(image_data):
+    """The pre-pipeline path: full decode, copy, thumbnail, double buffer."""
+    image = Image.open(io.BytesIO(image_data))
+    image_copy = image.copy()
+    image_copy.thumbnail((800, 800), Image.Resampling.LANCZOS)
+    buffered = io.BytesIO()
+    image_copy.save(buffered, format="JPEG", quality=70)
+    return io.BytesIO(buffered.getvalue())
+
+
+PIPELINES = {'draft': preprocess_image, 'legacy': legacy_preprocess}
+
+
+def _status_mb(field):
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Reset the kernel's RSS high-water mark (Linux); a no-op elsewhere."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def rss_mb():
+    return _status_mb('VmRSS') or peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = _status_mb('VmHWM')
+    if peak is not None:
+        return peak
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+def _measure(pipeline, megapixels, repeat, conn):
+    image_data = synthetic_jpeg(megapixels)
+    reset_peak_rss()
+    baseline = rss_mb()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        PIPELINES[pipeline](image_data)
+    seconds = (time.perf_counter() - started) / repeat
+    conn.send({'seconds': seconds, 'peak_rss_mb': peak_rss_mb(), 'baseline_rss_mb': baseline})
+    conn.close()
+
+
+def measure(pipeline, megapixels, repeat):
+    parent, child = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.get_context('spawn').Process(
+        target=_measure, args=(pipeline, megapixels, repeat, child)
+    )
+    process.start()
+    result = parent.recv()
+    process.join()
+    return result
+
+
+def run(megapixels, repeat):
+    results = []
+    for mp in megapixels:
+        for pipeline in PIPELINES:
+            stats = measure(pipeline, mp, repeat)
+            results.append({
+                'pipeline': pipeline,
+                'megapixels': mp,
+                'seconds': round(stats['seconds'], 4),
+                'seconds_per_mp': round(stats['seconds'] / mp, 5),
+                'peak_rss_mb': round(stats['peak_rss_mb'], 1),
+                'rss_over_baseline_mb': round(stats['peak_rss_mb'] - stats['baseline_rss_mb'], 1),
+            })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[2, 12, 24])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+    json.dump({'benchmark': 'preprocess', 'results': run(args.megapixels, args.repeat)},
+              sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Search latency (p50/p99) against album size for both store backends.
+
+    python -m benchmarks.search [--photos 1000 10000 100000] [--queries 200]
+
+Each sample is what ``/search`` does: count the matches, then fetch a page.
+Known gap: at 100k photos p50 is a few milliseconds (memory) to under 20
+(SQLite), but p99 is near 100ms. The slow queries match a quarter of the
+album through a short prefix (``han``, ``hes``), and every match is scored
+before the top page is cut; top-k pruning (MaxScore/WAND) would be needed
+to get the tail down to single milliseconds.
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.models.store import MemoryPhotoStore, SQLitePhotoStore
+
+SUBJECTS = ('grandma', 'uncle raj', 'my sister maya', 'our dog biscuit', 'dad', 'the twins')
+PLACES = ('at the beach', 'in the garden', 'at the birthday party', 'on the mountain trail',
+          'by the lake', 'at the wedding', 'in the old kitchen', 'at the station')
+FEELINGS = ('laughing', 'quietly proud', 'a little sunburnt', 'completely happy',
+            'tired but smiling', 'soaked from the rain')
+# Captions also draw words from a Zipf-distributed vocabulary, like real text
+VOCABULARY = [f"{a}{b}{c}" for a in 'bcdfghklmnprst' for b in 'aeiou' for c in 'lmnrstx'][:2000]
+QUERIES = (
+    'grandma at the beach', 'show me pictures of the birthday party', 'dog', 'wedd',
+    'the day we were laughing by the lake', 'mountain trail with dad', 'sunburnt twins',
+)
+
+
+def zipf_word(rng):
+    return VOCABULARY[min(int(rng.paretovariate(1.0)) - 1, len(VOCABULARY) - 1)]
+
+
+def synthetic_records(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        place, subject = rng.choice(PLACES), rng.choice(SUBJECTS)
+        details = ' '.join(zipf_word(rng) for _ in range(12))
+        caption = (f"I remember this day {place} with {subject}. "
+                   f"We were all {rng.choice(FEELINGS)}. {details}.")
+        yield f"{i:08d}", {
+            'title': f"{place.split()[-1].title()} {i}",
+            'caption': caption,
+            'timestamp': f"2024-01-01T00:00:{i:08d}",
+        }
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(store, queries, page_size=24):
+    """Time what ``/search`` does per request: count the matches, then fetch one page."""
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        store.count(query)
+        store.search_page(query, page_size + 1)
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'p50_ms': round(percentile(samples, 0.50), 3),
+        'p99_ms': round(percentile(samples, 0.99), 3),
+    }
+
+
+def run(sizes, query_count):
+    results = []
+    rng = random.Random(1)
+    queries = [
+        rng.choice(QUERIES) if i % 2 else f"{rng.choice(QUERIES)} {rng.choice(VOCABULARY[:200])}"
+        for i in range(query_count)
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            backends = {
+                'memory': MemoryPhotoStore(),
+                'sqlite': SQLitePhotoStore(Path(tmp) / f"album-{size}.db"),
+            }
+            for name, store in backends.items():
+                records = list(synthetic_records(size))
+                started = time.perf_counter()
+                for start in range(0, size, 1000):
+                    store.add_photos(records[start:start + 1000])
+                index_seconds = time.perf_counter() - started
+                # A query that finds nothing would only time an empty lookup
+                missing = [query for query in QUERIES if not store.count(query)]
+                if missing:
+                    raise RuntimeError(f"{name} store found nothing for {missing}")
+                results.append({
+                    'backend': name,
+                    'photos': size,
+                    'index_seconds': round(index_seconds, 3),
+                    **measure(store, queries),
+                })
+                store.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--photos', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args(argv)
+    json.dump({'benchmark': 'search', 'results': run(args.photos, args.queries)},
+              sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
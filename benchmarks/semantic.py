@@ -0,0 +1,74 @@
+"""Semantic search query latency (p50/p99) against the number of indexed vectors.
+
+Captions are embedded once, then the memory-mapped matrix is filled with
+noisy copies of them to reach each size.
+
+    python -m benchmarks.semantic [--vectors 10000 100000 1000000] [--queries 50]
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.semantic import SemanticIndex
+from benchmarks.search import QUERIES, percentile, synthetic_records
+
+CHUNK = 100000
+
+
+def fill(index, count, seed=0):
+    base = np.stack([
+        index.embed(f"{record['title']}. {record['caption']}")
+        for _, record in synthetic_records(1000, seed)
+    ])
+    rng = np.random.default_rng(seed)
+    for start in range(len(index), count, CHUNK):
+        size = min(CHUNK, count - start)
+        vectors = base[rng.integers(0, len(base), size)]
+        vectors += rng.normal(0, 0.05, vectors.shape).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        index.extend([f"{start + i:08d}" for i in range(size)], vectors)
+
+
+def run(sizes, query_count, dim):
+    rng = random.Random(1)
+    queries = [rng.choice(QUERIES) for _ in range(query_count)]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SemanticIndex(tmp, dim=dim)
+        for size in sorted(sizes):
+            fill(index, size)
+            index.search(queries[0], 25)  # fault the matrix into the page cache
+            samples = []
+            for query in queries:
+                started = time.perf_counter()
+                index.search(query, 25)
+                samples.append((time.perf_counter() - started) * 1000)
+            results.append({
+                'vectors': size,
+                'dim': dim,
+                'matrix_mb': round(size * dim * 4 / 2 ** 20, 1),
+                'p50_ms': round(percentile(samples, 0.50), 3),
+                'p99_ms': round(percentile(samples, 0.99), 3),
+            })
+        index.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vectors', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--dim', type=int, default=128)
+    args = parser.parse_args(argv)
+    json.dump({'benchmark': 'semantic', 'results': run(args.vectors, args.queries, args.dim)},
+              sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
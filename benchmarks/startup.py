@@ -0,0 +1,76 @@
+"""Cold start: time from a fresh interpreter to the first answered request.
+
+Each run is a new Python process that imports ``app.main``, calls
+``create_app`` and sends ``GET /health`` then ``GET /photos`` through the
+test client. Also reports which heavy SDKs were imported along the way;
+none should be until a request needs them.
+
+    python -m benchmarks.startup [--config config.config.TestingConfig] [--repeat 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ('boto3', 'google.cloud.texttospeech', 'openai', 'langchain', 'autogen')
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+application = app.main.create_app({config!r})
+created = time.perf_counter()
+client = application.test_client()
+health = client.get('/health')
+first = time.perf_counter()
+photos = client.get('/photos')
+second = time.perf_counter()
+assert health.status_code == 200 and photos.status_code == 200
+json.dump({{
+    'import_seconds': imported - started,
+    'create_app_seconds': created - imported,
+    'first_request_seconds': first - created,
+    'second_request_seconds': second - first,
+    'total_seconds': second - started,
+    'heavy_modules': [name for name in {heavy!r} if name in sys.modules],
+}}, sys.stdout)
+"""
+
+
+def measure(config):
+    """Timings of one cold start in a fresh interpreter."""
+    completed = subprocess.run(
+        [sys.executable, '-c', CHILD.format(config=config, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout)
+
+
+def run(config, repeat):
+    runs = [measure(config) for _ in range(repeat)]
+    result = {
+        name: round(statistics.median(run[name] for run in runs), 4)
+        for name in runs[0] if name.endswith('_seconds')
+    }
+    result['heavy_modules'] = sorted({name for run in runs for name in run['heavy_modules']})
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', default='config.config.TestingConfig')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+    json.dump({
+        'benchmark': 'startup',
+        'config': args.config,
+        'repeat': args.repeat,
+        'results': run(args.config, args.repeat)
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
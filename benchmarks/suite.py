@@ -0,0 +1,265 @@
+"""End-to-end benchmark suite, run entirely offline.
+
+The app is built with ``create_app`` as in production, but the vision
+model, TTS and object storage are the local fakes in :mod:`benchmarks.fakes`
+(with configurable latency and error injection). Measures:
+
+* ``upload``: photos/s through ``POST /upload`` against the number of job
+  workers, with p50/p99 per stage from the app's own instrumentation;
+* ``album``: ``GET /photos`` and ``GET /search`` latency and peak RSS at each
+  album size, every size in a fresh process, with per-stage timings
+  (including serializing and compressing responses) and response sizes on
+  the wire per encoding.
+
+Results are JSON tagged with the git commit; compare two runs with
+``python -m benchmarks.compare``.
+
+    python -m benchmarks.suite [--workers 1 2 4 8] [--uploads 64]
+        [--photos 1000 10000 100000] [--caption-latency 0.2] [--error-rate 0.02]
+        [--output results.json]
+"""
+import argparse
+import io
+import itertools
+import json
+import multiprocessing
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import quote
+
+from benchmarks.fakes import (
+    Faults, FakeObjectStorage, FakeSpeechBackend, FakeVisionEngine, synthetic_photo
+)
+from benchmarks.preprocess import peak_rss_mb, reset_peak_rss, rss_mb
+from benchmarks.search import QUERIES, percentile, synthetic_records
+
+
+def benchmark_config(tmp, **overrides):
+    """A config class writing under ``tmp``, without quotas so fakes set the pace."""
+    from config.config import TestingConfig
+
+    settings = {
+        'INSTANCE_DIR': tmp,
+        'PHOTO_DB_BACKEND': 'sqlite',
+        'PHOTO_DB_PATH': tmp / 'album.db',
+        'BLOB_STORAGE_PATH': tmp / 'blobs',
+        'STORAGE_LOCAL_PATH': tmp / 'storage',
+        'SEMANTIC_INDEX_PATH': None,
+        'OPENAI_REQUESTS_PER_MINUTE': None,
+        'OPENAI_TOKENS_PER_MINUTE': None,
+        'TTS_REQUESTS_PER_MINUTE': None,
+        'TTS_CHARACTERS_PER_MINUTE': None,
+        'UPSTREAM_BACKOFF_BASE': 0.01,
+        'UPSTREAM_BACKOFF_MAX': 0.2,
+        **overrides,
+    }
+    return type('BenchmarkConfig', (TestingConfig,), settings)
+
+
+def install_fakes(app, tmp, caption_faults, tts_faults, storage_faults):
+    """Swap the upstream clients of ``app`` for local fakes, keeping their guards."""
+    album = app.extensions['album']['photo_album']
+    album.caption_engine.engine = FakeVisionEngine(caption_faults)
+    album.synthesizer.backend.backend = FakeSpeechBackend(tts_faults)
+    album.storage = FakeObjectStorage(tmp / 'storage', storage_faults)
+    return album
+
+
+def wire_variants():
+    """``(name, request headers)`` for every response encoding the app can produce."""
+    from app.api import encoding
+
+    variants = [('identity', {})]
+    variants += [(coding, {'Accept-Encoding': coding}) for coding in encoding.CONTENT_CODINGS]
+    if encoding.msgpack is not None:
+        variants += [('msgpack', {'Accept': encoding.MSGPACK_MIMETYPE}),
+                     ('msgpack_gzip', {'Accept': encoding.MSGPACK_MIMETYPE,
+                                       'Accept-Encoding': 'gzip'})]
+    return variants
+
+
+def summarize(samples):
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+    }
+
+
+def run_uploads(workers, uploads, faults):
+    """Upload ``uploads`` distinct photos with ``workers`` job workers and wait for all."""
+    from app.main import create_app
+    from app.services.metrics import metrics
+
+    samples = defaultdict(list)
+    listener = lambda stage, seconds: samples[stage].append(seconds)
+    photos = [synthetic_photo(seed) for seed in range(uploads)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        app = create_app(benchmark_config(
+            tmp, JOB_WORKERS=workers, JOB_MAX_PENDING=uploads, RESULT_CACHE_MAX_DISTANCE=-1
+        ))
+        fakes = {name: Faults(**options) for name, options in faults.items()}
+        install_fakes(app, tmp, fakes['caption'], fakes['tts'], fakes['storage'])
+        services = app.extensions['album']
+        client = app.test_client()
+
+        metrics.listeners.append(listener)
+        try:
+            started = time.perf_counter()
+            job_ids = []
+            for i, photo in enumerate(photos):
+                response = client.post('/upload', data={
+                    'photo': (io.BytesIO(photo), f'photo-{i}.jpg'),
+                    'title': f'Photo {i}',
+                }, content_type='multipart/form-data')
+                job_ids.append(response.get_json()['job_id'])
+
+            jobs = []
+            for job_id in job_ids:
+                while True:
+                    job = services['job_queue'].get(job_id)
+                    if job['state'] in ('done', 'failed', 'deferred'):
+                        break
+                    time.sleep(0.005)
+                jobs.append(job)
+            seconds = time.perf_counter() - started
+        finally:
+            metrics.listeners.remove(listener)
+            services['job_queue'].shutdown()
+            services['photo_album'].preprocess_pool.shutdown()
+
+    states = defaultdict(int)
+    for job in jobs:
+        states[job['state']] += 1
+        samples['end_to_end'].append(job['updated_at'] - job['created_at'])
+    return {
+        'workers': workers,
+        'uploads': uploads,
+        'seconds': round(seconds, 3),
+        'photos_per_second': round(uploads / seconds, 2),
+        'jobs': dict(states),
+        'injected': {name: fault.stats() for name, fault in fakes.items()},
+        'stages': {stage: summarize(values) for stage, values in sorted(samples.items())},
+    }
+
+
+def _measure_album(size, queries, conn):
+    from app.main import create_app
+    from app.services.metrics import metrics
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        app = create_app(benchmark_config(tmp))
+        store = app.extensions['album']['photo_album'].photo_db.store
+        client = app.test_client()
+        reset_peak_rss()
+        baseline = rss_mb()
+
+        started = time.perf_counter()
+        records = synthetic_records(size)
+        while chunk := list(itertools.islice(records, 1000)):
+            store.add_photos(chunk)
+        load_seconds = time.perf_counter() - started
+
+        latencies = defaultdict(list)
+        stages = defaultdict(list)
+        listener = lambda stage, seconds: stages[stage].append(seconds)
+        metrics.listeners.append(listener)
+        for i in range(queries):
+            query = quote(QUERIES[i % len(QUERIES)])
+            for name, url in (('photos', '/photos?limit=24'),
+                              ('search', f'/search?query={query}&limit=24')):
+                begun = time.perf_counter()
+                response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+                latencies[name].append(time.perf_counter() - begun)
+                assert response.status_code == 200, response.status_code
+        metrics.listeners.remove(listener)
+
+        wire = {}
+        for name, url in (('photos', '/photos?limit=100'),
+                          ('search', f'/search?query={quote(QUERIES[0])}&limit=100')):
+            wire[name] = {
+                f'{variant}_bytes': len(client.get(url, headers=headers).get_data())
+                for variant, headers in wire_variants()
+            }
+
+        conn.send({
+            'photos': size,
+            'load_seconds': round(load_seconds, 3),
+            **{name: summarize(values) for name, values in latencies.items()},
+            'stages': {stage: summarize(values) for stage, values in sorted(stages.items())},
+            'wire': wire,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'rss_over_baseline_mb': round(peak_rss_mb() - baseline, 1),
+        })
+        app.extensions['album']['job_queue'].shutdown()
+        app.extensions['album']['photo_album'].preprocess_pool.shutdown()
+    conn.close()
+
+
+def run_album(size, queries):
+    """Listing and search latency plus peak RSS for an album of ``size`` photos."""
+    parent, child = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.get_context('spawn').Process(
+        target=_measure_album, args=(size, queries, child)
+    )
+    process.start()
+    result = parent.recv()
+    process.join()
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--uploads', type=int, default=64)
+    parser.add_argument('--photos', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--caption-latency', type=float, default=0.2)
+    parser.add_argument('--tts-latency', type=float, default=0.05)
+    parser.add_argument('--storage-latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0.5,
+                        help='extra random latency, as a fraction of each latency')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of fake upstream calls that fail with HTTP 503')
+    parser.add_argument('--output', type=Path, help='write JSON here instead of stdout')
+    args = parser.parse_args(argv)
+
+    faults = {
+        name: {'latency': latency, 'jitter': latency * args.jitter,
+               'error_rate': args.error_rate, 'seed': seed}
+        for seed, (name, latency) in enumerate((('caption', args.caption_latency),
+                                                ('tts', args.tts_latency),
+                                                ('storage', args.storage_latency)))
+    }
+    report = {
+        'benchmark': 'suite',
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'settings': {**{k: v for k, v in vars(args).items() if k != 'output'}, 'faults': faults},
+        'upload': [run_uploads(workers, args.uploads, faults) for workers in args.workers],
+        'album': [run_album(size, args.queries) for size in args.photos],
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + '\n')
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
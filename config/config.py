@@ -1,5 +1,9 @@
 import os
 from pathlib import Path
+from dotenv import load_dotenv
+
+# Settings below read the environment, so .env must be loaded first
+load_dotenv()
 
 class BaseConfig:
     """Base configuration."""
@@ -7,10 +11,88 @@ class BaseConfig:
     BASE_DIR = Path(__file__).parent.parent
     INSTANCE_DIR = BASE_DIR / 'instance'
     PHOTO_STORAGE_PATH = INSTANCE_DIR / 'photos'
+    BLOB_STORAGE_PATH = INSTANCE_DIR / 'blobs'  # content-addressed images and audio
+
+    # Metadata store configurations
+    PHOTO_DB_BACKEND = 'sqlite'  # 'sqlite' or 'memory'
+    PHOTO_DB_PATH = INSTANCE_DIR / 'album.db'
+    PHOTO_DB_BUSY_TIMEOUT = 5000  # ms to wait on a locked database
+
+    # Background job configurations
+    JOB_WORKERS = 4  # concurrent caption/TTS pipelines per process
+    JOB_MAX_PENDING = 32  # uploads accepted but not finished before 503
+    JOB_LEASE_SECONDS = 120  # jobs without a heartbeat this long are resumed elsewhere
+    JOB_RETRY_AFTER = 5  # seconds suggested to clients on 503
+
+    # Object storage configurations
+    STORAGE_BACKEND = 's3'  # 's3' or 'local' (files under STORAGE_LOCAL_PATH)
+    STORAGE_LOCAL_PATH = INSTANCE_DIR / 'storage'
+    STORAGE_PUBLIC_URL = None  # URL prefix for local objects; None gives file:// URLs
+    STORAGE_UPLOAD_WORKERS = 4  # concurrent uploads per process
+    STORAGE_MAX_POOL_CONNECTIONS = 32  # >= upload workers x multipart concurrency
+    STORAGE_MAX_ATTEMPTS = 5  # per S3 request, with adaptive backoff
+    STORAGE_CONNECT_TIMEOUT = 5
+    STORAGE_READ_TIMEOUT = 30
+    STORAGE_MULTIPART_THRESHOLD = 8 * 1024 * 1024  # larger bodies upload in parts
+    STORAGE_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+    STORAGE_MULTIPART_CONCURRENCY = 4  # parts in flight per upload
+
+    # Upstream admission control (None disables a limit); match your quotas
+    OPENAI_REQUESTS_PER_MINUTE = 500
+    OPENAI_TOKENS_PER_MINUTE = 30000
+    OPENAI_MAX_CONCURRENCY = 8
+    TTS_REQUESTS_PER_MINUTE = 1000
+    TTS_CHARACTERS_PER_MINUTE = 150000
+    TTS_MAX_CONCURRENCY = 8
+    UPSTREAM_MAX_ATTEMPTS = 4  # per call, on 429/5xx and dropped connections
+    UPSTREAM_BACKOFF_BASE = 0.5  # seconds; full jitter, doubling per attempt
+    UPSTREAM_BACKOFF_MAX = 20.0
+    UPSTREAM_BREAKER_FAILURES = 5  # failures in a row that open a provider's circuit
+    UPSTREAM_BREAKER_RESET = 30.0  # seconds open before a trial call
+
+    # Batch upload configurations
+    BATCH_MAX_FILES = 500
+    BATCH_UPLOAD_CONCURRENCY = 8
+    BATCH_CAPTION_CONCURRENCY = 4
+    BATCH_TTS_CONCURRENCY = 4
+    BATCH_MAX_IN_FLIGHT = 64  # photos held in the pipeline at once
+
+    # Listing configurations
+    PAGE_SIZE_DEFAULT = 24
+    PAGE_SIZE_MAX = 100
+
+    # Response compression (brotli when installed, else gzip)
+    COMPRESSION_MIN_SIZE = 1024  # bytes; smaller bodies go out as they are. None disables
+    COMPRESSION_LEVELS = {'gzip': 6, 'br': 4}
+
+    # Album archives (/export, /import)
+    ARCHIVE_BATCH_SIZE = 200  # photos read or written per database batch
+    IMPORT_MAX_BYTES = 64 * 1024 ** 3  # /import bodies; MAX_CONTENT_LENGTH does not apply
+
+    # Backfills after a prompt or voice change (flask backfill)
+    BACKFILL_CHECKPOINT_PATH = INSTANCE_DIR / 'backfill.json'
+    BACKFILL_BATCH_SIZE = 50
+    BACKFILL_CONCURRENCY = 4  # photos in flight; upstream quotas still apply
+
+    # Change feed configurations (/photos/changes)
+    CHANGES_MAX_WAIT = 30  # longest long-poll, in seconds
+    CHANGES_POLL_INTERVAL = 1.0  # how often waiters look for writes by other workers
+    CHANGES_HEARTBEAT = 15  # seconds between keep-alives on the event stream
+
+    # Semantic search configurations (/search?mode=semantic)
+    SEMANTIC_INDEX_PATH = INSTANCE_DIR / 'semantic'  # None keeps it in memory
+    SEMANTIC_DIM = 128  # vector size; query time grows linearly with it
+    SEMANTIC_MIN_SCORE = 0.1  # cosine similarity below this is not a match
 
     # API configurations
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     GOOGLE_APPLICATION_CREDENTIALS = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+    WARM_UP = False  # build upstream clients in create_app() rather than on first use
+    VALIDATE_CREDENTIALS = False  # check Google credentials during warm-up
+    AWS_ID = os.getenv('AWS_ID')
+    AWS_KEY = os.getenv('AWS_KEY')
+    S3_BUCKET = 'accessible-photo-album'
+    S3_REGION = 'ap-south-1'
     
     # Flask configurations
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key')
@@ -18,16 +100,43 @@ class BaseConfig:
     
     # Image processing configurations
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+    MAX_IMAGE_PIXELS = 50_000_000  # checked from the header, before decoding
+    UPLOAD_MEMORY_BUDGET = 512 * 1024 * 1024  # decode memory all uploads in a process may hold
+    UPLOAD_MEMORY_WAIT = 5  # seconds an upload waits for that memory before a 503
     MAX_IMAGE_SIZE = (1920, 1080)  # Max dimensions for stored images
+    THUMBNAIL_SIZE = (320, 320)
+    JPEG_QUALITY = 80
+    IMAGE_WORKERS = None  # decode/resize processes; None uses every CPU
+
+    # Responsive derivatives served by /photos/<id>/image?w=
+    DERIVATIVE_WIDTHS = (320, 960, 1920)  # longest edge, capped by MAX_IMAGE_SIZE
+    DERIVATIVE_FORMATS = ('webp', 'jpeg')  # preference order; 'avif' needs Pillow 11.3+ or pillow-avif-plugin
+    DERIVATIVES_EAGER = True  # render at ingest; otherwise on first request
     
     # TTS configurations
     TTS_LANGUAGE_CODE = "en-US"
     TTS_VOICE_NAME = "en-US-Neural2-C"
     TTS_SPEAKING_RATE = 0.9
+    TTS_PITCH = 0.0
+    TTS_CACHE_SIZE = 4096  # cached syntheses kept before LRU eviction
+    TTS_CHUNK_CHARS = 400  # longer captions are voiced sentence-chunk by chunk
+    TTS_CHUNK_WORKERS = 4  # chunks synthesized in parallel
     
     # Captioning configurations
+    CAPTION_ENGINE = 'openai'  # 'openai' (direct vision API), 'autogen' or 'fake'
+    CAPTION_MODEL = 'gpt-4o'
     CAPTION_MAX_LENGTH = 1000
-    CAPTION_TEMPERATURE = 0.7
+    CAPTION_MAX_TOKENS = 300
+    CAPTION_TEMPERATURE = 0.95
+    CAPTION_IMAGE_SIZE = 512  # longest side of the inline image sent to the model
+    CAPTION_IMAGE_DETAIL = 'low'  # OpenAI vision detail level: 'low', 'high' or 'auto'
+    CAPTION_AGENT_POOL_SIZE = 4  # autogen agent pairs, one per concurrent caption
+    CAPTION_PROMPT_VERSION = 'v1'  # bump when the image agent prompt changes
+    CAPTION_PROMPT_TOKENS = 250  # system prompt, title and low-detail image, for rate limiting
+
+    # Result cache configurations (repeat uploads skip captioning and TTS)
+    RESULT_CACHE_SIZE = 1024  # entries kept in the photo store before LRU eviction
+    RESULT_CACHE_MAX_DISTANCE = 6  # dHash bits apart still counted as a duplicate; -1 disables
 
 class DevelopmentConfig(BaseConfig):
     """Development configuration."""
@@ -40,6 +149,12 @@ class TestingConfig(BaseConfig):
     TESTING = True
     # Use temporary directory for test photos
     PHOTO_STORAGE_PATH = Path('/tmp/test_photos')
+    BLOB_STORAGE_PATH = Path('/tmp/test_blobs')
+    STORAGE_BACKEND = 'local'
+    STORAGE_LOCAL_PATH = Path('/tmp/test_storage')
+    PHOTO_DB_BACKEND = 'memory'
+    SEMANTIC_INDEX_PATH = None
+    CAPTION_ENGINE = 'fake'
 
 class ProductionConfig(BaseConfig):
     """Production configuration."""
@@ -0,0 +1,89 @@
+import hashlib
+import io
+import tarfile
+import zipfile
+import pytest
+from app.models.blobs import BlobStore
+from app.models.store import MemoryPhotoStore
+from app.services.archive import MANIFEST_NAME, AlbumArchive
+
+IMAGE = b'image-one' * 3000
+
+
+class PhotoDatabase:
+    def __init__(self, root):
+        self.store = MemoryPhotoStore()
+        self.blobs = BlobStore(root)
+        self.batches = []
+
+    def add(self, photo_id, image, audio=None, **fields):
+        self.store.add_photo(photo_id, {
+            'title': photo_id, 'timestamp': f'2024-01-01T00:00:0{photo_id[-1]}',
+            'image_blob': self.blobs.put(image), 'image_mimetype': 'image/png',
+            'audio_blob': self.blobs.put(audio) if audio else None, **fields
+        })
+
+    def import_photos(self, items):
+        self.batches.append(len(items))
+        self.store.add_photos(items)
+
+
+def export_bytes(photo_db, archive_format, chunk_size=4):
+    chunks = list(AlbumArchive(photo_db, batch_size=2, chunk_size=chunk_size).export(archive_format))
+    # Blobs are copied chunk by chunk rather than read whole
+    assert max(map(len, chunks)) <= tarfile.RECORDSIZE < len(IMAGE)
+    return b''.join(chunks)
+
+
+@pytest.fixture
+def album(tmp_path):
+    photo_db = PhotoDatabase(tmp_path / 'source')
+    photo_db.add('p1', IMAGE, b'ID3 one', caption='Beach',
+                 variants={'320.webp': photo_db.blobs.put(b'webp bytes')})
+    photo_db.add('p2', b'image-two', caption='Hills')
+    photo_db.add('p3', IMAGE, b'ID3 one', caption='Beach again')
+    return photo_db
+
+
+@pytest.mark.parametrize('archive_format', ['tar', 'zip'])
+def test_export_round_trips_through_import(album, tmp_path, archive_format):
+    data = export_bytes(album, archive_format)
+    target = PhotoDatabase(tmp_path / 'target')
+    summary = AlbumArchive(target, batch_size=2).load(io.BytesIO(data), archive_format)
+
+    assert (summary['photos'], summary['failed']) == (3, 0)
+    # p3 shares p1's image and audio, which are exported once
+    assert summary['blobs'] == 4 and summary['blobs_existing'] == 0
+    assert target.batches == [2, 1]
+    assert target.store.get_photo('p1') == album.store.get_photo('p1')
+    assert target.blobs.read(target.store.get_photo('p1')['variants']['320.webp']) == b'webp bytes'
+
+    again = AlbumArchive(target).load(io.BytesIO(data), archive_format)
+    assert (again['photos'], again['photos_existing'], again['blobs']) == (0, 3, 0)
+
+
+def test_tar_export_is_readable_by_tarfile(album):
+    with tarfile.open(fileobj=io.BytesIO(export_bytes(album, 'tar'))) as archive:
+        names = archive.getnames()
+        manifest = archive.extractfile(MANIFEST_NAME).read().decode().splitlines()
+    assert names[-1] == MANIFEST_NAME
+    assert len([name for name in names if name.startswith('media/')]) == 4
+    assert len(manifest) == 3
+
+
+def test_import_reports_corrupt_media_and_missing_blobs(album, tmp_path):
+    zipped = io.BytesIO(export_bytes(album, 'zip'))
+    with zipfile.ZipFile(zipped) as archive:
+        entries = [(info.filename, archive.read(info)) for info in archive.infolist()]
+    tampered = io.BytesIO()
+    with zipfile.ZipFile(tampered, 'w') as archive:
+        for name, data in entries:
+            archive.writestr(name, b'tampered' if name.endswith('.mp3') else data)
+
+    summary = AlbumArchive(PhotoDatabase(tmp_path / 'target')).load(tampered, 'zip')
+    assert summary['photos'] == 1
+    # One bad blob, and the two photos that use it
+    assert summary['failed'] == 3
+    assert any('does not match' in error for error in summary['errors'])
+    # Nor was the bad blob stored under its own hash, to sit there unreferenced
+    assert not BlobStore(tmp_path / 'target').exists(hashlib.sha256(b'tampered').hexdigest())
@@ -0,0 +1,104 @@
+import pytest
+from app.models.store import MemoryPhotoStore
+from app.services.backfill import Backfill, Checkpoint
+from app.services.upstream import UpstreamUnavailable
+
+
+class FakeSynthesizer:
+    voice_version = 'voice2'
+
+
+class FakeAlbum:
+    prompt_version = 'v2'
+    synthesizer = FakeSynthesizer()
+
+    def __init__(self, photos, crash_on=None, unavailable=0):
+        self.photo_db = MemoryPhotoStore()
+        for i, (prompt_version, voice_version) in enumerate(photos):
+            self.photo_db.add_photo(f'p{i}', {
+                'caption': 'old caption', 'timestamp': f'2024-01-{i + 1:02d}',
+                'prompt_version': prompt_version, 'voice_version': voice_version,
+            })
+        self.crash_on = crash_on
+        self.unavailable = unavailable
+        self.calls = []
+
+    def regenerate_photo(self, photo_id, recaption=False):
+        if photo_id == self.crash_on:
+            raise KeyboardInterrupt
+        if self.unavailable:
+            self.unavailable -= 1
+            raise UpstreamUnavailable('tts is down', retry_after=0.5)
+        self.calls.append((photo_id, recaption))
+        photo = self.photo_db.get_photo(photo_id)
+        photo['voice_version'] = self.synthesizer.voice_version
+        if recaption:
+            photo['prompt_version'] = self.prompt_version
+        self.photo_db.add_photo(photo_id, photo)
+
+
+def test_only_stale_photos_are_regenerated(tmp_path):
+    album = FakeAlbum([('v2', 'voice2'), ('v1', 'voice2'), ('v2', 'voice1')])
+    progress = Backfill(album, Checkpoint(tmp_path / 'cp.json'), captions=True,
+                        batch_size=2).run()
+
+    assert sorted(album.calls) == [('p1', True), ('p2', False)]
+    assert (progress['updated'], progress['skipped'], progress['failed']) == (2, 1, 0)
+    assert progress['done'] and progress['scanned'] == progress['total'] == 3
+
+
+def test_audio_only_backfill_leaves_old_prompts(tmp_path):
+    album = FakeAlbum([('v1', 'voice2'), ('v1', 'voice1')])
+    Backfill(album, Checkpoint(tmp_path / 'cp.json')).run()
+    assert album.calls == [('p1', False)]
+
+
+def test_interrupted_run_resumes_from_last_finished_batch(tmp_path):
+    checkpoint = Checkpoint(tmp_path / 'cp.json')
+    album = FakeAlbum([('v2', 'voice1')] * 5, crash_on='p3')
+    with pytest.raises(KeyboardInterrupt):
+        Backfill(album, checkpoint, batch_size=2, concurrency=1).run()
+    assert checkpoint.load()['after'][1] == 'p1'
+
+    album.crash_on = None
+    album.calls.clear()
+    progress = Backfill(album, checkpoint, batch_size=2, concurrency=1).run()
+    assert [photo_id for photo_id, _ in album.calls] == ['p3', 'p4']
+    # p2 finished before the crash but its batch did not; it is skipped now
+    assert (progress['updated'], progress['skipped']) == (4, 1)
+    assert checkpoint.load() is None
+
+
+def test_finished_run_clears_its_checkpoint_so_the_next_starts_over(tmp_path):
+    checkpoint = Checkpoint(tmp_path / 'cp.json')
+    album = FakeAlbum([('v2', 'voice1')] * 3, unavailable=10)
+    progress = Backfill(album, checkpoint, max_waits=0).run()
+    assert progress['failed'] == 3 and progress['done']
+    assert not checkpoint.path.exists()
+
+    album.unavailable = 0
+    progress = Backfill(album, checkpoint).run()
+    assert sorted(photo_id for photo_id, _ in album.calls) == ['p0', 'p1', 'p2']
+    assert progress['updated'] == 3
+
+
+def test_checkpoint_for_another_target_is_ignored(tmp_path):
+    checkpoint = Checkpoint(tmp_path / 'cp.json')
+    checkpoint.save({'target': {'prompt_version': None, 'voice_version': 'voice0'},
+                     'after': ['2024-01-09', 'p9'], 'counts': {}})
+    album = FakeAlbum([('v2', 'voice1')])
+    Backfill(album, checkpoint).run()
+    assert album.calls == [('p0', False)]
+
+
+def test_unavailable_upstream_is_waited_out(tmp_path):
+    waits = []
+    album = FakeAlbum([('v2', 'voice1')], unavailable=2)
+    progress = Backfill(album, Checkpoint(tmp_path / 'cp.json'), sleep=waits.append).run()
+    assert waits == [0.5, 0.5]
+    assert progress['updated'] == 1
+
+    album = FakeAlbum([('v2', 'voice1')], unavailable=10)
+    progress = Backfill(album, Checkpoint(tmp_path / 'cp2.json'), max_waits=1,
+                        sleep=lambda seconds: None).run()
+    assert progress['failed'] == 1
@@ -1,5 +1,14 @@
+import gzip
+import io
+import json
 import pytest
-from app.main import create_app
+from concurrent.futures import ThreadPoolExecutor
+from app.main import PhotoDatabase, create_app
+from app.models.blobs import BlobStore
+from app.models.store import SQLitePhotoStore
+from app.services.jobs import Deferred
+from app.services.storage import LocalStorage
+from app.services.upstream import UpstreamUnavailable
 from config.config import TestingConfig
 
 @pytest.fixture
@@ -14,4 +23,183 @@ def client(app):
 def test_health_check(client):
     response = client.get('/health')
     assert response.status_code == 200
-    assert response.json['status'] == 'healthy'
\ No newline at end of file
+    assert response.json['status'] == 'healthy'
+
+def test_upstream_clients_are_built_on_first_use(client):
+    response = client.get('/health')
+    assert response.json['clients'] == {'tts_client': False, 's3_client': False}
+
+
+def test_routes_use_the_app_services(app, client):
+    album = app.extensions['album']['photo_album']
+    album.photo_db.add_photo('p1', b'image', None, 'Beach', 'Waves at sunset', None)
+
+    response = client.get('/photos')
+    assert response.status_code == 200
+    assert [photo['id'] for photo in response.json['photos']] == ['p1']
+
+
+def test_responses_carry_trace_id_and_server_timing(client):
+    response = client.get('/photos', headers={'X-Request-ID': 'trace-123'})
+    assert response.headers['X-Request-ID'] == 'trace-123'
+    assert 'total;dur=' in response.headers['Server-Timing']
+    assert client.get('/health').headers['X-Request-ID'] != 'trace-123'
+
+
+def test_metrics_endpoint_uses_prometheus_text_format(client):
+    client.get('/photos')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    assert '# TYPE album_http_request_seconds histogram' in response.get_data(as_text=True)
+
+
+def test_photo_changes_returns_deltas_after_cursor(app, client):
+    photo_db = app.extensions['album']['photo_album'].photo_db
+    photo_db.add_photo('p1', b'image', None, 'Beach', 'Waves at sunset', None)
+
+    first = client.get('/photos/changes?fields=id,title').json
+    assert first['photos'] == [{'id': 'p1', 'title': 'Beach'}]
+    assert not first['has_more']
+
+    photo_db.add_photo('p2', b'image', None, 'Hills', 'Green hills', None)
+    second = client.get(f"/photos/changes?since={first['cursor']}&fields=id").json
+    assert second['photos'] == [{'id': 'p2'}]
+    assert client.get('/photos/changes?since=bogus').status_code == 400
+
+
+def test_upload_rejects_disallowed_files_before_storing(app, client):
+    response = client.post('/upload', data={
+        'photo': (io.BytesIO(b'GIF89a'), 'notes.gif'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 415
+    assert client.get('/photos').json['photos'] == []
+
+
+def test_large_json_responses_are_compressed(app, client):
+    photo_db = app.extensions['album']['photo_album'].photo_db
+    for i in range(40):
+        photo_db.add_photo(f'p{i}', b'image', None, f'Beach {i}', 'Waves at sunset ' * 20, None)
+
+    plain = client.get('/photos?limit=40&fields=id,caption')
+    assert 'Content-Encoding' not in plain.headers
+    compressed = client.get('/photos?limit=40&fields=id,caption',
+                            headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    body = compressed.get_data()
+    assert json.loads(gzip.decompress(body)) == plain.json
+    assert len(body) < len(plain.get_data()) / 4
+
+
+class FakeCaptionEngine:
+    def stream(self, image_uri, title):
+        yield 'Waves at sunset. '
+        yield 'Grandma laughs.'
+
+
+class FakeSynthesizer:
+    executor = ThreadPoolExecutor(2)
+    voice_version = 'voice1'
+
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def synthesize_chunk(self, text):
+        # The last sentence is voiced once the caption is complete
+        if self.fail and text == 'Grandma laughs.':
+            raise UpstreamUnavailable('tts throttled', retry_after=7)
+        return b'mp3'
+
+    def remember(self, text, audio):
+        pass
+
+
+@pytest.fixture
+def narrating_album(app, monkeypatch):
+    album = app.extensions['album']['photo_album']
+    album.photo_db.add_photo('p1', b'jpeg', None, 'Beach', None, None, status='processing')
+    monkeypatch.setattr(album, 'prepare_image', lambda data: {
+        'storage': data, 'model': data, 'thumbnail': b'thumb', 'variants': {}
+    })
+    monkeypatch.setattr(album, 'upload_image', lambda data: 'https://example.invalid/p1.jpg')
+    album.caption_engine = FakeCaptionEngine()
+    deferred = []
+    monkeypatch.setattr(album.job_queue, 'defer',
+                        lambda payload, retry_after=None, error=None: deferred.append((payload, error)))
+    return album, deferred
+
+
+def test_narration_left_by_the_client_is_finished_by_a_job(narrating_album):
+    album, deferred = narrating_album
+    album.synthesizer = FakeSynthesizer()
+
+    events = album.narrate_photo('p1')
+    assert next(events)[0] == 'accepted'
+    assert next(events)[0] == 'caption'
+    events.close()
+
+    assert deferred == [({'photo_id': 'p1'}, 'Client disconnected')]
+    assert album.photo_db.get_photo('p1')['status'] == 'processing'
+
+
+def test_narration_deferred_by_tts_keeps_the_streamed_caption(narrating_album):
+    album, deferred = narrating_album
+    album.synthesizer = FakeSynthesizer(fail=True)
+
+    events = list(album.narrate_photo('p1'))
+
+    assert events[-1] == ('deferred', {'photo_id': 'p1', 'retry_after': 7})
+    photo = album.photo_db.get_photo('p1')
+    assert photo['caption'] == 'Waves at sunset. Grandma laughs.'
+    assert photo['status'] == 'awaiting_audio'
+    assert deferred == [({'photo_id': 'p1'}, 'tts throttled')]
+
+
+class FailingStorage:
+    def put_content(self, data, prefix='photos', suffix='.jpg'):
+        raise OSError('503 Slow Down')
+
+
+def test_failed_storage_upload_keeps_the_caption_and_defers(app, monkeypatch):
+    album = app.extensions['album']['photo_album']
+    album.photo_db.add_photo('p1', b'jpeg', None, 'Beach', None, None, status='processing')
+    monkeypatch.setattr(album, 'prepare_image', lambda data: {
+        'storage': data, 'model': data, 'thumbnail': b'thumb', 'variants': {}
+    })
+    captions = []
+    monkeypatch.setattr(album, 'caption_image',
+                        lambda data, title: captions.append(title) or 'Waves at sunset')
+    album.storage = FailingStorage()
+
+    with pytest.raises(Deferred, match='Storage upload failed'):
+        album.process_photo('p1')
+    photo = album.photo_db.get_photo('p1')
+    assert photo['caption'] == 'Waves at sunset' and photo['status'] != 'failed'
+
+    # The next run only uploads: the caption is not generated again
+    album.storage = LocalStorage(app.config['STORAGE_LOCAL_PATH'])
+    monkeypatch.setattr(album, 'text_to_speech', lambda text: b'mp3')
+    assert album.process_photo('p1')['cached'] is False
+    assert captions == [None]
+    assert album.photo_db.get_photo('p1')['image_url']
+
+
+def test_workers_sharing_a_database_do_not_lose_updates(tmp_path):
+    # A lazy render in one worker and the caption job in another
+    blobs = BlobStore(tmp_path / 'blobs')
+    renderer = PhotoDatabase(SQLitePhotoStore(tmp_path / 'album.db'), blobs)
+    worker = PhotoDatabase(SQLitePhotoStore(tmp_path / 'album.db'), blobs)
+    renderer.add_photo('p1', b'image', None, 'Beach', None, None, status='processing')
+
+    with ThreadPoolExecutor(8) as pool:
+        renders = [pool.submit(renderer.add_variants, 'p1', {f'w{w}.webp': b'%d' % w})
+                   for w in range(16)]
+        pool.submit(worker.update_photo, 'p1', audio=b'mp3', caption='Waves at sunset',
+                    status='ready').result()
+        for render in renders:
+            render.result()
+
+    photo = renderer.get_photo('p1')
+    assert (photo['status'], photo['caption']) == ('ready', 'Waves at sunset')
+    assert photo['audio_blob'] and len(photo['variants']) == 16
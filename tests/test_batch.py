@@ -0,0 +1,144 @@
+import io
+import tarfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from app.models.store import MemoryPhotoStore
+from app.services.batch import BatchProcessor, iter_archive
+from app.services.imaging import preprocess_image
+from app.services.jobs import DONE, FAILED, JobQueue
+
+
+class FakePhotoDatabase:
+    def __init__(self):
+        self.updates = {}
+
+    def update_photo(self, photo_id, audio=None, thumbnail=None, **fields):
+        self.updates.setdefault(photo_id, {}).update(fields, audio=audio, thumbnail=thumbnail)
+
+
+class FakeAlbum:
+    """Records peak concurrency of each upstream call."""
+
+    prompt_version = 'v1'
+    voice_version = 'voice1'
+    prepare = staticmethod(preprocess_image)
+    job_queue = None
+
+    def __init__(self, delay=0.02):
+        self.photo_db = FakePhotoDatabase()
+        self.remembered = []
+        self.delay = delay
+        self.active = {'caption': 0}
+        self.peak = {'caption': 0}
+        self.lock = threading.Lock()
+
+    def cached_result(self, photo_id):
+        if photo_id == 'cached':
+            return {'caption': 'From the cache', 'audio_blob': 'abc', 'audio_mimetype': 'audio/mpeg'}
+        return None
+
+    def stored_image(self, photo_id):
+        return jpeg_bytes()
+
+    def remember_result(self, photo_id):
+        self.remembered.append(photo_id)
+
+    def upload_image(self, jpeg_data):
+        return f"https://example.invalid/{len(jpeg_data)}.jpg"
+
+    def caption_image(self, jpeg_data, title):
+        with self.lock:
+            self.active['caption'] += 1
+            self.peak['caption'] = max(self.peak['caption'], self.active['caption'])
+        time.sleep(self.delay)
+        with self.lock:
+            self.active['caption'] -= 1
+        return 'fail' if title == 'bad' else f"A story about {len(jpeg_data)} bytes"
+
+    def text_to_speech(self, text):
+        if text == 'fail':
+            raise RuntimeError('tts down')
+        return b'mp3'
+
+
+def jpeg_bytes(color='red'):
+    buffered = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffered, format='JPEG')
+    return buffered.getvalue()
+
+
+def test_batch_respects_stage_limits_and_reports_each_photo():
+    album = FakeAlbum()
+    processor = BatchProcessor(album, cpu_pool=ProcessPoolExecutor(2), caption_concurrency=2,
+                               max_in_flight=4)
+    items = [(f'p{i}', jpeg_bytes(), 'bad' if i == 3 else None) for i in range(8)]
+    items.append(('cached', jpeg_bytes(), None))
+    items.append(('stored', None, None))
+
+    results = {r['photo_id']: r for r in processor.run(items)}
+    processor.shutdown()
+
+    assert len(results) == 10
+    assert results['stored']['status'] == 'ready'
+    assert results['cached']['cached'] is True and results['p0']['cached'] is False
+    assert 'cached' not in album.remembered and 'p0' in album.remembered
+    # A cache hit still gets this upload's own copies, but no new caption or audio
+    cached = album.photo_db.updates['cached']
+    assert cached['caption'] == 'From the cache' and cached['audio_blob'] == 'abc'
+    assert cached['image_url'].startswith('https://') and cached['thumbnail']
+    assert album.peak['caption'] <= 2
+    assert results['p3']['status'] == 'failed'
+    assert album.photo_db.updates['p3']['status'] == 'failed'
+    assert results['p0']['status'] == 'ready'
+    assert set(results['p0']['timings']) == {'prepare', 'upload', 'caption', 'voice'}
+    assert album.photo_db.updates['p0']['image_url'].startswith('https://example.invalid/')
+    assert album.photo_db.updates['p0']['audio'] == b'mp3'
+    assert album.photo_db.updates['p0']['thumbnail'].startswith(b'\xff\xd8')
+
+
+def test_batch_photos_have_jobs_that_end_with_them():
+    album = FakeAlbum(delay=0)
+    album.job_queue = JobQueue(MemoryPhotoStore(), lambda job, set_state: None)
+    processor = BatchProcessor(album, cpu_pool=ProcessPoolExecutor(1))
+    items = [('good', jpeg_bytes(), None), ('bad', jpeg_bytes(), 'bad')]
+
+    results = {r['photo_id']: r for r in processor.run(items)}
+    processor.shutdown()
+    album.job_queue.shutdown()
+
+    good = album.job_queue.get(results['good']['job_id'])
+    assert good['state'] == DONE and good['payload'] == {'photo_id': 'good'}
+    assert album.job_queue.get(results['bad']['job_id'])['state'] == FAILED
+
+
+def test_iter_archive_reads_zip_and_tar_images_only():
+    data = jpeg_bytes()
+    zipped = io.BytesIO()
+    with zipfile.ZipFile(zipped, 'w') as archive:
+        archive.writestr('trip/a.jpg', data)
+        archive.writestr('trip/notes.txt', b'hello')
+        archive.writestr('__MACOSX/._a.jpg', b'junk')
+
+    tarred = io.BytesIO()
+    with tarfile.open(fileobj=tarred, mode='w:gz') as archive:
+        info = tarfile.TarInfo('b.JPEG')
+        info.size = len(data)
+        archive.addfile(info, io.BytesIO(data))
+
+    assert [name for name, _ in iter_archive(zipped, {'jpg', 'jpeg'})] == ['trip/a.jpg']
+    assert list(iter_archive(tarred, {'jpg', 'jpeg'})) == [('b.JPEG', data)]
+
+
+def test_iter_archive_skips_members_over_the_size_limit():
+    data = jpeg_bytes()
+    zipped = io.BytesIO()
+    with zipfile.ZipFile(zipped, 'w') as archive:
+        archive.writestr('small.jpg', data)
+        archive.writestr('huge.jpg', data * 4)
+
+    assert list(iter_archive(zipped, {'jpg'}, max_bytes=len(data))) == [
+        ('small.jpg', data), ('huge.jpg', None)
+    ]
@@ -0,0 +1,29 @@
+import io
+import hashlib
+import pytest
+from app.models.blobs import BlobStore
+
+
+def test_put_is_content_addressed_and_sharded(tmp_path):
+    blobs = BlobStore(tmp_path)
+    digest = blobs.put(b'hello')
+
+    assert digest == hashlib.sha256(b'hello').hexdigest()
+    assert blobs.path(digest) == tmp_path / digest[:2] / digest[2:4] / digest
+    assert blobs.read(digest) == b'hello'
+    assert blobs.put(b'hello') == digest
+
+
+def test_put_file_streams_and_leaves_no_temp_files(tmp_path):
+    blobs = BlobStore(tmp_path)
+    data = b'x' * (3 * 1024 * 1024 + 5)
+    digest = blobs.put_file(io.BytesIO(data))
+
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert blobs.size(digest) == len(data)
+    assert not [p for p in tmp_path.rglob('.*') if p.is_file()]
+
+
+def test_path_rejects_bad_digests(tmp_path):
+    with pytest.raises(ValueError):
+        BlobStore(tmp_path).path('../../etc/passwd')
@@ -0,0 +1,70 @@
+import io
+import pytest
+from PIL import Image, ImageDraw
+from app.models.store import MemoryPhotoStore, SQLitePhotoStore
+from app.services.cache import ResultCache
+from app.services.imaging import dhash, hamming_distance
+from app.services.metrics import metrics
+
+RESULT = {'caption': 'A day at the beach', 'audio_blob': 'abc'}
+
+
+def sample_image():
+    image = Image.new('RGB', (640, 480), 'skyblue')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 300, 640, 480), fill='khaki')
+    draw.ellipse((400, 40, 520, 160), fill='yellow')
+    return image
+
+
+def reencode(image, size, quality):
+    buffered = io.BytesIO()
+    image.resize(size).save(buffered, format='JPEG', quality=quality)
+    return Image.open(io.BytesIO(buffered.getvalue()))
+
+
+def test_dhash_survives_resave_but_not_a_different_photo():
+    original = dhash(reencode(sample_image(), (640, 480), 95))
+    resaved = dhash(reencode(sample_image(), (320, 240), 60))
+    other = dhash(reencode(sample_image().transpose(Image.Transpose.FLIP_TOP_BOTTOM), (640, 480), 95))
+
+    assert hamming_distance(original, resaved) <= 6
+    assert hamming_distance(original, other) > 6
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryPhotoStore()
+    return SQLitePhotoStore(tmp_path / 'album.db')
+
+
+def test_exact_and_near_duplicate_hits_are_counted(store):
+    cache = ResultCache(store, max_distance=4)
+    cache.put('sha-a', 0b1111, 'Beach', 'v1', RESULT)
+
+    assert cache.get('sha-a', 0b1111, 'Beach', 'v1') == RESULT
+    assert cache.get('sha-b', 0b1110, 'Beach', 'v1') == RESULT
+    assert cache.get('sha-b', 0b1110, 'Party', 'v1') is None
+    assert cache.get('sha-a', 0b1111, 'Beach', 'v2') is None
+    assert cache.stats() == {'hits': 1, 'near_hits': 1, 'misses': 2}
+    assert metrics.cache_lookups.value(cache='result', outcome='near_hit') >= 1
+
+
+def test_lru_eviction(store):
+    cache = ResultCache(store, max_entries=2, max_distance=-1)
+    cache.put('a', None, None, 'v1', RESULT)
+    cache.put('b', None, None, 'v1', RESULT)
+    cache.get('a', None, None, 'v1')
+    cache.put('c', None, None, 'v1', RESULT)
+
+    assert cache.get('b', None, None, 'v1') is None
+    assert cache.get('a', None, None, 'v1') == RESULT
+
+
+def test_entries_outlive_the_process_and_are_shared(tmp_path):
+    ResultCache(SQLitePhotoStore(tmp_path / 'album.db')).put('sha-a', 0b1111, 'Beach', 'v1', RESULT)
+
+    other_worker = ResultCache(SQLitePhotoStore(tmp_path / 'album.db'), max_distance=4)
+    assert other_worker.get('sha-a', None, 'Beach', 'v1') == RESULT
+    assert other_worker.get('sha-c', 0b0111, 'Beach', 'v1') == RESULT
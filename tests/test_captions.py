@@ -0,0 +1,60 @@
+import threading
+import time
+import pytest
+from app.services.captions import (
+    AutogenCaptionEngine, FakeCaptionEngine, OpenAIVisionEngine, create_caption_engine, jpeg_data_uri
+)
+
+
+def test_fake_engine_is_deterministic_and_streams_the_same_text():
+    engine = FakeCaptionEngine()
+    uri = jpeg_data_uri(b'\xff\xd8fake')
+
+    assert engine.caption(uri, 'Goa trip') == engine.caption(uri, 'Goa trip')
+    assert engine.caption(uri, 'Goa trip') != engine.caption(jpeg_data_uri(b'other'), 'Goa trip')
+    assert ''.join(engine.stream(uri, 'Goa trip')) == engine.caption(uri, 'Goa trip')
+    assert engine.caption(uri, 'Goa trip').endswith('Goa trip.')
+
+
+def test_openai_engine_sends_inline_image_with_detail():
+    engine = OpenAIVisionEngine(detail='low')
+    user_turn = engine.messages('data:image/jpeg;base64,AAAA', 'Beach')[1]['content']
+
+    assert user_turn[1]['image_url'] == {'url': 'data:image/jpeg;base64,AAAA', 'detail': 'low'}
+
+
+class FakeAgentPair:
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def initiate_chat(self, agent, message, clear_history):
+        with FakeAgentPair.lock:
+            FakeAgentPair.active += 1
+            FakeAgentPair.peak = max(FakeAgentPair.peak, FakeAgentPair.active)
+        time.sleep(0.02)
+        with FakeAgentPair.lock:
+            FakeAgentPair.active -= 1
+        return type('Result', (), {'summary': message})()
+
+
+def test_autogen_engine_never_shares_an_agent_pair_between_threads():
+    engine = AutogenCaptionEngine(pool_size=2)
+    created = []
+    engine._create_pair = lambda: created.append(1) or (FakeAgentPair(), object())
+
+    threads = [threading.Thread(target=engine.caption, args=('data:x', None)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 2
+    assert FakeAgentPair.peak <= 2
+
+
+def test_create_caption_engine():
+    assert isinstance(create_caption_engine({'CAPTION_ENGINE': 'fake'}), FakeCaptionEngine)
+    assert create_caption_engine({'CAPTION_ENGINE': 'openai', 'CAPTION_IMAGE_DETAIL': 'high'}).detail == 'high'
+    with pytest.raises(ValueError):
+        create_caption_engine({'CAPTION_ENGINE': 'nope'})
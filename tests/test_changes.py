@@ -0,0 +1,67 @@
+import threading
+from app.models.store import MemoryPhotoStore
+from app.services.changes import ChangeFeed
+
+
+class Album:
+    """The slice of PhotoDatabase a ChangeFeed reads."""
+
+    def __init__(self):
+        self.store = MemoryPhotoStore()
+        self.changed = threading.Condition()
+
+    def add(self, photo_id, title):
+        self.store.add_photo(photo_id, {'title': title})
+        with self.changed:
+            self.changed.notify_all()
+
+    def changes_since(self, version, limit):
+        return self.store.changes_since(version, limit)
+
+    def version(self):
+        return self.store.version()
+
+
+def test_page_returns_changes_in_write_order_with_next_cursor():
+    album = Album()
+    for photo_id in ('a', 'b', 'c'):
+        album.add(photo_id, photo_id.upper())
+    feed = ChangeFeed(album)
+
+    changes, version, has_more = feed.page(0, 2)
+    assert [photo_id for photo_id, _, _ in changes] == ['a', 'b']
+    assert has_more
+
+    album.add('a', 'A again')
+    changes, version, has_more = feed.page(version, 2)
+    assert [(photo_id, photo['title']) for photo_id, photo, _ in changes] == [
+        ('c', 'C'), ('a', 'A again')
+    ]
+    assert not has_more
+    assert feed.page(version, 2) == ([], version, False)
+
+
+def test_wait_wakes_on_write_and_times_out_when_quiet():
+    album = Album()
+    feed = ChangeFeed(album, poll_interval=5)
+    assert not feed.wait(0, 0.05)
+
+    threading.Timer(0.05, album.add, ('a', 'A')).start()
+    assert feed.wait(0, 2)
+
+
+def test_follow_yields_heartbeats_between_batches():
+    album = Album()
+    album.add('a', 'A')
+    stop = threading.Event()
+    batches = ChangeFeed(album, poll_interval=0.01).follow(0, 10, heartbeat=0.05, stop=stop)
+
+    changes, version = next(batches)
+    assert [photo_id for photo_id, _, _ in changes] == ['a']
+    assert next(batches) == ([], version)
+
+    album.add('b', 'B')
+    changes, _ = next(batches)
+    assert [photo_id for photo_id, _, _ in changes] == ['b']
+    stop.set()
+    assert next(batches, None) is None
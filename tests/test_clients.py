@@ -0,0 +1,20 @@
+import os
+from unittest import mock
+
+from app.services.clients import LazyClient
+
+
+def test_lazy_client_builds_once_per_process():
+    built = []
+    client = LazyClient(lambda: built.append(1) or object())
+    assert not client.built and not built
+
+    first = client()
+    assert client() is first
+    assert client.built and len(built) == 1
+
+    # A forked worker must not reuse its parent's client
+    with mock.patch('os.getpid', return_value=os.getpid() + 1):
+        assert not client.built
+        assert client() is not first
+    assert len(built) == 2
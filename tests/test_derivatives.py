@@ -0,0 +1,81 @@
+import io
+import pytest
+from PIL import Image
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from app.models.blobs import BlobStore
+from app.services.derivatives import Derivatives
+from app.services.imaging import supported_formats
+
+
+class FakePhotoDatabase:
+    def __init__(self, blobs):
+        self.blobs = blobs
+        self.photos = {}
+        self.renders = 0
+
+    def add_variants(self, photo_id, variants):
+        self.renders += 1
+        stored = self.photos[photo_id].setdefault('variants', {})
+        stored.update({name: self.blobs.put(data) for name, data in variants.items()})
+        return stored
+
+
+def accept(header):
+    return parse_accept_header(header, MIMEAccept)
+
+
+@pytest.fixture
+def photo_db(tmp_path):
+    db = FakePhotoDatabase(BlobStore(tmp_path))
+    buffered = io.BytesIO()
+    Image.new('RGB', (2000, 1000), 'green').save(buffered, format='PNG')
+    db.photos['p1'] = {'image_blob': db.blobs.put(buffered.getvalue())}
+    return db
+
+
+def test_pick_width_rounds_up_to_a_configured_size(photo_db):
+    derivatives = Derivatives(photo_db, widths=(960, 320, 1920))
+
+    assert derivatives.pick_width('100') == 320
+    assert derivatives.pick_width('321') == 960
+    assert derivatives.pick_width('5000') == 1920
+    with pytest.raises(ValueError):
+        derivatives.pick_width('wide')
+    with pytest.raises(ValueError):
+        derivatives.pick_width('0')
+
+
+def test_negotiate_prefers_server_order_among_accepted_formats(photo_db):
+    derivatives = Derivatives(photo_db, formats=('webp', 'jpeg'))
+
+    assert derivatives.negotiate(accept('image/avif,image/webp,*/*;q=0.8')) == 'webp'
+    assert derivatives.negotiate(accept('image/webp,image/*;q=0.5')) == 'webp'
+    assert derivatives.negotiate(accept('image/jpeg')) == 'jpeg'
+    assert derivatives.negotiate(accept('')) == 'jpeg'
+
+
+def test_formats_pillow_cannot_encode_are_dropped(photo_db):
+    derivatives = Derivatives(photo_db, formats=('avif', 'webp', 'jpeg'))
+
+    assert derivatives.formats == supported_formats(('avif', 'webp', 'jpeg'))
+    assert supported_formats(('heic', 'jpeg')) == ('jpeg',)
+
+
+@pytest.mark.skipif(not supported_formats(('avif',)), reason='Pillow built without AVIF')
+def test_negotiate_offers_avif_when_pillow_encodes_it(photo_db):
+    derivatives = Derivatives(photo_db, formats=('avif', 'webp', 'jpeg'))
+
+    assert derivatives.negotiate(accept('image/avif,image/webp,*/*;q=0.8')) == 'avif'
+
+
+def test_get_renders_missing_derivatives_once(photo_db):
+    derivatives = Derivatives(photo_db, widths=(320,), formats=('webp',))
+    photo = photo_db.photos['p1']
+
+    digest = derivatives.get('p1', photo, 320, 'webp')
+    assert derivatives.get('p1', photo, 320, 'webp') == digest
+    assert photo_db.renders == 1
+
+    image = Image.open(photo_db.blobs.open(digest))
+    assert (image.format, image.size) == ('WEBP', (320, 160))
@@ -0,0 +1,51 @@
+import gzip
+import json
+import zlib
+import pytest
+from app.api import encoding
+from app.api.encoding import (
+    compress, dumps, is_compressible, iter_compress, iter_json, prefers_msgpack
+)
+
+
+class Accept:
+    def __init__(self, **qualities):
+        self.qualities = qualities
+
+    def quality(self, mimetype):
+        return self.qualities.get(mimetype.split('/')[1], self.qualities.get('any', 0))
+
+
+@pytest.mark.parametrize('count', [0, 1, 32, 33, 100])
+def test_iter_json_matches_one_shot_encoding(count):
+    payload = {'total': count, 'photos': [{'id': str(i), 'title': 'é'} for i in range(count)],
+               'next_cursor': None}
+    body = b''.join(iter_json(payload, 'photos', batch=32))
+
+    assert json.loads(body) == payload
+    assert json.loads(b''.join(iter_json({'photos': []}, 'photos'))) == {'photos': []}
+
+
+def test_gzip_round_trips_whole_and_streamed():
+    body = dumps({'caption': 'waves at sunset ' * 200})
+    assert gzip.decompress(compress(body, 'gzip', 6)) == body
+
+    streamed = b''.join(iter_compress([body[:100], b'', body[100:]], 'gzip', 6))
+    assert zlib.decompress(streamed, 16 + zlib.MAX_WBITS) == body
+
+
+def test_only_text_and_json_are_compressible():
+    assert is_compressible('application/json')
+    assert is_compressible('text/plain')
+    assert not is_compressible('image/jpeg')
+    assert not is_compressible('audio/mpeg')
+    assert not is_compressible('text/event-stream')
+
+
+def test_msgpack_only_when_asked_for(monkeypatch):
+    monkeypatch.setattr(encoding, 'msgpack', object())
+    assert prefers_msgpack(Accept(msgpack=1, json=0.5))
+    assert not prefers_msgpack(Accept(any=1))
+
+    monkeypatch.setattr(encoding, 'msgpack', None)
+    assert not prefers_msgpack(Accept(msgpack=1))
@@ -0,0 +1,95 @@
+import pytest
+from flask import Flask, jsonify
+from app.api.http import conditional_json, listing_etag, not_modified, send_blob, with_weak_etag
+from app.models.blobs import BlobStore
+
+AUDIO = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def client(tmp_path):
+    blobs = BlobStore(tmp_path)
+    digest = blobs.put(AUDIO)
+    app = Flask(__name__)
+    state = {'version': 1, 'queries': 0}
+
+    @app.route('/audio')
+    def audio():
+        return send_blob(blobs.path(digest), 'audio/mpeg', digest)
+
+    @app.route('/media')
+    def media():
+        return send_blob(blobs.path(digest), 'audio/mpeg', digest, immutable=True)
+
+    @app.route('/detail')
+    def detail():
+        return conditional_json({'caption': 'By the sea'})
+
+    @app.route('/listing')
+    def listing():
+        etag = listing_etag(f"album-{state['version']}")
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
+        state['queries'] += 1
+        return with_weak_etag(jsonify({'photos': []}), etag)
+
+    client = app.test_client()
+    client.digest, client.state = digest, state
+    return client
+
+
+def test_blob_has_strong_content_etag_and_revalidates(client):
+    response = client.get('/audio')
+    assert response.headers['ETag'] == f'"{client.digest}"'
+    assert 'no-cache' in response.headers['Cache-Control']
+
+    revalidated = client.get('/audio', headers={'If-None-Match': f'"{client.digest}"'})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+
+
+def test_blob_supports_range_requests(client):
+    response = client.get('/audio', headers={'Range': 'bytes=100-199'})
+
+    assert response.status_code == 206
+    assert response.data == AUDIO[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(AUDIO)}'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+
+def test_content_addressed_media_is_immutable(client):
+    cache_control = client.get('/media').headers['Cache-Control']
+
+    assert 'immutable' in cache_control
+    assert 'max-age=31536000' in cache_control
+    assert 'no-cache' not in cache_control
+
+
+def test_detail_json_gets_body_etag(client):
+    etag = client.get('/detail').headers['ETag']
+
+    assert client.get('/detail', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/detail', headers={'If-None-Match': '"stale"'}).status_code == 200
+
+
+def test_listing_answers_304_without_querying_until_version_moves(client):
+    etag = client.get('/listing').headers['ETag']
+    assert etag.startswith('W/"album-1-')
+
+    assert client.get('/listing', headers={'If-None-Match': etag}).status_code == 304
+    assert client.state['queries'] == 1
+
+    client.state['version'] = 2
+    assert client.get('/listing', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_listing_pages_get_their_own_etags(client):
+    first = client.get('/listing?limit=2').headers['ETag']
+    second = client.get('/listing?limit=2&cursor=abc').headers['ETag']
+    assert first != second
+    assert client.get('/listing?cursor=abc&limit=2').headers['ETag'] == second
+
+    assert client.get('/listing?limit=2&cursor=abc', headers={'If-None-Match': first}).status_code == 200
+    assert client.get('/listing?limit=2&cursor=abc', headers={'If-None-Match': second}).status_code == 304
+    assert client.get('/listing?query=sea', headers={'If-None-Match': first}).status_code == 200
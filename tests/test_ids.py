@@ -0,0 +1,12 @@
+from app.utils.ids import ALPHABET, new_ulid
+
+
+def test_ulids_are_unique_and_ordered_within_a_millisecond():
+    ids = [new_ulid(now=1700000000.0) for _ in range(1000)]
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert all(len(i) == 26 and set(i) <= set(ALPHABET) for i in ids)
+
+
+def test_ulids_sort_by_time():
+    assert new_ulid(now=1700000000.0) < new_ulid(now=1700000001.0)
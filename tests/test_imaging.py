@@ -0,0 +1,60 @@
+import io
+from PIL import Image
+from app.services.imaging import preprocess_image
+
+
+def jpeg_with_orientation(size, orientation):
+    image = Image.new('RGB', size, 'white')
+    # Mark the top-left corner so orientation can be checked after decoding
+    image.paste(Image.new('RGB', (size[0] // 4, size[1] // 4), 'black'), (0, 0))
+    exif = image.getexif()
+    exif[0x0112] = orientation
+    buffered = io.BytesIO()
+    image.save(buffered, format='JPEG', exif=exif)
+    return buffered.getvalue()
+
+
+def open_jpeg(data):
+    return Image.open(io.BytesIO(data))
+
+
+def test_preprocess_produces_capped_derivatives_from_one_decode():
+    derivatives = preprocess_image(jpeg_with_orientation((4000, 3000), 1))
+
+    assert (derivatives['width'], derivatives['height']) == (4000, 3000)
+    assert open_jpeg(derivatives['storage']).size == (1440, 1080)
+    assert open_jpeg(derivatives['model']).size == (512, 384)
+    assert open_jpeg(derivatives['thumbnail']).size == (320, 240)
+
+
+def test_preprocess_applies_exif_orientation():
+    derivatives = preprocess_image(jpeg_with_orientation((800, 400), 6), thumbnail_size=(64, 64))
+    model = open_jpeg(derivatives['model'])
+
+    assert (derivatives['width'], derivatives['height']) == (400, 800)
+    assert model.size == (256, 512)
+    # Rotating 90° clockwise moves the marked corner to the top right
+    assert model.getpixel((model.width - 5, 5))[0] < 64
+    assert model.getpixel((5, 5))[0] > 192
+
+
+def test_preprocess_handles_png_with_alpha():
+    buffered = io.BytesIO()
+    Image.new('RGBA', (600, 600), (0, 0, 255, 128)).save(buffered, format='PNG')
+    derivatives = preprocess_image(buffered.getvalue())
+
+    assert open_jpeg(derivatives['thumbnail']).mode == 'RGB'
+
+
+def test_preprocess_renders_requested_variants_from_the_same_decode():
+    derivatives = preprocess_image(
+        jpeg_with_orientation((4000, 3000), 1),
+        variant_widths=(320, 2400), variant_formats=('webp', 'jpeg')
+    )
+    variants = derivatives['variants']
+
+    assert set(variants) == {'320.webp', '320.jpeg', '2400.webp', '2400.jpeg'}
+    assert open_jpeg(variants['320.webp']).format == 'WEBP'
+    assert open_jpeg(variants['320.jpeg']).size == (320, 240)
+    # Widths beyond the storage cap stop at MAX_IMAGE_SIZE
+    assert open_jpeg(variants['2400.jpeg']).size == (1440, 1080)
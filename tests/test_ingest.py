@@ -0,0 +1,83 @@
+import io
+import threading
+import pytest
+from PIL import Image
+from app.services.ingest import (
+    IngestBusy, MemoryBudget, UploadPolicy, UploadRejected, decode_bytes, image_formats
+)
+
+
+def encoded(size, image_format='JPEG'):
+    buffered = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buffered, format=image_format)
+    buffered.seek(0)
+    return buffered
+
+
+def test_image_formats_maps_extensions_to_pil_formats():
+    assert image_formats({'jpg', 'JPEG', 'png', 'nope'}) == {'JPEG', 'PNG'}
+
+
+def test_policy_checks_header_without_decoding():
+    policy = UploadPolicy({'jpg', 'jpeg'}, max_bytes=10_000_000, max_pixels=1000 * 1000)
+    image = policy.open(encoded((800, 600)), 'beach.jpg')
+
+    assert image.size == (800, 600)
+    # Nothing has been decoded yet
+    assert image.im is None
+
+
+def test_policy_rejects_disallowed_and_oversize_uploads():
+    policy = UploadPolicy({'jpg'}, max_bytes=50_000, max_pixels=1000 * 1000)
+
+    with pytest.raises(UploadRejected) as rejected:
+        policy.open(encoded((10, 10)), 'notes.gif')
+    assert rejected.value.status == 415
+    with pytest.raises(UploadRejected) as rejected:
+        policy.open(encoded((10, 10), 'PNG'), 'photo')
+    assert rejected.value.status == 415
+    with pytest.raises(UploadRejected) as rejected:
+        policy.open(encoded((2000, 1000)), 'big.jpg')
+    assert rejected.value.status == 413
+    with pytest.raises(UploadRejected) as rejected:
+        policy.open(io.BytesIO(b'x' * 60_000), 'fake.jpg')
+    assert rejected.value.status == 413
+    with pytest.raises(UploadRejected) as rejected:
+        policy.open(io.BytesIO(b'not an image'), 'fake.jpg')
+    assert rejected.value.status == 400
+
+
+def test_decode_bytes_follows_draft_size():
+    image = Image.open(encoded((1600, 1200)))
+    full = decode_bytes(image)
+    image.draft('L', (64, 64))
+
+    assert full == 1600 * 1200 * 4
+    assert decode_bytes(image) == 200 * 150 * 2
+
+
+def test_memory_budget_queues_then_gives_up():
+    budget = MemoryBudget(limit=100, timeout=0.05)
+    entered = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with budget.reserve(80):
+            entered.set()
+            release.wait(1)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    entered.wait(1)
+    with pytest.raises(IngestBusy):
+        with budget.reserve(30):
+            pass
+    release.set()
+    holder.join()
+
+    with budget.reserve(30):
+        assert budget.in_use == 30
+    assert budget.stats() == {'limit': 100, 'in_use': 0, 'peak': 80}
+    with pytest.raises(UploadRejected):
+        with budget.reserve(101):
+            pass
@@ -0,0 +1,157 @@
+import threading
+import time
+import pytest
+from app.models.store import MemoryPhotoStore
+from app.services.jobs import (
+    CAPTIONING, DEFERRED, DONE, FAILED, Deferred, JobQueue, LeaseLost, QueueFull
+)
+
+
+def run_to_completion(queue, job):
+    queue.shutdown(wait=True)
+    return queue.get(job['id'])
+
+
+def test_job_records_stage_timings():
+    def handler(job, set_state):
+        set_state('captioning')
+        set_state('voicing')
+        return {'photo_id': 'p1', 'cached': False}
+
+    queue = JobQueue(MemoryPhotoStore(), handler, max_workers=1)
+    job = run_to_completion(queue, queue.submit({'photo_id': 'p1'}))
+
+    assert job['state'] == DONE
+    assert job['result'] == {'photo_id': 'p1', 'cached': False}
+    assert set(job['stages']) == {'queued', 'captioning', 'voicing'}
+    assert all('seconds' in stage for stage in job['stages'].values())
+
+
+def test_failed_job_keeps_error():
+    def handler(job, set_state):
+        raise RuntimeError('upstream down')
+
+    queue = JobQueue(MemoryPhotoStore(), handler, max_workers=1)
+    job = run_to_completion(queue, queue.submit({}))
+
+    assert job['state'] == FAILED
+    assert job['error'] == 'upstream down'
+
+
+def test_submit_applies_backpressure():
+    release = threading.Event()
+    queue = JobQueue(MemoryPhotoStore(), lambda job, set_state: release.wait(5),
+                     max_workers=1, max_pending=1)
+    queue.submit({})
+    with pytest.raises(QueueFull):
+        queue.submit({})
+    release.set()
+    queue.shutdown()
+
+
+def test_resume_picks_up_stalled_jobs_from_the_store():
+    store = MemoryPhotoStore()
+    store.save_job('stalled', {'id': 'stalled', 'state': 'captioning', 'payload': {},
+                               'created_at': 0, 'updated_at': 0,
+                               'stages': {'captioning': {'started_at': 0}}, 'error': None})
+    seen = []
+    queue = JobQueue(store, lambda job, set_state: seen.append(job['id']), max_workers=1)
+
+    assert queue.resume() == 1
+    queue.shutdown()
+    assert seen == ['stalled']
+    assert store.get_job('stalled')['state'] == DONE
+
+
+def test_deferred_job_is_resumed_after_retry_after():
+    store = MemoryPhotoStore()
+    runs = []
+
+    def handler(job, set_state):
+        runs.append(job['id'])
+        if len(runs) == 1:
+            raise Deferred('tts down', retry_after=0)
+
+    queue = JobQueue(store, handler, max_workers=1, lease_seconds=60)
+    job = queue.submit({'photo_id': 'p1'})
+    deadline = time.time() + 5
+    while queue.pending and time.time() < deadline:
+        time.sleep(0.01)
+
+    deferred = store.get_job(job['id'])
+    assert deferred['state'] == DEFERRED and deferred['error'] == 'tts down'
+    assert queue.pending == 0
+
+    assert queue.resume() == 1
+    assert run_to_completion(queue, job)['state'] == DONE
+    assert runs == [job['id'], job['id']]
+
+
+def test_defer_schedules_without_taking_a_slot():
+    store = MemoryPhotoStore()
+    queue = JobQueue(store, lambda job, set_state: None, max_workers=1, max_pending=1,
+                     lease_seconds=60)
+    job = queue.defer({'photo_id': 'p1'}, retry_after=30)
+
+    assert queue.pending == 0
+    assert queue.resume() == 0  # not due for another 30 seconds
+    assert store.get_job(job['id'])['state'] == DEFERRED
+    queue.shutdown()
+
+
+def test_heartbeat_keeps_long_stages_from_being_reclaimed():
+    store = MemoryPhotoStore()
+    queue = JobQueue(store, lambda job, set_state: time.sleep(0.6), max_workers=1,
+                     lease_seconds=0.2)
+    other_worker = JobQueue(store, lambda job, set_state: None, lease_seconds=0.2)
+    job = queue.submit({'photo_id': 'p1'})
+
+    reclaimed = 0
+    for _ in range(5):
+        time.sleep(0.1)
+        reclaimed += other_worker.resume()
+    assert reclaimed == 0
+    assert run_to_completion(queue, job)['state'] == DONE
+    other_worker.shutdown()
+
+
+def test_reclaimed_job_does_not_write_results():
+    store = MemoryPhotoStore()
+    started, release = threading.Event(), threading.Event()
+    written = []
+
+    def handler(job, set_state):
+        started.set()
+        release.wait(5)
+        set_state('voicing')
+        written.append(job['id'])
+
+    queue = JobQueue(store, handler, max_workers=1)
+    job = queue.submit({'photo_id': 'p1'})
+    started.wait(5)
+    # Another worker takes the job over, as if this one had stalled
+    store.claim_stale_jobs(time.time() + 1, time.time(), owner='other-worker')
+    release.set()
+
+    record = run_to_completion(queue, job)
+    assert written == []
+    assert record['state'] == 'queued' and record['owner'] == 'other-worker'
+
+
+def test_attached_job_is_run_again_if_its_process_dies():
+    store = MemoryPhotoStore()
+    crashed = JobQueue(store, lambda job, set_state: None, lease_seconds=60)
+    job = crashed.attach({'photo_id': 'p1'})
+    assert store.get_job(job['id'])['state'] == CAPTIONING
+
+    # The batch stopped mid-photo; another process's reaper picks the job up
+    store.save_job(job['id'], {**job, 'updated_at': 0}, owner=job['owner'])
+    seen = []
+    survivor = JobQueue(store, lambda job, set_state: seen.append(job['payload']), max_workers=1)
+    assert survivor.resume() == 1
+    survivor.shutdown()
+
+    assert seen == [{'photo_id': 'p1'}]
+    assert store.get_job(job['id'])['state'] == DONE
+    with pytest.raises(LeaseLost):
+        crashed.finish(job)
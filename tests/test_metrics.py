@@ -0,0 +1,49 @@
+import pytest
+
+from app.services.metrics import (
+    Counter, Histogram, Metrics, server_timing, start_request_timings
+)
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram('demo_seconds', 'Demo', ['stage'], buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, stage='x')
+
+    assert histogram.render() == [
+        '# HELP demo_seconds Demo',
+        '# TYPE demo_seconds histogram',
+        'demo_seconds_bucket{stage="x",le="0.1"} 2',
+        'demo_seconds_bucket{stage="x",le="1"} 3',
+        'demo_seconds_bucket{stage="x",le="+Inf"} 4',
+        'demo_seconds_sum{stage="x"} 3.65',
+        'demo_seconds_count{stage="x"} 4',
+    ]
+
+
+def test_labels_are_checked_and_escaped():
+    counter = Counter('demo_total', 'Demo', ['reason'])
+    counter.inc(reason='say "hi"\n')
+    assert counter.render()[-1] == 'demo_total{reason="say \\"hi\\"\\n"} 1'
+    with pytest.raises(ValueError):
+        counter.inc(other='x')
+
+
+def test_time_tracks_in_flight_errors_and_server_timing():
+    metrics = Metrics()
+    start_request_timings()
+    with metrics.time('caption', size=2048):
+        assert metrics.stage_in_flight.value(stage='caption') == 1
+    with pytest.raises(RuntimeError):
+        with metrics.time('caption'):
+            raise RuntimeError('boom')
+
+    assert metrics.stage_in_flight.value(stage='caption') == 0
+    assert metrics.stage_seconds.count(stage='caption') == 2
+    assert metrics.stage_errors.value(stage='caption') == 1
+    assert metrics.payload_bytes.count(stage='caption') == 1
+
+    header = server_timing(total=0.5)
+    assert header.startswith('caption;dur=') and ';desc="x2"' in header
+    assert header.endswith('total;dur=500.0')
+    assert server_timing() == ''  # collection stops once the header is built
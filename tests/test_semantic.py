@@ -0,0 +1,87 @@
+import numpy as np
+from app.services import semantic
+from app.services.semantic import SemanticIndex
+
+CAPTIONS = {
+    'beach': "I remember this afternoon by the sea with Grandma, building sandcastles.",
+    'party': "Uncle Raj cutting the birthday cake while everyone sang.",
+    'hike': "Dad and I on the mountain trail, tired but smiling.",
+    'garden': "Our dog Biscuit asleep in the garden under the apple tree.",
+}
+
+
+def build(path=None):
+    index = SemanticIndex(path)
+    for photo_id, caption in CAPTIONS.items():
+        index.add(photo_id, caption)
+    return index
+
+
+def test_paraphrased_query_finds_the_right_caption():
+    index = build()
+    total, hits = index.search('the day at the seaside with my grandmother', 2)
+
+    assert hits[0][0] == 'beach'
+    assert total >= 1
+    assert index.search('birthday party', 1)[1][0][0] == 'party'
+
+
+def test_pages_follow_the_cursor_without_repeats():
+    index = build()
+    _, first = index.search('grandma dog dad cake', 2, min_score=-1.0)
+    _, rest = index.search('grandma dog dad cake', 10, after=first[-1][2], min_score=-1.0)
+
+    assert len(first) == 2 and len(rest) == 2
+    assert not {h[0] for h in first} & {h[0] for h in rest}
+    assert [h[1] for h in first + rest] == sorted((h[1] for h in first + rest), reverse=True)
+
+
+def test_reindexing_replaces_the_vector():
+    index = build()
+    index.add('garden', "Grandma at the seaside again, with ice cream.")
+
+    assert len(index) == 4
+    assert index.search('dog asleep under the apple tree', 1)[1][0][0] != 'garden'
+
+
+def test_index_is_memory_mapped_and_survives_reopening(tmp_path, monkeypatch):
+    monkeypatch.setattr(semantic, 'INITIAL_CAPACITY', 2)
+    index = build(tmp_path)
+    assert isinstance(index._matrix, np.memmap)
+    query_scores = index.scores('seaside with grandmother')
+    index.close()
+
+    reopened = SemanticIndex(tmp_path)
+    assert len(reopened) == 4
+    np.testing.assert_allclose(reopened.scores('seaside with grandmother'), query_scores)
+    reopened.add('new', 'A new photo of the lake.')
+    assert len(reopened) == 5
+    reopened.close()
+
+
+def test_instances_sharing_a_path_append_without_overwriting(tmp_path):
+    first, second = SemanticIndex(tmp_path), SemanticIndex(tmp_path)
+    first.add('beach', CAPTIONS['beach'])
+    second.add('party', CAPTIONS['party'])
+    first.add('hike', CAPTIONS['hike'])
+
+    assert len(first) == len(second) == 3
+    assert first.search('birthday cake', 1)[1][0][0] == 'party'
+    assert second.search('the day at the seaside with my grandmother', 1)[1][0][0] == 'beach'
+    first.close()
+    second.close()
+
+    reopened = SemanticIndex(tmp_path)
+    assert (tmp_path / 'ids.txt').read_text().splitlines() == ['beach', 'party', 'hike']
+    assert reopened.search('mountain trail', 1)[1][0][0] == 'hike'
+    reopened.close()
+
+
+def test_rebuild_replaces_the_index_everywhere(tmp_path):
+    index, other = build(tmp_path), SemanticIndex(tmp_path)
+
+    assert index.rebuild([('hike', CAPTIONS['hike']), ('garden', CAPTIONS['garden'])]) == 2
+    assert len(other.scores('dog')) == 2
+    assert other.search('dog asleep under the apple tree', 1)[1][0][0] == 'garden'
+    index.close()
+    other.close()
@@ -0,0 +1,40 @@
+import pytest
+from app.api.serializers import (
+    SUMMARY_FIELDS, decode_cursor, decode_version, encode_cursor, encode_version, parse_fields,
+    parse_limit, project
+)
+
+
+def test_project_defaults_to_summary_shape():
+    photo = {'title': 'Beach', 'caption': 'word ' * 100, 'timestamp': 't',
+             'image_path': '/photos/1/image', 'audio_path': None, 'image_blob': 'abc'}
+    item = project('1', photo)
+
+    assert tuple(item) == SUMMARY_FIELDS
+    assert item['caption_snippet'].endswith('…')
+    assert len(item['caption_snippet']) <= 161
+
+
+def test_parse_fields_and_limit_validate_input():
+    assert parse_fields('id,caption') == ('id', 'caption')
+    with pytest.raises(ValueError):
+        parse_fields('id,image_blob')
+    assert parse_limit(None, 24, 100) == 24
+    assert parse_limit('500', 24, 100) == 100
+    with pytest.raises(ValueError):
+        parse_limit('0', 24, 100)
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    cursor = encode_cursor('20240101_000000', {'timestamp': '2024-01-01T00:00:00'})
+    assert decode_cursor(cursor) == ('2024-01-01T00:00:00', '20240101_000000')
+    assert decode_cursor(None) is None
+    with pytest.raises(ValueError):
+        decode_cursor('!!!')
+
+
+def test_version_cursor_round_trips_and_rejects_other_cursors():
+    assert decode_version(encode_version(42)) == 42
+    assert decode_version(None) == 0
+    with pytest.raises(ValueError):
+        decode_version(encode_cursor('1', {'timestamp': 't'}))
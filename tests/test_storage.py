@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from app.services.storage import LocalStorage, S3Storage, content_key, create_storage
+
+
+def test_content_key_depends_only_on_bytes():
+    assert content_key(b'a') == content_key(b'a')
+    assert content_key(b'a') != content_key(b'b')
+    assert content_key(b'a', 'audio', '.mp3').startswith('audio/')
+
+
+def test_local_storage_concurrent_uploads_do_not_collide(tmp_path):
+    storage = LocalStorage(tmp_path)
+    images = [f'image {i}'.encode() for i in range(20)]
+    urls = [None] * len(images)
+
+    def upload(i):
+        urls[i] = storage.put_content(images[i])
+
+    threads = [threading.Thread(target=upload, args=(i,)) for i in range(len(images))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(urls)) == len(images)
+    for data in images:
+        assert storage.path(content_key(data)).read_bytes() == data
+
+
+def test_local_storage_urls_and_key_validation(tmp_path):
+    storage = LocalStorage(tmp_path, base_url='http://localhost:8000/storage/')
+    assert storage.put('photos/x.jpg', b'x') == 'http://localhost:8000/storage/photos/x.jpg'
+    assert LocalStorage(tmp_path).url('photos/x.jpg').startswith('file://')
+    with pytest.raises(ValueError):
+        storage.put('../escape.jpg', b'x')
+
+
+def test_s3_storage_uploads_public_objects_with_transfer_config():
+    calls = []
+
+    class FakeClient:
+        def upload_fileobj(self, fileobj, bucket, key, ExtraArgs, Config):
+            calls.append((fileobj.read(), bucket, key, ExtraArgs, Config))
+
+    storage = S3Storage(FakeClient, 'album')
+    storage._transfer_config = 'transfer-config'
+    url = storage.put_content(b'jpeg')
+
+    assert url == f"https://album.s3.amazonaws.com/{content_key(b'jpeg')}"
+    assert calls == [(b'jpeg', 'album', content_key(b'jpeg'),
+                      {'ACL': 'public-read', 'ContentType': 'image/jpeg'}, 'transfer-config')]
+
+
+def test_create_storage_picks_backend(tmp_path):
+    local = create_storage({'STORAGE_BACKEND': 'local', 'STORAGE_LOCAL_PATH': tmp_path})
+    assert isinstance(local, LocalStorage)
+    assert isinstance(create_storage({'S3_BUCKET': 'album'}, object), S3Storage)
+    with pytest.raises(ValueError):
+        create_storage({'STORAGE_BACKEND': 'ftp'})
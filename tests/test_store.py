@@ -0,0 +1,230 @@
+import sqlite3
+import threading
+import pytest
+from app.models.store import MemoryPhotoStore, SQLitePhotoStore, create_store
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryPhotoStore()
+    return SQLitePhotoStore(tmp_path / 'album.db')
+
+
+def make_record(title, caption, timestamp):
+    return {'title': title, 'caption': caption, 'timestamp': timestamp}
+
+
+def test_add_get_and_list_ordered(store):
+    store.add_photo('b', make_record('Beach', 'Grandma by the sea', '2024-01-02T00:00:00'))
+    store.add_photo('a', make_record('Park', 'A sunny afternoon', '2024-01-01T00:00:00'))
+
+    assert store.get_photo('b')['title'] == 'Beach'
+    assert store.get_photo('missing') is None
+    assert list(store.list_photos()) == ['a', 'b']
+    assert store.count() == 2
+
+
+def test_batched_writes_and_search(store):
+    store.add_photos([
+        ('1', make_record('Beach', 'Grandma by the sea', '2024-01-01T00:00:00')),
+        ('2', make_record('Party', 'Birthday cake', '2024-01-02T00:00:00')),
+    ])
+
+    assert list(store.search_photos('GRANDMA')) == ['1']
+    assert list(store.search_photos('party')) == ['2']
+    assert store.search_photos('nothing') == {}
+
+
+def test_sqlite_store_is_shared_between_connections(tmp_path):
+    path = tmp_path / 'album.db'
+    writer = SQLitePhotoStore(path)
+    reader = SQLitePhotoStore(path)
+    writer.add_photo('1', make_record('Beach', 'Sea', '2024-01-01T00:00:00'))
+
+    assert reader.get_photo('1')['caption'] == 'Sea'
+
+
+def test_create_store_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        create_store({'PHOTO_DB_BACKEND': 'nope'})
+
+
+def test_page_photos_walks_the_album_with_keyset_cursor(store):
+    store.add_photos([
+        (str(i), make_record(f'Photo {i}', 'beach' if i % 2 else 'park', f'2024-01-0{i}T00:00:00'))
+        for i in range(1, 6)
+    ])
+
+    first = store.page_photos(2)
+    assert [photo_id for photo_id, _ in first] == ['1', '2']
+    last_id, last = first[-1]
+    second = store.page_photos(2, after=(last['timestamp'], last_id))
+    assert [photo_id for photo_id, _ in second] == ['3', '4']
+
+    assert store.count('beach') == 3
+
+
+def test_version_moves_on_every_photo_write(store):
+    start = store.version()
+    store.add_photo('1', make_record('Beach', 'Sea', '2024-01-01T00:00:00'))
+    store.add_photos([('2', make_record('Park', None, '2024-01-02T00:00:00'))])
+    store.get_photo('1')
+
+    assert store.version() == start + 2
+
+
+def test_search_is_ranked_stemmed_and_prefix_matched(store):
+    store.add_photos([
+        ('1', make_record('Park', 'A quiet afternoon on the bench', '2024-01-01T00:00:00')),
+        ('2', make_record('Beach day', 'Grandma laughing at the beaches', '2024-01-02T00:00:00')),
+        ('3', make_record('Party', 'Grandma cutting the birthday cake', '2024-01-03T00:00:00')),
+        ('4', make_record('Wedding', 'Dad running to the dance floor', '2024-01-04T00:00:00')),
+    ])
+
+    # A spoken query: filler words are dropped and photos with every word win
+    hits = store.search_page('show me pictures of grandma at the beach', 10)
+    assert [photo_id for photo_id, _, _ in hits] == ['2']
+    # No photo has both words, so either one matches, best first
+    hits = store.search_page('grandma cake by the bench', 10)
+    assert [photo_id for photo_id, _, _ in hits][0] == '3'
+    assert {photo_id for photo_id, _, _ in hits} == {'1', '2', '3'}
+    assert list(store.search_photos('laughed')) == ['2']
+    assert list(store.search_photos('birth')) == ['3']
+    # Partial words match while typing, even past the end of their stem
+    for partial in ('wedd', 'weddi', 'runn', 'runnin', 'danc', 'wedding'):
+        assert list(store.search_photos(partial)) == ['4'], partial
+    assert store.count('runn') == 1
+    assert store.count('grandma') == 2
+    assert store.search_page('show me the photos', 10) == []
+
+
+def test_fallback_leaves_out_words_most_photos_have(store):
+    store.add_photos([
+        (str(i), make_record(f'Day {i}', 'a sunny day outside', f'2024-01-0{i}T00:00:00'))
+        for i in range(1, 5)
+    ])
+    store.add_photo('5', make_record('Bench', 'an old bench in the day', '2024-01-05T00:00:00'))
+
+    # No photo has "day", "bench" and "lake"; "day" is in all of them, so it is ignored
+    assert list(store.search_photos('day bench lake')) == ['5']
+    assert store.count('day bench lake') == 1
+    assert store.count('day lake') == 5
+
+
+def test_search_page_cursor_and_reindexing(store):
+    store.add_photos([
+        (str(i), make_record(f'Photo {i}', 'sunset ' * i, f'2024-01-0{i}T00:00:00'))
+        for i in range(1, 6)
+    ])
+
+    first = store.search_page('sunset', 2)
+    rest = store.search_page('sunset', 10, after=first[-1][2])
+    assert len(first) == 2 and len(rest) == 3
+    assert not {h[0] for h in first} & {h[0] for h in rest}
+
+    # Replacing a caption updates the index
+    store.add_photo('1', make_record('Photo 1', 'mountain lake', '2024-01-01T00:00:00'))
+    assert store.count('sunset') == 4
+    assert list(store.search_photos('mountain')) == ['1']
+
+
+def test_sqlite_search_index_is_built_for_existing_albums(tmp_path):
+    path = tmp_path / 'album.db'
+    SQLitePhotoStore(path).add_photo('1', make_record('Beaches', 'Sea', '2024-01-01T00:00:00'))
+    with sqlite3.connect(path) as conn:
+        conn.execute('DELETE FROM photos_fts')
+        conn.execute('DROP TABLE photos_words_vocab')
+        conn.execute('DROP TABLE photos_words')
+
+    assert list(SQLitePhotoStore(path).search_photos('beach')) == ['1']
+    assert list(SQLitePhotoStore(path).search_photos('beache')) == ['1']
+
+
+def test_changes_since_returns_each_photo_at_its_latest_write(store):
+    store.add_photos([
+        ('1', make_record('Beach', 'Sea', '2024-01-01T00:00:00')),
+        ('2', make_record('Park', None, '2024-01-02T00:00:00')),
+    ])
+    seen = store.version()
+    store.add_photo('3', make_record('Party', 'Cake', '2024-01-03T00:00:00'))
+    store.add_photo('1', make_record('Beach', 'Waves', '2024-01-01T00:00:00'))
+
+    assert [(i, v) for i, _, v in store.changes_since(0, 10)] == [('2', 2), ('3', 3), ('1', 4)]
+    changes = store.changes_since(seen, 10)
+    assert [photo_id for photo_id, _, _ in changes] == ['3', '1']
+    assert changes[-1][1]['caption'] == 'Waves' and changes[-1][2] == store.version()
+    assert store.changes_since(seen, 1)[0][0] == '3'
+    assert store.changes_since(store.version(), 10) == []
+
+
+def test_sqlite_versions_are_added_to_existing_albums(tmp_path):
+    path = tmp_path / 'album.db'
+    SQLitePhotoStore(path).add_photo('1', make_record('Beach', 'Sea', '2024-01-01T00:00:00'))
+    with sqlite3.connect(path) as conn:
+        conn.execute('DROP INDEX idx_photos_version')
+        conn.execute('ALTER TABLE photos DROP COLUMN version')
+
+    store = SQLitePhotoStore(path)
+    assert [photo_id for photo_id, _, _ in store.changes_since(0, 10)] == ['1']
+    store.add_photo('2', make_record('Park', None, '2024-01-02T00:00:00'))
+    assert [photo_id for photo_id, _, _ in store.changes_since(1, 10)] == ['2']
+
+
+def test_job_writes_are_fenced_by_owner(store):
+    store.save_job('j1', {'id': 'j1', 'state': 'captioning', 'updated_at': 0, 'owner': 'first'})
+
+    assert store.renew_job('j1', 'first', 1)
+    claimed = store.claim_stale_jobs(cutoff=10, now=20, owner='second')
+    assert [job['owner'] for job in claimed] == ['second']
+
+    # The first run has lost the job: it can neither renew nor overwrite it
+    assert not store.renew_job('j1', 'first', 21)
+    assert not store.save_job('j1', {'id': 'j1', 'state': 'done', 'updated_at': 21,
+                                     'owner': 'first'}, owner='first')
+    assert store.get_job('j1')['state'] == 'captioning'
+    assert store.renew_job('j1', 'second', 22)
+    assert store.get_job('j1')['updated_at'] == 22
+
+
+def test_cache_scan_returns_entries_under_a_prefix(store):
+    store.cache_put('result', 'group1:a', 'A', max_entries=10)
+    store.cache_put('result', 'group1:b', 'B', max_entries=10)
+    store.cache_put('result', 'group2:c', 'C', max_entries=10)
+    store.cache_put('tts', 'group1:d', 'D', max_entries=10)
+
+    assert sorted(store.cache_scan('result', 'group1:')) == [('group1:a', 'A'), ('group1:b', 'B')]
+
+
+def test_update_photo_merges_fields_and_variants(store):
+    store.add_photo('a', make_record('Beach', None, '2024-01-01T00:00:00'))
+    store.update_photo('a', {'status': 'processing'}, {'w320.webp': 'd1'})
+    updated = store.update_photo('a', {'caption': 'Grandma by the sea'}, {'w960.webp': 'd2'})
+
+    assert updated['variants'] == {'w320.webp': 'd1', 'w960.webp': 'd2'}
+    assert store.get_photo('a')['status'] == 'processing'
+    assert store.search_page('grandma', 10)[0][0] == 'a'
+    assert store.update_photo('missing', {'status': 'ready'}) is None
+
+
+def test_sqlite_updates_from_two_processes_are_not_lost(tmp_path):
+    first = SQLitePhotoStore(tmp_path / 'album.db')
+    second = SQLitePhotoStore(tmp_path / 'album.db')
+    first.add_photo('a', make_record('Beach', None, '2024-01-01T00:00:00'))
+
+    def render(width):
+        first.update_photo('a', {}, {f'w{width}.webp': str(width)})
+
+    def finish(step):
+        second.update_photo('a', {f'step{step}': True})
+
+    threads = [threading.Thread(target=render, args=(w,)) for w in range(20)]
+    threads += [threading.Thread(target=finish, args=(s,)) for s in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    photo = second.get_photo('a')
+    assert len(photo['variants']) == 20
+    assert all(photo[f'step{s}'] for s in range(20))
@@ -0,0 +1,47 @@
+import base64
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.services.streaming import SentenceSplitter, narrate, sse
+
+
+def test_sentence_splitter_handles_sentences_split_across_tokens():
+    splitter = SentenceSplitter()
+    assert splitter.feed('I remember the be') == []
+    assert splitter.feed('ach. Grandma laughed! We') == ['I remember the beach.', 'Grandma laughed!']
+    assert splitter.flush() == ['We']
+
+
+def test_narrate_voices_first_sentence_before_caption_finishes():
+    voiced = threading.Event()
+
+    def synthesize(text):
+        voiced.set()
+        return text.upper().encode()
+
+    def tokens():
+        yield 'First sentence. '
+        voiced.wait(1)
+        time.sleep(0.01)
+        yield 'Second one.'
+        time.sleep(0.1)
+
+    events = list(narrate(tokens(), synthesize, ThreadPoolExecutor(2)))
+    names = [(name, data.get('index')) for name, data in events]
+    done = events[-1][1]
+
+    assert names.index(('audio', 0)) < names.index(('sentence', 1))
+    assert [base64.b64decode(d['audio']) for n, d in events if n == 'audio'] == [
+        b'FIRST SENTENCE.', b'SECOND ONE.'
+    ]
+    assert done['caption'] == 'First sentence. Second one.'
+    # The caption is complete before the last sentence is voiced
+    assert names.index(('captioned', None)) < names.index(('audio', 1))
+    assert ('captioned', {'caption': done['caption']}) in events
+    assert done['audio'] == b'FIRST SENTENCE.SECOND ONE.'
+    assert done['timings']['first_audio'] < done['timings']['total']
+
+
+def test_sse_format():
+    assert sse('done', {'a': 1}) == 'event: done\ndata: {"a": 1}\n\n'
+    assert sse('photos', {}, event_id='c1') == 'id: c1\nevent: photos\ndata: {}\n\n'
@@ -0,0 +1,59 @@
+import threading
+import time
+from app.models.blobs import BlobStore
+from app.models.store import MemoryPhotoStore
+from app.services.tts import SpeechSynthesizer, chunk_sentences, normalize_text
+
+
+class FakeBackend:
+    params = {'voice_name': 'fake', 'language_code': 'en-US', 'speaking_rate': 0.9,
+              'pitch': 0.0, 'encoding': 'MP3'}
+
+    def __init__(self, delay=0.0):
+        self.calls = []
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def synthesize(self, text):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls.append(text)
+        return f"<{text}>".encode()
+
+
+def test_chunk_sentences_keeps_sentences_whole():
+    text = 'One two. Three four five! Six? Seven.'
+    assert chunk_sentences(text, 15) == ['One two.', 'Three four five!', 'Six? Seven.']
+    assert chunk_sentences('short', 400) == ['short']
+
+
+def test_long_text_is_synthesized_in_ordered_parallel_chunks():
+    backend = FakeBackend(delay=0.05)
+    synthesizer = SpeechSynthesizer(backend, chunk_chars=20, max_workers=4)
+    text = ' '.join(f'Sentence number {i}.' for i in range(4))
+
+    started = time.perf_counter()
+    audio = synthesizer.synthesize(text)
+
+    assert time.perf_counter() - started < 0.15
+    assert audio == b''.join(f"<Sentence number {i}.>".encode() for i in range(4))
+
+
+def test_cache_hits_skip_the_backend_and_survive_a_new_synthesizer(tmp_path):
+    store, blobs = MemoryPhotoStore(), BlobStore(tmp_path)
+    backend = FakeBackend()
+    first = SpeechSynthesizer(backend, store=store, blobs=blobs)
+    audio = first.synthesize('A day  at the\nbeach.')
+
+    second = SpeechSynthesizer(backend, store=store, blobs=blobs)
+    assert second.synthesize(normalize_text('A day at the beach.')) == audio
+    assert len(backend.calls) == 1
+    assert second.stats() == {'hits': 1, 'misses': 0}
+
+
+def test_cache_key_includes_voice_settings():
+    backend = FakeBackend()
+    synthesizer = SpeechSynthesizer(backend)
+    key = synthesizer.cache_key('Hello.')
+    backend.params = {**backend.params, 'speaking_rate': 1.2}
+    assert synthesizer.cache_key('Hello.') != key
@@ -0,0 +1,115 @@
+import pytest
+
+from app.services.upstream import (
+    CircuitBreaker, CircuitOpen, TokenBucket, Upstream, UpstreamUnavailable, is_retryable
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def flaky(failures, error=lambda: HTTPError(429)):
+    calls = []
+
+    def fn(value):
+        calls.append(value)
+        if len(calls) <= failures:
+            raise error()
+        return value
+    return fn, calls
+
+
+def test_is_retryable_classifies_status_codes():
+    assert is_retryable(HTTPError(429)) and is_retryable(HTTPError(503))
+    assert is_retryable(ConnectionResetError())
+    assert not is_retryable(HTTPError(400)) and not is_retryable(ValueError())
+
+
+def test_token_bucket_spreads_calls_over_the_minute():
+    clock = FakeClock()
+    bucket = TokenBucket(60, capacity=2, clock=clock, sleep=clock.sleep)
+    assert bucket.acquire() == 0 and bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(1.0)
+    assert bucket.acquire(5) == pytest.approx(2.0)  # capped at capacity
+
+
+def test_retries_with_backoff_then_succeeds():
+    clock = FakeClock()
+    upstream = Upstream('test', max_attempts=3, clock=clock, sleep=clock.sleep)
+    fn, calls = flaky(2)
+
+    assert upstream.call(fn, 'ok') == 'ok'
+    assert len(calls) == 3 and len(clock.slept) == 2
+    assert all(0 <= wait <= upstream.backoff_max for wait in clock.slept)
+    assert upstream.breaker.state == 'closed' and upstream.breaker.failures == 0
+
+
+def test_bad_requests_are_not_retried():
+    upstream = Upstream('test', sleep=lambda s: None)
+    fn, calls = flaky(1, error=lambda: HTTPError(400))
+    with pytest.raises(HTTPError):
+        upstream.call(fn, 'x')
+    assert len(calls) == 1
+
+
+def test_breaker_opens_then_lets_a_trial_through():
+    clock = FakeClock()
+    upstream = Upstream('test', max_attempts=2, failure_threshold=2, reset_timeout=10,
+                        clock=clock, sleep=clock.sleep)
+    fn, calls = flaky(2, error=lambda: HTTPError(503))
+
+    with pytest.raises(UpstreamUnavailable) as raised:
+        upstream.call(fn, 'x')
+    assert upstream.breaker.state == 'open'
+    assert 0 < raised.value.retry_after <= 10
+
+    with pytest.raises(CircuitOpen):
+        upstream.call(fn, 'x')
+    assert len(calls) == 2
+
+    clock.now += 10
+    assert upstream.call(fn, 'x') == 'x'
+    assert upstream.breaker.state == 'closed'
+
+
+def test_breaker_reopens_when_the_trial_fails():
+    clock = FakeClock()
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=5, clock=clock)
+    breaker.record_failure()
+    clock.now += 5
+    breaker.allow()
+    with pytest.raises(CircuitOpen):
+        breaker.allow()  # only one trial at a time
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+
+def test_stream_retries_until_the_first_item():
+    upstream = Upstream('test', sleep=lambda s: None)
+    attempts = []
+
+    def stream():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise HTTPError(502)
+        yield 'a'
+        yield 'b'
+
+    assert list(upstream.stream(stream)) == ['a', 'b']
+    assert len(attempts) == 2